@@ -1,7 +1,15 @@
+import os
+import sys
 from ortools.sat.python import cp_model
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import packing_engine
+import param_tuning
+import stop_policy
 
-def solve(widths, heights, panel_width, panel_height, selected_blocks=None):
+
+def solve(widths, heights, panel_width, panel_height, selected_blocks=None,
+          formulation=packing_engine.NO_OVERLAP_2D, stop=None):
     # Number of blocks
     n = len(widths)
 
@@ -9,54 +17,13 @@ def solve(widths, heights, panel_width, panel_height, selected_blocks=None):
     model = cp_model.CpModel()
 
     # Variables
-    x = [
-        model.NewIntVar(
-            0,
-            panel_width - w,
-            f'x{i}') for i,
-        w in enumerate(widths)]
-    y = [
-        model.NewIntVar(
-            0,
-            panel_height - h,
-            f'y{i}') for i,
-        h in enumerate(heights)]
-    x_e = [model.NewIntVar(-panel_width, panel_width,
-                           f'x_end{i}') for i in range(n)]
-    y_e = [model.NewIntVar(-panel_height, panel_height,
-                           f'y_end{i}') for i in range(n)]
+    all_block = packing_engine.blocks_from_sizes(widths, heights)
     on_panel = [model.NewBoolVar(f'on_panel_{i}') for i in range(n)]
-
-    # Constraints
-    for i in range(n):
-        # x_end = x + w
-        model.Add(x_e[i] == x[i] + widths[i]).OnlyEnforceIf(on_panel[i])
-        # y_end = y + h
-        model.Add(y_e[i] == y[i] + heights[i]).OnlyEnforceIf(on_panel[i])
-        # Block is on panel if on_panel[i] is True
-        # model.AddImplication(on_panel[i], x_e[i] <= panel_width)
-        # model.AddImplication(on_panel[i], y_e[i] <= panel_height)
-        model.Add(x_e[i] <= panel_width).OnlyEnforceIf(on_panel[i])
-        model.Add(y_e[i] <= panel_height).OnlyEnforceIf(on_panel[i])
+    placement = packing_engine.place_blocks(model, all_block, panel_width, panel_height, on_panel)
+    x, y = placement.x_st, placement.y_st
 
     # Non-overlapping constraints
-    for i in range(n):
-        for j in range(i + 1, n):
-            # Boolean variables for each constraint
-            bx_ij = model.NewBoolVar(f'bx_{i}_{j}')
-            bx_ji = model.NewBoolVar(f'bx_{j}_{i}')
-            by_ij = model.NewBoolVar(f'by_{i}_{j}')
-            by_ji = model.NewBoolVar(f'by_{j}_{i}')
-
-            # Constraints
-            model.Add(x_e[i] <= x[j] + panel_width * bx_ij)
-            model.Add(x_e[j] <= x[i] + panel_width * bx_ji)
-            model.Add(y_e[i] <= y[j] + panel_height * by_ij)
-            model.Add(y_e[j] <= y[i] + panel_height * by_ji)
-
-            # Use model.AddBoolOr() for each constraint
-            model.AddBoolOr([bx_ij.Not(), bx_ji.Not(),
-                            by_ij.Not(), by_ji.Not()])
+    packing_engine.add_no_overlap(model, placement, panel_width, panel_height, formulation)
 
     # Objective function
     panel_area = panel_width * panel_height
@@ -93,10 +60,11 @@ def solve(widths, heights, panel_width, panel_height, selected_blocks=None):
 
     # Solve the model
     solver = cp_model.CpSolver()
-    status = solver.Solve(model)
+    param_tuning.apply_profile(solver, 'packing')
+    status = stop_policy.solve(solver, model, stop)
 
-    # Return the result
-    if status == cp_model.OPTIMAL:
+    # Return the result, also the best one when the stop policy ended the search
+    if status == cp_model.OPTIMAL or status == cp_model.FEASIBLE:
         positions = [(solver.Value(x[i]), solver.Value(y[i]))
                      for i in range(n)]
         on_panel = [solver.Value(on_panel[i]) for i in range(n)]
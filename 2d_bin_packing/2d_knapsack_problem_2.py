@@ -1,6 +1,14 @@
+import os
+import sys
 from ortools.sat.python import cp_model
 
-def solve(all_block, panel_width, panel_height):
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import packing_engine
+import param_tuning
+import stop_policy
+
+def solve(all_block, panel_width, panel_height, formulation=packing_engine.NO_OVERLAP_2D,
+          objective_form=packing_engine.LINEAR, stats=None, stop=None):
     # Number of blocks
     n = len(all_block)
 
@@ -8,44 +16,12 @@ def solve(all_block, panel_width, panel_height):
     model = cp_model.CpModel()
 
     # Variables
-    all_x_st, all_y_st, all_x_ed, all_y_ed, on_panel = [], [], [], [], []
-    for i, block in enumerate(all_block):
-        if block['x'] == None:
-            all_x_st.append(model.NewIntVar(0, panel_width - block['w'], f"x{i}"))
-        else:
-            all_x_st.append(model.NewIntVar(block['x'], block['x'], f"x{i}"))
-        all_x_ed.append(model.NewIntVar(-panel_width, panel_width, f"x_end{i}"))
-
-        if block['y'] == None:
-            all_y_st.append(model.NewIntVar(0, panel_height - block['h'], f"y{i}"))
-        else:
-            all_y_st.append(model.NewIntVar(block['y'], block['y'], f"y{i}"))
-        all_y_ed.append(model.NewIntVar(-panel_width, panel_width, f"y_end{i}"))
-
-        on_panel.append(model.NewBoolVar(f"on_panel_{i}"))
-
-    # width & height constraints
-    for i, block in enumerate(all_block):
-        model.Add(all_x_ed[i] == all_x_st[i] + block['w']).OnlyEnforceIf(on_panel[i])
-        model.Add(all_y_ed[i] == all_y_st[i] + block['h']).OnlyEnforceIf(on_panel[i])
-        model.Add(all_x_ed[i] <= panel_width).OnlyEnforceIf(on_panel[i])
-        model.Add(all_y_ed[i] <= panel_height).OnlyEnforceIf(on_panel[i])
+    on_panel = [model.NewBoolVar(f"on_panel_{i}") for i in range(n)]
+    placement = packing_engine.place_blocks(model, all_block, panel_width, panel_height, on_panel)
+    all_x_st, all_y_st = placement.x_st, placement.y_st
 
     # Non-overlapping constraints
-    for i in range(n):
-        for j in range(i + 1, n):
-            bx_ij = model.NewBoolVar(f'bx_{i}_{j}')
-            bx_ji = model.NewBoolVar(f'bx_{j}_{i}')
-            by_ij = model.NewBoolVar(f'by_{i}_{j}')
-            by_ji = model.NewBoolVar(f'by_{j}_{i}')
-
-            model.Add(all_x_ed[i] <= all_x_st[j] + panel_width * bx_ij)
-            model.Add(all_x_ed[j] <= all_x_st[i] + panel_width * bx_ji)
-            model.Add(all_y_ed[i] <= all_y_st[j] + panel_height * by_ij)
-            model.Add(all_y_ed[j] <= all_y_st[i] + panel_height * by_ji)
-
-            model.AddBoolOr([bx_ij.Not(), bx_ji.Not(),
-                            by_ij.Not(), by_ji.Not()])
+    packing_engine.add_no_overlap(model, placement, panel_width, panel_height, formulation)
 
     # Objective function
     panel_area = panel_width * panel_height
@@ -58,38 +34,35 @@ def solve(all_block, panel_width, panel_height):
     num_blocks_on_panel = model.NewIntVar(0, n, "num_blocks_on_panel")
     model.Add(num_blocks_on_panel == sum(on_panel[i] for i in range(n)))
 
-    scale = 1000000
-    # panel_coverage
-    panel_coverage = model.NewIntVar(0, 1 * scale, "panel_coverage")
-    model.AddDivisionEquality(panel_coverage, blocks_area * scale, panel_area)
-
-    # block utilization
-    block_utilization = model.NewIntVar(0, 1 * scale, "block_utilization")
-    model.AddDivisionEquality(
-        block_utilization,
-        num_blocks_on_panel *
-        scale,
-        n)
-
-    model.Maximize(panel_coverage * (1 / scale) - 
-                   block_utilization * (1 / scale))
-    # model.Maximize(panel_coverage * (1 / scale))
+    # coverage - utilization, as one integer objective over panel_area * n
+    objective = packing_engine.RatioObjective(model, [
+        packing_engine.ratio_term("panel_coverage", 1, blocks_area, panel_area),
+        packing_engine.ratio_term("block_utilization", -1, num_blocks_on_panel, n),
+    ], form=objective_form)
 
     # Solve the model
     solver = cp_model.CpSolver()
-    status = solver.Solve(model)
+    param_tuning.apply_profile(solver, 'packing')
+    status = stop_policy.solve(solver, model, stop)
+    if stats is not None:
+        stats['stop_reason'] = stop_policy.reason(stop, status)
 
-    # Print the result
-    if status == cp_model.OPTIMAL:
+    # Print the result, also the best one when the stop policy ended the search
+    if status == cp_model.OPTIMAL or status == cp_model.FEASIBLE:
         positions = [(solver.Value(all_x_st[i]), solver.Value(all_y_st[i]))
                      for i in range(n)]
         on_panel = [solver.Value(on_panel[i]) for i in range(n)]
         print(f"positions: {positions}\n"
               f"num_blocks_on_panel: {solver.Value(num_blocks_on_panel)}\n"
               f"on_panel: {[solver.Value(on_panel[i]) for i in range(n)]}\n"
-              f"panel_coverage: {solver.Value(panel_coverage) / scale}\n"
-              f"block_utilization: {solver.Value(block_utilization) / scale}\n"
-              f"objective: {solver.ObjectiveValue()}")
+              f"panel_coverage: {objective.ratio(solver, 'panel_coverage')}\n"
+              f"block_utilization: {objective.ratio(solver, 'block_utilization')}\n"
+              f"objective: {objective.value(solver)}")
+        if stats is not None:
+            stats['panel_coverage'] = objective.ratio(solver, 'panel_coverage')
+            stats['block_utilization'] = objective.ratio(solver, 'block_utilization')
+            stats['objective'] = objective.value(solver)
+            stats['wall_time'] = solver.WallTime()
     elif cp_model.INFEASIBLE:
         print("INFEASIBLE")
 
@@ -1,29 +1,31 @@
 import os
+import sys
 import json
+import collections
 import numpy as np
 from ortools.sat.python import cp_model
 
-def solve(all_block, wafer_width, wafer_height, time_limit=60, num_thread=1):
-    ### wafer sampling
-    # Number of blocks
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import packing_engine
+import param_tuning
+import phase_profiler
+import stop_policy
+
+wafer_model = collections.namedtuple(
+    'wafer_model',
+    'model sampled on_panel wafer_placement panel_placement num_blocks_sampled objective')
+
+def build_model(all_block, wafer_width, wafer_height, panel_width, panel_height,
+                formulation=packing_engine.NO_OVERLAP_2D, objective_form=packing_engine.LINEAR,
+                model=None):
+    # the wafer sampling model, the panel filled with sampled blocks that are not ng
+    if model is None:
+        model = cp_model.CpModel()
     n = len(all_block)
-    print(f"n: {n}")
 
-    # wafer variables
-    all_wafer_x_st, all_wafer_y_st, all_wafer_x_ed, all_wafer_y_ed, sampled, all_ng = [], [], [], [], [], []
+    # wafer variables, fixed blocks are always sampled
+    sampled, all_ng = [], []
     for i, block in enumerate(all_block):
-        if block['x'] == None:
-            all_wafer_x_st.append(model.NewIntVar(0, wafer_width - block['w'], f"wafer_x{i}"))
-        else:
-            all_wafer_x_st.append(model.NewIntVar(block['x'], block['x'], f"wafer_x{i}"))
-        all_wafer_x_ed.append(model.NewIntVar(-wafer_width, wafer_width, f"wafer_x_end{i}"))
-
-        if block['y'] == None:
-            all_wafer_y_st.append(model.NewIntVar(0, wafer_height - block['h'], f"wafer_y{i}"))
-        else:
-            all_wafer_y_st.append(model.NewIntVar(block['y'], block['y'], f"wafer_y{i}"))
-        all_wafer_y_ed.append(model.NewIntVar(-wafer_height, wafer_height, f"wafer_y_end{i}"))
-
         if block['x'] == None and block['y'] == None:
             sampled.append(model.NewBoolVar(f"sampled_{i}"))
         else:
@@ -32,66 +34,27 @@ def solve(all_block, wafer_width, wafer_height, time_limit=60, num_thread=1):
             all_ng.append(model.NewConstant(1))
         else:
             all_ng.append(model.NewConstant(0))
-
-    # wafer width & height constraints
-    for i, block in enumerate(all_block):
-        model.Add(all_wafer_x_ed[i] == all_wafer_x_st[i] + block['w']).OnlyEnforceIf(sampled[i])
-        model.Add(all_wafer_y_ed[i] == all_wafer_y_st[i] + block['h']).OnlyEnforceIf(sampled[i])
-        model.Add(all_wafer_x_ed[i] <= wafer_width).OnlyEnforceIf(sampled[i])
-        model.Add(all_wafer_y_ed[i] <= wafer_height).OnlyEnforceIf(sampled[i])
+    wafer_placement = packing_engine.place_blocks(
+        model, all_block, wafer_width, wafer_height, sampled, prefix="wafer_")
 
     # wafer non-overlapping constraints
-    for i in range(n):
-        for j in range(i + 1, n):
-            wafer_bx_ij = model.NewBoolVar(f"wafer_bx_{i}_{j}")
-            wafer_bx_ji = model.NewBoolVar(f"wafer_bx_{j}_{i}")
-            wafer_by_ij = model.NewBoolVar(f"wafer_by_{i}_{j}")
-            wafer_by_ji = model.NewBoolVar(f"wafer_by_{j}_{i}")
-
-            model.Add(all_wafer_x_ed[i] <= all_wafer_x_st[j] + wafer_width * wafer_bx_ij)
-            model.Add(all_wafer_x_ed[j] <= all_wafer_x_st[i] + wafer_width * wafer_bx_ji)
-            model.Add(all_wafer_y_ed[i] <= all_wafer_y_st[j] + wafer_height * wafer_by_ij)
-            model.Add(all_wafer_y_ed[j] <= all_wafer_y_st[i] + wafer_height * wafer_by_ji)
-
-            model.AddBoolOr([wafer_bx_ij.Not(), wafer_bx_ji.Not(),
-                            wafer_by_ij.Not(), wafer_by_ji.Not()])
-    
-    # panel variables
-    all_panel_x_st, all_panel_y_st, all_panel_x_ed, all_panel_y_ed, on_panel = [], [], [], [], []
-    for i, block in enumerate(all_block):
-        all_panel_x_st.append(model.NewIntVar(0, panel_width - block['w'], f"panel_x{i}"))
-        all_panel_x_ed.append(model.NewIntVar(-panel_width, panel_width, f"panel_x_end{i}"))
-        all_panel_y_st.append(model.NewIntVar(0, panel_height - block['h'], f"panel_y{i}"))
-        all_panel_y_ed.append(model.NewIntVar(-panel_height, panel_height, f"panel_y_end{i}"))
-        on_panel.append(model.NewBoolVar(f"on_panel_{i}"))
-    
+    packing_engine.add_no_overlap(
+        model, wafer_placement, wafer_width, wafer_height, formulation, prefix="wafer_")
+
+    # panel variables, the panel position is free for every block
+    on_panel = [model.NewBoolVar(f"on_panel_{i}") for i in range(n)]
+    free_blocks = [{'w': block['w'], 'h': block['h'], 'x': None, 'y': None} for block in all_block]
+    panel_placement = packing_engine.place_blocks(
+        model, free_blocks, panel_width, panel_height, on_panel, prefix="panel_")
+
     # exclude ng
     for i, block in enumerate(all_block):
         model.AddBoolAnd([sampled[i], all_ng[i].Not()]).OnlyEnforceIf(on_panel[i])
         model.AddBoolOr([sampled[i].Not(), all_ng[i]]).OnlyEnforceIf(on_panel[i].Not())
 
-    # panel width & height constraints
-    for i, block in enumerate(all_block):
-        model.Add(all_panel_x_ed[i] == all_panel_x_st[i] + block['w']).OnlyEnforceIf(on_panel[i])
-        model.Add(all_panel_y_ed[i] == all_panel_y_st[i] + block['h']).OnlyEnforceIf(on_panel[i])
-        model.Add(all_panel_x_ed[i] <= panel_width).OnlyEnforceIf(on_panel[i])
-        model.Add(all_panel_y_ed[i] <= panel_height).OnlyEnforceIf(on_panel[i])
-    
-    # panel Non-overlapping constraints
-    for i in range(n):
-        for j in range(i + 1, n):
-            panel_bx_ij = model.NewBoolVar(f"panel_bx_{i}_{j}")
-            panel_bx_ji = model.NewBoolVar(f"panel_bx_{j}_{i}")
-            panel_by_ij = model.NewBoolVar(f"panel_by_{i}_{j}")
-            panel_by_ji = model.NewBoolVar(f"panel_by_{j}_{i}")
-
-            model.Add(all_panel_x_ed[i] <= all_panel_x_st[j] + panel_width * panel_bx_ij)
-            model.Add(all_panel_x_ed[j] <= all_panel_x_st[i] + panel_width * panel_bx_ji)
-            model.Add(all_panel_y_ed[i] <= all_panel_y_st[j] + panel_height * panel_by_ij)
-            model.Add(all_panel_y_ed[j] <= all_panel_y_st[i] + panel_height * panel_by_ji)
-
-            model.AddBoolOr([panel_bx_ij.Not(), panel_bx_ji.Not(),
-                            panel_by_ij.Not(), panel_by_ji.Not()])
+    # panel non-overlapping constraints
+    packing_engine.add_no_overlap(
+        model, panel_placement, panel_width, panel_height, formulation, prefix="panel_")
 
     # panel must be filled by blocks
     model.Add(sum(on_panel[i] * block['w'] * block['h'] for i, block in enumerate(all_block)) == panel_width * panel_height)
@@ -107,30 +70,43 @@ def solve(all_block, wafer_width, wafer_height, time_limit=60, num_thread=1):
     num_blocks_sampled = model.NewIntVar(0, n, "num_blocks_sampled")
     model.Add(num_blocks_sampled == sum(on_panel[i] for i, block in enumerate(all_block)))
 
-    scale = 1000000
-    # wafer_coverage
-    wafer_coverage = model.NewIntVar(0, 1 * scale, "wafer_coverage")
-    model.AddDivisionEquality(wafer_coverage, blocks_area * scale, wafer_area)
+    # minimize block_utilization, wafer_coverage is reported
+    objective = packing_engine.RatioObjective(model, [
+        packing_engine.ratio_term("wafer_coverage", 0, blocks_area, wafer_area),
+        packing_engine.ratio_term("block_utilization", -1, num_blocks_sampled,
+                                  sum(not block['ng'] for i, block in enumerate(all_block))),
+    ], form=objective_form)
+    return wafer_model(model, sampled, on_panel, wafer_placement, panel_placement,
+                       num_blocks_sampled, objective)
+
 
-    # block utilization
-    block_utilization = model.NewIntVar(0, 1 * scale, "block_utilization")
-    model.AddDivisionEquality(
-        block_utilization,
-        num_blocks_sampled * scale,
-        sum(not block['ng'] for i, block in enumerate(all_block)))
+def solve(all_block, wafer_width, wafer_height, time_limit=60, num_thread=1,
+          formulation=packing_engine.NO_OVERLAP_2D, objective_form=packing_engine.LINEAR,
+          stats=None, stop=None):
+    ### wafer sampling
+    # Number of blocks
+    n = len(all_block)
+    print(f"n: {n}")
 
-    # model.Maximize(wafer_coverage * (1 / scale) - 
-    #                block_utilization * (1 / scale))
-    # model.Maximize(wafer_coverage * (1 / scale))
-    model.Maximize(-block_utilization * (1 / scale))
+    with phase_profiler.phase('build'):
+        # model, panel_width and panel_height are set by the main script
+        wafer = build_model(all_block, wafer_width, wafer_height, panel_width, panel_height,
+                            formulation, objective_form, model)
+    sampled, on_panel = wafer.sampled, wafer.on_panel
+    all_wafer_x_st, all_wafer_y_st = wafer.wafer_placement.x_st, wafer.wafer_placement.y_st
+    all_panel_x_st, all_panel_y_st = wafer.panel_placement.x_st, wafer.panel_placement.y_st
+    num_blocks_sampled, objective = wafer.num_blocks_sampled, wafer.objective
 
     # Solve the model
     solver = cp_model.CpSolver()
     solver.parameters.log_search_progress = False
-    solver.parameters.max_time_in_seconds = time_limit
-    solver.parameters.num_workers = num_thread
+    param_tuning.apply_profile(solver, 'packing', max_time_in_seconds=time_limit,
+                               num_workers=num_thread)
     print("Solve")
-    status = solver.Solve(model)
+    with phase_profiler.phase('solve'):
+        status = stop_policy.solve(solver, model, stop)
+    if stats is not None:
+        stats['stop_reason'] = stop_policy.reason(stop, status)
 
     # Print
     if status == cp_model.OPTIMAL or status == cp_model.FEASIBLE:
@@ -144,25 +120,47 @@ def solve(all_block, wafer_width, wafer_height, time_limit=60, num_thread=1):
             #   f"sampled: {[solver.Value(sampled[i]) for i in range(n)]}\n"
             #   f"on_panel: {[solver.Value(on_panel[i]) for i in range(n)]}\n"
               f"blocks_on_panel: {[(block['w'], block['h']) for i, block in enumerate(all_block) if solver.Value(on_panel[i])]}\n"
-              f"wafer_coverage: {solver.Value(wafer_coverage) / scale}\n"
-              f"block_utilization: {solver.Value(block_utilization) / scale}\n"
-              f"objective: {solver.ObjectiveValue()}")
-        all_block_sampled = []
-        for i, block in enumerate(all_block):
-            if not solver.Value(sampled[i]):
-                continue
-            block['x'] = solver.Value(all_wafer_x_st[i])
-            block['y'] = solver.Value(all_wafer_y_st[i])
-            all_block_sampled.append(block)
+              f"wafer_coverage: {objective.ratio(solver, 'wafer_coverage')}\n"
+              f"block_utilization: {objective.ratio(solver, 'block_utilization')}\n"
+              f"objective: {objective.value(solver)}")
+        if stats is not None:
+            stats['wafer_coverage'] = objective.ratio(solver, 'wafer_coverage')
+            stats['block_utilization'] = objective.ratio(solver, 'block_utilization')
+            stats['objective'] = objective.value(solver)
+            stats['wall_time'] = solver.WallTime()
+            stats['optimal'] = status == cp_model.OPTIMAL
+        with phase_profiler.phase('extract'):
+            all_block_sampled = []
+            for i, block in enumerate(all_block):
+                if not solver.Value(sampled[i]):
+                    continue
+                block['x'] = solver.Value(all_wafer_x_st[i])
+                block['y'] = solver.Value(all_wafer_y_st[i])
+                all_block_sampled.append(block)
         result = {}
         result["width"] = wafer_width
         result["height"] = wafer_height
         result["block"] = all_block_sampled
-        with open(os.path.join(result_path, file_name), 'w') as fp:
-            json.dump(result, fp, indent=4)
+        with phase_profiler.phase('write'):
+            with open(os.path.join(result_path, file_name), 'w') as fp:
+                json.dump(result, fp, indent=4)
     elif cp_model.INFEASIBLE:
         print("INFEASIBLE")
 
+def tuning_run(params, file_name, time_limit):
+    # param_tuning run: block_utilization with the parameters params, None if no solution
+    with open(file_name, 'r') as fp:
+        data = json.load(fp)
+    wafer = build_model(data["block"], data["wafer_width"], data["wafer_height"],
+                        data["panel_width"], data["panel_height"])
+    solver = cp_model.CpSolver()
+    param_tuning.apply_params(solver, dict(params, max_time_in_seconds=time_limit))
+    status = solver.Solve(wafer.model)
+    if status == cp_model.OPTIMAL or status == cp_model.FEASIBLE:
+        # the objective is maximized, the tuner minimizes
+        return -wafer.objective.value(solver)
+    return None
+
 
 if __name__ == "__main__":
     data_path = "block_data"
@@ -177,13 +175,21 @@ if __name__ == "__main__":
 
     # Create the model
     model = cp_model.CpModel()
-    with open(os.path.join(data_path, file_name), 'r') as fp:
-        data = json.load(fp)
-    wafer_width = data["wafer_width"]
-    wafer_height = data["wafer_height"]
-    panel_width = data["panel_width"]
-    panel_height = data["panel_height"]
-    all_block = data["block"]
-    time_limit = 3600 * 24
-    # solve(all_block, wafer_width, wafer_height)
-    solve(all_block, wafer_width, wafer_height, time_limit=time_limit, num_thread=8)
+    with phase_profiler.profile(file_name, os.path.join(result_path, 'phases.jsonl')) as run:
+        with phase_profiler.phase('parse'):
+            with open(os.path.join(data_path, file_name), 'r') as fp:
+                data = json.load(fp)
+        wafer_width = data["wafer_width"]
+        wafer_height = data["wafer_height"]
+        panel_width = data["panel_width"]
+        panel_height = data["panel_height"]
+        all_block = data["block"]
+        time_limit = 3600 * 24
+        # solve(all_block, wafer_width, wafer_height)
+        # the day-long limit is the fallback, the run ends once it stalls
+        stop = stop_policy.StopPolicy(relative_gap=0.001, stall_time=600)
+        stats = {}
+        solve(all_block, wafer_width, wafer_height, time_limit=time_limit, num_thread=8,
+              stats=stats, stop=stop)
+    print(f"stop reason: {stats['stop_reason']}")
+    run.print_summary()
@@ -0,0 +1,111 @@
+import os
+import sys
+import json
+import random
+import tempfile
+import importlib
+from ortools.sat.python import cp_model
+
+import wafer_sample_1
+import advance_process_2
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '2d_bin_packing'))
+import packing_engine
+knapsack_2 = importlib.import_module('2d_knapsack_problem_2')
+
+def random_sample(n, wafer_width, wafer_height, panel_width, panel_height, seed=0):
+    rng = random.Random(seed)
+    all_block = [{'w': rng.randint(1, 4), 'h': rng.randint(1, 4), 'x': None, 'y': None,
+                  'ng': rng.random() < 0.2} for _ in range(n)]
+    return {
+        'width': wafer_width, 'height': wafer_height,
+        'wafer_width': wafer_width, 'wafer_height': wafer_height,
+        'panel_width': panel_width, 'panel_height': panel_height,
+        'block': all_block,
+    }
+
+def load_samples(data_path):
+    # the block_data samples if there are any, a few random ones otherwise
+    samples = {}
+    if os.path.isdir(data_path):
+        for fn in sorted(os.listdir(data_path)):
+            if fn.endswith('.json'):
+                with open(os.path.join(data_path, fn), 'r') as fp:
+                    samples[fn] = json.load(fp)
+    if not samples:
+        for seed, n in enumerate([8, 12, 16]):
+            samples[f"random_{n}.json"] = random_sample(n, 10, 10, 4, 4, seed=seed)
+    return samples
+
+def _run_wafer_sampled(fn, data, objective_form, out_dir):
+    if 'width' not in data:
+        return None
+    path = os.path.join(out_dir, 'in_' + fn)
+    with open(path, 'w') as fp:
+        json.dump(data, fp)
+    wafer_sample_1.result_path = out_dir
+    wafer_sample_1.file_name = fn
+    stats = {}
+    wafer_sample_1.wafer_sampled(path, objective_form=objective_form, stats=stats)
+    return stats
+
+def _run_advance_process(fn, data, objective_form, out_dir, time_limit):
+    if 'panel_width' not in data:
+        return None
+    # solve() works on the module globals of advance_process_2
+    advance_process_2.model = cp_model.CpModel()
+    advance_process_2.panel_width = data['panel_width']
+    advance_process_2.panel_height = data['panel_height']
+    advance_process_2.result_path = out_dir
+    advance_process_2.file_name = fn
+    all_block = json.loads(json.dumps(data['block']))
+    stats = {}
+    advance_process_2.solve(all_block, data['wafer_width'], data['wafer_height'],
+                            time_limit=time_limit, num_thread=8,
+                            objective_form=objective_form, stats=stats)
+    return stats
+
+def _run_knapsack(fn, data, objective_form):
+    if 'panel_width' not in data:
+        return None
+    all_block = [{'w': block['w'], 'h': block['h'], 'x': None, 'y': None} for block in data['block']]
+    stats = {}
+    knapsack_2.solve(all_block, data['panel_width'], data['panel_height'],
+                     objective_form=objective_form, stats=stats)
+    return stats
+
+def run_regression(data_path, time_limit=60):
+    # both objective forms on every sample; the optima must agree
+    samples = load_samples(data_path)
+    out_dir = tempfile.mkdtemp()
+    rows = []
+    for fn, data in samples.items():
+        runs = {
+            'wafer_sampled': lambda form: _run_wafer_sampled(fn, data, form, out_dir),
+            'advance_process_2': lambda form: _run_advance_process(fn, data, form, out_dir, time_limit),
+            '2d_knapsack_problem_2': lambda form: _run_knapsack(fn, data, form),
+        }
+        for name, run in runs.items():
+            all_stats = {form: run(form) for form in packing_engine.OBJECTIVE_FORMS}
+            if any(stats is None for stats in all_stats.values()):
+                continue
+            # the division form truncates every ratio to 1/SCALE
+            objectives = [stats.get('objective') for stats in all_stats.values()]
+            same = None not in objectives and \
+                max(objectives) - min(objectives) <= 2.0 / packing_engine.SCALE
+            rows.append((fn, name, same, all_stats))
+    print("\nsample\tmodel\tequal optimum\t" + "\t".join(
+        f"{form} objective\t{form} time" for form in packing_engine.OBJECTIVE_FORMS))
+    for fn, name, same, all_stats in rows:
+        print(f"{fn}\t{name}\t{same}\t" + "\t".join(
+            f"{all_stats[form].get('objective')}\t"
+            f"{round(all_stats[form].get('wall_time', float('nan')), 3)}"
+            for form in packing_engine.OBJECTIVE_FORMS))
+    return rows
+
+
+if __name__ == "__main__":
+    data_path = "block_data"
+    time_limit = 60
+    run_regression(data_path, time_limit=time_limit)
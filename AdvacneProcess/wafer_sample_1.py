@@ -1,9 +1,16 @@
 import os
+import sys
 import json
 import numpy as np
 from ortools.sat.python import cp_model
 
-def wafer_sampled(path):
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import packing_engine
+import param_tuning
+import stop_policy
+
+def wafer_sampled(path, formulation=packing_engine.NO_OVERLAP_2D,
+                  objective_form=packing_engine.LINEAR, stats=None, stop=None):
     with open(path, 'r') as fp:
         data = json.load(fp)
     wafer_width = data["width"]
@@ -15,48 +22,18 @@ def wafer_sampled(path):
     # Create the model
     model = cp_model.CpModel()
 
-    # Variables
-    all_x_st, all_y_st, all_x_ed, all_y_ed, sampled = [], [], [], [], []
+    # Variables, fixed blocks are always sampled
+    sampled = []
     for i, block in enumerate(all_block):
-        if block['x'] == None:
-            all_x_st.append(model.NewIntVar(0, wafer_width - block['w'], f"x{i}"))
-        else:
-            all_x_st.append(model.NewIntVar(block['x'], block['x'], f"x{i}"))
-        all_x_ed.append(model.NewIntVar(-wafer_width, wafer_width, f"x_end{i}"))
-
-        if block['y'] == None:
-            all_y_st.append(model.NewIntVar(0, wafer_height - block['h'], f"y{i}"))
-        else:
-            all_y_st.append(model.NewIntVar(block['y'], block['y'], f"y{i}"))
-        all_y_ed.append(model.NewIntVar(-wafer_width, wafer_width, f"y_end{i}"))
-
         if block['x'] == None and block['y'] == None:
             sampled.append(model.NewBoolVar(f"sampled_{i}"))
         else:
             sampled.append(model.NewConstant(1))
-
-    # width & height constraints
-    for i, block in enumerate(all_block):
-        model.Add(all_x_ed[i] == all_x_st[i] + block['w']).OnlyEnforceIf(sampled[i])
-        model.Add(all_y_ed[i] == all_y_st[i] + block['h']).OnlyEnforceIf(sampled[i])
-        model.Add(all_x_ed[i] <= wafer_width).OnlyEnforceIf(sampled[i])
-        model.Add(all_y_ed[i] <= wafer_height).OnlyEnforceIf(sampled[i])
+    placement = packing_engine.place_blocks(model, all_block, wafer_width, wafer_height, sampled)
+    all_x_st, all_y_st = placement.x_st, placement.y_st
 
     # Non-overlapping constraints
-    for i in range(n):
-        for j in range(i + 1, n):
-            bx_ij = model.NewBoolVar(f"bx_{i}_{j}")
-            bx_ji = model.NewBoolVar(f"bx_{j}_{i}")
-            by_ij = model.NewBoolVar(f"by_{i}_{j}")
-            by_ji = model.NewBoolVar(f"by_{j}_{i}")
-
-            model.Add(all_x_ed[i] <= all_x_st[j] + wafer_width * bx_ij)
-            model.Add(all_x_ed[j] <= all_x_st[i] + wafer_width * bx_ji)
-            model.Add(all_y_ed[i] <= all_y_st[j] + wafer_height * by_ij)
-            model.Add(all_y_ed[j] <= all_y_st[i] + wafer_height * by_ji)
-
-            model.AddBoolOr([bx_ij.Not(), bx_ji.Not(),
-                            by_ij.Not(), by_ji.Not()])
+    packing_engine.add_no_overlap(model, placement, wafer_width, wafer_height, formulation)
 
     # Objective function
     wafer_area = wafer_width * wafer_height
@@ -69,36 +46,34 @@ def wafer_sampled(path):
     num_blocks_sampled = model.NewIntVar(0, n, "num_blocks_sampled")
     model.Add(num_blocks_sampled == sum(sampled[i] for i, block in enumerate(all_block)))
 
-    scale = 1000000
-    # wafer_coverage
-    wafer_coverage = model.NewIntVar(0, 1 * scale, "wafer_coverage")
-    model.AddDivisionEquality(wafer_coverage, blocks_area * scale, wafer_area)
-
-    # block utilization
-    block_utilization = model.NewIntVar(0, 1 * scale, "block_utilization")
-    model.AddDivisionEquality(
-        block_utilization,
-        num_blocks_sampled * scale,
-        n)
-
-    # model.Maximize(wafer_coverage * (1 / scale) - 
-    #                block_utilization * (1 / scale))
-    model.Maximize(wafer_coverage * (1 / scale))
+    # wafer_coverage only, block_utilization is reported
+    objective = packing_engine.RatioObjective(model, [
+        packing_engine.ratio_term("wafer_coverage", 1, blocks_area, wafer_area),
+        packing_engine.ratio_term("block_utilization", 0, num_blocks_sampled, n),
+    ], form=objective_form)
 
     # Solve the model
     solver = cp_model.CpSolver()
-    status = solver.Solve(model)
+    param_tuning.apply_profile(solver, 'packing')
+    status = stop_policy.solve(solver, model, stop)
+    if stats is not None:
+        stats['stop_reason'] = stop_policy.reason(stop, status)
 
-    # Print
-    if status == cp_model.OPTIMAL:
+    # Print, also the best one when the stop policy ended the search
+    if status == cp_model.OPTIMAL or status == cp_model.FEASIBLE:
         positions = [(solver.Value(all_x_st[i]), solver.Value(all_y_st[i]))
                      for i in range(n)]
         print(f"positions: {positions}\n"
               f"num_blocks_sampled: {solver.Value(num_blocks_sampled)}\n"
               f"sampled: {[solver.Value(sampled[i]) for i in range(n)]}\n"
-              f"wafer_coverage: {solver.Value(wafer_coverage) / scale}\n"
-              f"block_utilization: {solver.Value(block_utilization) / scale}\n"
-              f"objective: {solver.ObjectiveValue()}")
+              f"wafer_coverage: {objective.ratio(solver, 'wafer_coverage')}\n"
+              f"block_utilization: {objective.ratio(solver, 'block_utilization')}\n"
+              f"objective: {objective.value(solver)}")
+        if stats is not None:
+            stats['wafer_coverage'] = objective.ratio(solver, 'wafer_coverage')
+            stats['block_utilization'] = objective.ratio(solver, 'block_utilization')
+            stats['objective'] = objective.value(solver)
+            stats['wall_time'] = solver.WallTime()
         all_block_sampled = []
         for i, block in enumerate(all_block):
             if not solver.Value(sampled[i]):
@@ -1,36 +1,50 @@
 import collections
 import json
 import os
+import sys
+import time
+import numpy as np
 from ortools.sat.python import cp_model
 
 from djsp_logger import DJSP_Logger
 from djsp_plotter import DJSP_Plotter
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import bulk_model
+import dispatch_hint
+import lns_driver
+import param_tuning
+import phase_profiler
+import schedule_arrays
+import stop_policy
+import time_windows
 
 
-def solve():
-    jobs_data = [
-        [  # Job 0 (process time, machine id)
-            [(3, 0), (1, 1), (5, 2)],  # op 0 with 3 alternatives
-            [(2, 0), (4, 1), (6, 2)],  # op 1 with 3 alternatives
-            [(2, 0), (3, 1), (1, 2)],  # op 2 with 3 alternatives
-        ],
-        [  # Job 1
-            [(2, 0), (3, 1), (4, 2)],
-            [(1, 0), (5, 1), (4, 2)],
-            [(2, 0), (1, 1), (4, 2)],
-        ],
-        [  # Job 2
-            [(2, 0), (1, 1), (4, 2)],
-            [(2, 0), (3, 1), (4, 2)],
-            [(3, 0), (1, 1), (5, 2)],
-        ],
-    ]
+sample_jobs_data = [
+    [  # Job 0 (process time, machine id)
+        [(3, 0), (1, 1), (5, 2)],  # op 0 with 3 alternatives
+        [(2, 0), (4, 1), (6, 2)],  # op 1 with 3 alternatives
+        [(2, 0), (3, 1), (1, 2)],  # op 2 with 3 alternatives
+    ],
+    [  # Job 1
+        [(2, 0), (3, 1), (4, 2)],
+        [(1, 0), (5, 1), (4, 2)],
+        [(2, 0), (1, 1), (4, 2)],
+    ],
+    [  # Job 2
+        [(2, 0), (1, 1), (4, 2)],
+        [(2, 0), (3, 1), (4, 2)],
+        [(3, 0), (1, 1), (5, 2)],
+    ],
+]
 
+
+def build_model(jobs_data, windows=None):
+    # windows: time_windows.compute() of the jobs, [0, horizon] domains if None
     num_jobs = len(jobs_data)
     all_jobs = range(num_jobs)
 
-    num_machines = 2
+    num_machines = 1 + max(alt[1] for job in jobs_data for op in job for alt in op)
     all_machines = range(num_machines)
 
     # Model the flexible jobshop problem.
@@ -49,6 +63,7 @@ def solve():
     # Global storage of variables.
     intervals_per_resources = collections.defaultdict(list)
     starts = {}  # indexed by (job_id, task_id).
+    finishes = {}  # indexed by (job_id, task_id).
     presences = {}  # indexed by (job_id, task_id, alt_id).
     job_ends = []
 
@@ -68,13 +83,18 @@ def solve():
 
             # Create main interval for the task.
             suffix = '_%i_%i' % (job_id, op_id)
-            start = fjsp_model.NewIntVar(0, horizon, 'start' + suffix)
+            start_domain = end_domain = (0, horizon)
+            if windows is not None:
+                start_domain = time_windows.start_domain(windows, job_id, op_id)
+                end_domain = time_windows.end_domain(windows, job_id, op_id)
+            start = fjsp_model.NewIntVar(*start_domain, 'start' + suffix)
             duration = fjsp_model.NewIntVar(min_duration, max_duration, 'duration' + suffix)
-            finish = fjsp_model.NewIntVar(0, horizon, 'finish' + suffix)
+            finish = fjsp_model.NewIntVar(*end_domain, 'finish' + suffix)
             interval = fjsp_model.NewIntervalVar(start, duration, finish, 'interval' + suffix)
 
             # Store the start for the solution.
             starts[(job_id, op_id)] = start
+            finishes[(job_id, op_id)] = finish
 
             # Add precedence with previous task in the same job.
             if previous_end is not None:
@@ -87,9 +107,9 @@ def solve():
                 for machine_id in all_alternatives:
                     alt_suffix = '_j%i_t%i_a%i' % (job_id, op_id, machine_id)
                     alt_presence = fjsp_model.NewBoolVar('presence' + alt_suffix)
-                    alt_start = fjsp_model.NewIntVar(0, horizon, 'start' + alt_suffix)
+                    alt_start = fjsp_model.NewIntVar(*start_domain, 'start' + alt_suffix)
                     alt_duration = op[machine_id][0]
-                    alt_finish = fjsp_model.NewIntVar(0, horizon, 'finish' + alt_suffix)
+                    alt_finish = fjsp_model.NewIntVar(*end_domain, 'finish' + alt_suffix)
                     alt_interval = fjsp_model.NewOptionalIntervalVar(alt_start, alt_duration, alt_finish, alt_presence, 'interval' + alt_suffix)
                     alt_presences.append(alt_presence)
 
@@ -119,57 +139,131 @@ def solve():
             fjsp_model.AddNoOverlap(intervals)
 
     # Makespan objective
-    makespan = fjsp_model.NewIntVar(0, horizon, 'makespan')
+    if windows is None:
+        makespan = fjsp_model.NewIntVar(0, horizon, 'makespan')
+    else:
+        makespan = fjsp_model.NewIntVar(windows.lower_bound, windows.upper_bound, 'makespan')
     fjsp_model.AddMaxEquality(makespan, job_ends)
     fjsp_model.Minimize(makespan)
+    return fjsp_model, starts, finishes, presences, makespan
+
+def load_instance(file_name):
+    # Brandimarte .fjs format: a line per job, the number of operations, then
+    # for each operation the number of alternatives and (machine, time) pairs,
+    # machines numbered from 1
+    with open(file_name, 'r') as f:
+        lines = [line.split() for line in f if line.strip()]
+    num_jobs = int(lines[0][0])
+    jobs_data = []
+    for line in lines[1:1 + num_jobs]:
+        values = [int(v) for v in line]
+        job, i = [], 1
+        for _ in range(values[0]):
+            k = values[i]
+            pairs = values[i + 1:i + 1 + 2 * k]
+            job.append([(pairs[j + 1], pairs[j] - 1) for j in range(0, 2 * k, 2)])
+            i += 1 + 2 * k
+        jobs_data.append(job)
+    return jobs_data
+
+def solve(jobs_data=sample_jobs_data, hint_rule=None, as_schedule=False, bulk=False, stats=None,
+          tighten=True, stop=None):
+    with phase_profiler.phase('build'):
+        tic = time.time()
+        windows = None
+        if tighten:
+            windows = time_windows.compute(jobs_data)
+            if stats is not None:
+                stats['domain_shrink'] = time_windows.domain_shrink(windows, jobs_data)
+        if bulk:
+            # the same model written into the proto at once, without names
+            op_job, op_index, alt_op, alt_machine, alt_duration = bulk_model.fjsp_arrays(jobs_data)
+            bulk_vars = bulk_model.build_fjsp(op_job, op_index, alt_op, alt_machine, alt_duration,
+                                              windows=windows)
+            fjsp_model = bulk_vars.model
+        else:
+            fjsp_model, starts, finishes, presences, makespan = build_model(jobs_data, windows)
+
+        # Start from a dispatching-rule schedule.
+        if hint_rule is not None:
+            schedule = time_windows.fit_hint(windows, dispatch_hint.dispatch(jobs_data, hint_rule))
+            if bulk:
+                alt_id = np.arange(len(alt_op)) - np.searchsorted(alt_op, alt_op)
+                bulk_model.add_hint(fjsp_model, bulk_vars.starts, schedule.starts[op_job, op_index])
+                bulk_model.add_hint(fjsp_model, bulk_vars.presences,
+                                    schedule.alternatives[op_job[alt_op], op_index[alt_op]] == alt_id)
+            else:
+                dispatch_hint.add_hint(fjsp_model, schedule, starts, presences=presences)
+        build_time = time.time() - tic
 
     # Solve model.
     solver = cp_model.CpSolver()
-    status = solver.Solve(fjsp_model)
-
-    result = []
-    # Print final solution.
-    for job_id in all_jobs:
-        # print('Job %i:' % job_id)
-        for op_id in range(len(jobs_data[job_id])):
-            start_value = fjsp_model.Value(starts[(job_id, op_id)])
-            machine = -1
-            duration = -1
-            selected = -1
-            for machine_id in range(len(jobs_data[job_id][op_id])):
-                if fjsp_model.Value(presences[(job_id, op_id, machine_id)]):
-                    duration = jobs_data[job_id][op_id][machine_id][0]
-                    machine = jobs_data[job_id][op_id][machine_id][1]
-                    selected = machine_id
-            # print(
-            #     '  task_%i_%i starts at %i (alt %i, machine %i, duration %i)' %
-            #     (job_id, op_id, start_value, selected, machine, duration))
-            op_info = {
-                'Order':        None,
-                'job_id':       job_id,
-                'op_id':        op_id,
-                'machine_id':   machine,
-                'start_time':   start_value,
-                'process_time': duration,
-                'finish_time':  start_value + duration,
-                'job_type':     None,
-            }
-            result.append(op_info)
-    return result
+    param_tuning.apply_profile(solver, 'fjsp')
+    with phase_profiler.phase('solve'):
+        status = stop_policy.solve(solver, fjsp_model, stop)
+    if stats is not None:
+        stats['build_time'] = build_time
+        stats['solve_time'] = solver.WallTime()
+        stats['stop_reason'] = stop_policy.reason(stop, status)
+    if status != cp_model.OPTIMAL and status != cp_model.FEASIBLE:
+        print('No solution found.')
+        return []
+    if stats is not None:
+        stats['objective'] = solver.ObjectiveValue()
+
+    # One value array for all presences and starts.
+    with phase_profiler.phase('extract'):
+        if bulk:
+            presence_indices, start_indices = bulk_vars.presences, bulk_vars.starts
+        else:
+            # build_model fills starts and presences in job / op / alternative
+            # order, the order of the fjsp_arrays rows
+            op_job, op_index, alt_op, alt_machine, alt_duration = bulk_model.fjsp_arrays(jobs_data)
+            presence_indices = bulk_model.indices(presences.values())
+            start_indices = bulk_model.indices(starts.values())
+        solution = bulk_model.solution(solver)
+        chosen = solution[presence_indices] == 1
+        op_start = solution[start_indices]
+        schedule = schedule_arrays.Schedule(
+            op_job[alt_op[chosen]], op_index[alt_op[chosen]], alt_machine[chosen],
+            op_start[alt_op[chosen]], alt_duration[chosen])
+    if as_schedule:
+        return schedule
+    return schedule.to_op_infos()
+
+def tuning_run(params, file_name, time_limit):
+    # param_tuning run: makespan with the parameters params, None if no solution
+    bulk_vars = bulk_model.build_fjsp(*bulk_model.fjsp_arrays(load_instance(file_name)))
+    solver = cp_model.CpSolver()
+    param_tuning.apply_params(solver, dict(params, max_time_in_seconds=time_limit))
+    status = solver.Solve(bulk_vars.model)
+    if status == cp_model.OPTIMAL or status == cp_model.FEASIBLE:
+        return solver.ObjectiveValue()
+    return None
+
+def lns_solve(jobs_data=sample_jobs_data, time_limit=10.0, **lns_options):
+    # same result as solve(), searched by lns_driver from an MWKR schedule
+    schedule, history = lns_driver.lns(
+        lambda: build_model(jobs_data), jobs_data, time_limit, **lns_options)
+    return lns_driver.op_infos(schedule, jobs_data)
 
 
 if __name__ == '__main__':
     # jsp_result = solve(in_file, time_limit=time_limit)
     # out_file = os.path.join(fn+'.json')
     out_file = 'sample.json'
-    fjsp_result = solve()
-    with open(out_file, 'w') as f:
-        json.dump(fjsp_result, f, indent=4)
-    
-    # visualization
-    logger = DJSP_Logger()
-    plotter = DJSP_Plotter(logger)
-    logger.load(out_file)
-    print(logger)
-    # plotter.plot_googlechart_timeline(os.path.json('timeline', fn+'.html'))
-    plotter.plot_googlechart_timeline(os.path.join('sample.html'))
\ No newline at end of file
+    with phase_profiler.profile('sample', 'phases.jsonl') as run:
+        fjsp_result = solve()
+        with phase_profiler.phase('write'):
+            with open(out_file, 'w') as f:
+                json.dump(fjsp_result, f, indent=4)
+
+        # visualization
+        logger = DJSP_Logger()
+        plotter = DJSP_Plotter(logger)
+        logger.load(out_file)
+        print(logger)
+        # plotter.plot_googlechart_timeline(os.path.json('timeline', fn+'.html'))
+        with phase_profiler.phase('html'):
+            plotter.plot_googlechart_timeline(os.path.join('sample.html'))
+    run.print_summary()
\ No newline at end of file
@@ -1,42 +1,28 @@
+import os
+import sys
 from ortools.sat.python import cp_model
 
-def floorplanning(widths, heights, panel_width, panel_height):
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import packing_engine
+import param_tuning
+import stop_policy
+
+def floorplanning(widths, heights, panel_width, panel_height,
+                  formulation=packing_engine.NO_OVERLAP_2D, stop=None):
     # Number of blocks
     n = len(widths)
 
     # Create the model
     model = cp_model.CpModel()
 
-    # Variables
-    x = [model.NewIntVar(0, panel_width - w, f'x{i}') for i, w in enumerate(widths)]
-    y = [model.NewIntVar(0, panel_height - h, f'y{i}') for i, h in enumerate(heights)]
-    x_e = [model.NewIntVar(-panel_width, panel_width, f'x_end{i}') for i in range(n)]
-    y_e = [model.NewIntVar(-panel_height, panel_height, f'y_end{i}') for i in range(n)]
-
-    # Constraints
-    for i in range(n):
-        # x_end = x + w
-        model.Add(x_e[i] == x[i] + widths[i])
-        # y_end = y + h
-        model.Add(y_e[i] == y[i] + heights[i])
+    # Variables, every block is placed
+    all_block = packing_engine.blocks_from_sizes(widths, heights)
+    placed = [model.NewConstant(1) for i in range(n)]
+    placement = packing_engine.place_blocks(model, all_block, panel_width, panel_height, placed)
+    x, y, x_e, y_e = placement.x_st, placement.y_st, placement.x_ed, placement.y_ed
 
     # Non-overlapping constraints
-    for i in range(n):
-        for j in range(i + 1, n):
-            # Boolean variables for each constraint
-            bx_ij = model.NewBoolVar(f'bx_{i}_{j}')
-            bx_ji = model.NewBoolVar(f'bx_{j}_{i}')
-            by_ij = model.NewBoolVar(f'by_{i}_{j}')
-            by_ji = model.NewBoolVar(f'by_{j}_{i}')
-
-            # Constraints
-            model.Add(x_e[i] <= x[j] + panel_width * bx_ij)
-            model.Add(x_e[j] <= x[i] + panel_width * bx_ji)
-            model.Add(y_e[i] <= y[j] + panel_height * by_ij)
-            model.Add(y_e[j] <= y[i] + panel_height * by_ji)
-
-            # Use model.AddBoolOr() for each constraint
-            model.AddBoolOr([bx_ij.Not(), bx_ji.Not(), by_ij.Not(), by_ji.Not()])
+    packing_engine.add_no_overlap(model, placement, panel_width, panel_height, formulation)
 
     # Objective function
     objective = model.NewIntVar(0, panel_width * panel_height, "objective")
@@ -45,10 +31,11 @@ def floorplanning(widths, heights, panel_width, panel_height):
 
     # Solve the model
     solver = cp_model.CpSolver()
-    status = solver.Solve(model)
+    param_tuning.apply_profile(solver, 'packing')
+    status = stop_policy.solve(solver, model, stop)
 
-    # Return the result
-    if status == cp_model.OPTIMAL:
+    # Return the result, also the best one when the stop policy ended the search
+    if status == cp_model.OPTIMAL or status == cp_model.FEASIBLE:
         positions = [(solver.Value(x[i]), solver.Value(y[i])) for i in range(n)]
         max_x = solver.Value(objective)
         max_y = max(solver.Value(y_e[i]) for i in range(n))
@@ -1,4 +1,5 @@
 import os
+import sys
 import json
 import collections
 from ortools.sat.python import cp_model
@@ -6,27 +7,18 @@ from ortools.sat.python import cp_model
 from djsp_logger import DJSP_Logger
 from djsp_plotter import DJSP_Plotter
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+import dispatch_hint
+import jsp_instance
+import param_tuning
+import stop_policy
+import time_windows
+
 def load_instance(filename):
-    data = []
-    
-    f = open(filename)
-    line = f.readline()
-    while line[0] == '#':
-        line = f.readline()
-    line = line.split()
-    num_job, num_machine = int(line[0]), int(line[1])
-
-    for i in range(num_job):
-        job_data = []
-        line = f.readline().split()
-        for j in range(num_machine):
-            machine_id, processing_time = int(line[j * 2]), int(line[j * 2 + 1])
-            # print('Machine', machine_id, 'processing_time:', processing_time)
-            job_data.append((machine_id, processing_time))
-        data.append(job_data)
-    return data
-
-def solve(file_name, time_limit=10.0):
+    return jsp_instance.load_jobs_data(filename)
+
+def solve(file_name, time_limit=10.0, tighten=True, stop=None, params=None):
     # jobs_data = [  # op = (machine_id, processing_time).
     #     [(0, 3), (1, 2), (2, 2)],  # Job0
     #     [(0, 2), (2, 1), (1, 4)],  # Job1
@@ -39,6 +31,10 @@ def solve(file_name, time_limit=10.0):
     all_machines = range(num_machines)
     # Computes horizon dynamically as the sum of all durations.
     horizon = sum(op[1] for job in jobs_data for op in job)
+    # Narrower windows from heads, tails and a dispatching-rule makespan.
+    windows = None
+    if tighten:
+        windows = time_windows.compute(dispatch_hint.jsp_alternatives(jobs_data))
 
     # Create the model.
     jsp_model = cp_model.CpModel()
@@ -58,8 +54,14 @@ def solve(file_name, time_limit=10.0):
             machine = op[0]
             duration = op[1]
             suffix = '_%i_%i' % (job_id, op_id)
-            start = jsp_model.NewIntVar(0, horizon, 'start' + suffix)
-            finish = jsp_model.NewIntVar(0, horizon, 'finish' + suffix)
+            if windows is None:
+                start = jsp_model.NewIntVar(0, horizon, 'start' + suffix)
+                finish = jsp_model.NewIntVar(0, horizon, 'finish' + suffix)
+            else:
+                start = jsp_model.NewIntVar(
+                    *time_windows.start_domain(windows, job_id, op_id), 'start' + suffix)
+                finish = jsp_model.NewIntVar(
+                    *time_windows.end_domain(windows, job_id, op_id), 'finish' + suffix)
             interval = jsp_model.NewIntervalVar(start, duration, finish, 'interval' + suffix)
             all_ops[job_id, op_id] = task_type(start=start, finish=finish, interval=interval)
             machine_to_intervals[machine].append(interval)
@@ -74,7 +76,10 @@ def solve(file_name, time_limit=10.0):
             jsp_model.Add(all_ops[job_id, op_id].finish <= all_ops[job_id, op_id + 1].start)
 
     # set objective function (makespan)
-    makespan = jsp_model.NewIntVar(0, horizon, 'makespan')
+    if windows is None:
+        makespan = jsp_model.NewIntVar(0, horizon, 'makespan')
+    else:
+        makespan = jsp_model.NewIntVar(windows.lower_bound, windows.upper_bound, 'makespan')
     jsp_model.AddMaxEquality(makespan, [
         all_ops[job_id, len(job) - 1].finish for job_id, job in enumerate(jobs_data)
     ])
@@ -83,10 +88,10 @@ def solve(file_name, time_limit=10.0):
 
     # Creates the solver.
     solver = cp_model.CpSolver()
-    # set time limit
-    solver.parameters.max_time_in_seconds = time_limit
+    # JSP profile, params and the time limit on top
+    param_tuning.apply_profile(solver, 'jsp', params=params, max_time_in_seconds=time_limit)
     # solve
-    status = solver.Solve(jsp_model)
+    status = stop_policy.solve(solver, jsp_model, stop)
 
     if status == cp_model.OPTIMAL or status == cp_model.FEASIBLE:
         print('%s\t%f\t%f\t%r' %(
@@ -1,4 +1,5 @@
 import os
+import sys
 import json
 import collections
 from ortools.sat.python import cp_model
@@ -6,26 +7,20 @@ from ortools.sat.python import cp_model
 from djsp_logger import DJSP_Logger
 from djsp_plotter import DJSP_Plotter
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+import dispatch_hint
+import param_tuning
+import jsp_instance
+import schedule_arrays
+import stop_policy
+import time_windows
+
 def load_instance(filename):
-    data = []
-    f = open(filename)
-    line = f.readline()
-    while line[0] == '#':
-        line = f.readline()
-    line = line.split()
-    num_job, num_machine = int(line[0]), int(line[1])
-
-    for i in range(num_job):
-        job_data = []
-        line = f.readline().split()
-        for j in range(num_machine):
-            machine_id, processing_time = int(line[j * 2]), int(line[j * 2 + 1])
-            # print('Machine', machine_id, 'processing_time:', processing_time)
-            job_data.append((machine_id, processing_time))
-        data.append(job_data)
-    return data
-
-def solve(file_name, jobs_due , time_limit=10.0):
+    return jsp_instance.load_jobs_data(filename)
+
+def solve(file_name, jobs_due , time_limit=10.0, hint_rule=None, as_schedule=False, tighten=True,
+          stop=None, stats=None, params=None):
   """Minimal jobshop problem."""
   # Data.
 #   jobs_data = [  # task = (machine_id, processing_time).
@@ -43,6 +38,11 @@ def solve(file_name, jobs_due , time_limit=10.0):
   all_machines = range(machines_count)
   # Compute horizon dynamically as the sum of all durations.
   horizon = sum(task[1] for job in jobs_data for task in job)
+  # Heads and tails only, a tardiness optimum may end later than a
+  # dispatching-rule makespan but some optimum is semi-active.
+  windows = None
+  if tighten:
+    windows = time_windows.compute(dispatch_hint.jsp_alternatives(jobs_data), upper_bound=horizon)
 
   # Create the model.
   model = cp_model.CpModel()
@@ -61,8 +61,12 @@ def solve(file_name, jobs_due , time_limit=10.0):
       machine = task[0]
       duration = task[1]
       suffix = f'_{job_id}_{task_id}'
-      start_var = model.NewIntVar(0, horizon, 'start' + suffix)
-      end_var = model.NewIntVar(0, horizon, 'end' + suffix)
+      if windows is None:
+        start_var = model.NewIntVar(0, horizon, 'start' + suffix)
+        end_var = model.NewIntVar(0, horizon, 'end' + suffix)
+      else:
+        start_var = model.NewIntVar(*time_windows.start_domain(windows, job_id, task_id), 'start' + suffix)
+        end_var = model.NewIntVar(*time_windows.end_domain(windows, job_id, task_id), 'end' + suffix)
       interval_var = model.NewIntervalVar(start_var, duration, end_var, 'interval' + suffix)
       all_tasks[job_id, task_id] = task_type(start=start_var, end=end_var, interval=interval_var)
       machine_to_intervals[machine].append(interval_var)
@@ -99,13 +103,29 @@ def solve(file_name, jobs_due , time_limit=10.0):
     obj_var = tardiness_var
   model.Minimize(obj_var)
 
+  # Start from a dispatching-rule schedule, EDD fits the tardiness objective.
+  if hint_rule is not None:
+    schedule = dispatch_hint.dispatch(
+      dispatch_hint.jsp_alternatives(jobs_data), hint_rule, due_dates=jobs_due)
+    dispatch_hint.add_hint(
+      model, schedule,
+      {key: task.start for key, task in all_tasks.items()},
+      {key: task.end for key, task in all_tasks.items()})
+
   # Create the solver and solve.
   solver = cp_model.CpSolver()
-  solver.parameters.max_time_in_seconds = time_limit
-  status = solver.Solve(model)
+  # JSP profile, params and the time limit on top
+  param_tuning.apply_profile(solver, 'jsp', params=params, max_time_in_seconds=time_limit)
+  status = stop_policy.solve(solver, model, stop)
+  if stats is not None:
+    stats['stop_reason'] = stop_policy.reason(stop, status)
 
   if status == cp_model.OPTIMAL or status == cp_model.FEASIBLE:
     print('Solution:')
+    if stats is not None:
+      stats['objective'] = solver.ObjectiveValue()
+      stats['wall_time'] = solver.WallTime()
+      stats['optimal'] = bool(status == cp_model.OPTIMAL)
     # Create on elist of assigned tasks per machine.
     assigned_jobs = collections.defaultdict(list)
     for job_id, job in enumerate(jobs_data):
@@ -164,6 +184,8 @@ def solve(file_name, jobs_due , time_limit=10.0):
     print(f'                 Tardiness: {solver.Value(tardiness_var)}')
     print(f'                 Makespan:  {solver.Value(makespan_var)}')
     print(output)
+    if as_schedule:
+      return schedule_arrays.Schedule.from_op_infos(result)
   else:
     print('No solution found.')
   return result
@@ -181,7 +203,7 @@ if __name__ == '__main__':
     fn, _ = os.path.splitext(in_file)
     time_limit = 60     # in second
     jobs_due = [10, 5, 10]
-    jsp_result = solve(in_file, jobs_due, time_limit=time_limit)
+    jsp_result = solve(in_file, jobs_due, time_limit=time_limit, hint_rule='EDD')
     out_file = os.path.join(fn+'.json')
     with open(out_file, 'w') as f:
         json.dump(jsp_result, f, indent=4)
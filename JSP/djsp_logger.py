@@ -1,4 +1,5 @@
 import json
+import bisect
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
@@ -6,9 +7,72 @@ from datetime import datetime, timedelta
 from pprint import pprint
 import os
 
+class MachineIntervalIndex(object):
+    # op_infos of every machine kept sorted by start_time, so that gap queries
+    # do not need to regroup the whole history
+    def __init__(self):
+        self.starts = {}
+        self.finishes = {}
+        self.op_infos = {}
+
+    def clear(self):
+        self.starts.clear()
+        self.finishes.clear()
+        self.op_infos.clear()
+
+    def build(self, history):
+        self.clear()
+        by_machine = {}
+        for op_info in history:
+            if op_info.get('job_type') == 'NOOP':
+                continue
+            by_machine.setdefault(op_info['machine_id'], []).append(op_info)
+        for machine_id, op_infos in by_machine.items():
+            op_infos.sort(key=lambda op_info: op_info['start_time'])
+            self.op_infos[machine_id] = op_infos
+            self.starts[machine_id] = [op_info['start_time'] for op_info in op_infos]
+            self.finishes[machine_id] = [op_info['finish_time'] for op_info in op_infos]
+
+    def add(self, op_info):
+        if op_info.get('job_type') == 'NOOP':
+            return
+        machine_id = op_info['machine_id']
+        starts = self.starts.setdefault(machine_id, [])
+        i = bisect.bisect_right(starts, op_info['start_time'])
+        starts.insert(i, op_info['start_time'])
+        self.finishes.setdefault(machine_id, []).insert(i, op_info['finish_time'])
+        self.op_infos.setdefault(machine_id, []).insert(i, op_info)
+
+    def machines(self):
+        return list(self.op_infos.keys())
+
+    def ops_on(self, machine_id):
+        return self.op_infos.get(machine_id, [])
+
+    def idle_windows(self, machine_id, left_time, right_time):
+        # all idle windows on machine_id in [left_time, right_time)
+        if left_time >= right_time:
+            return []
+        starts = self.starts.get(machine_id, [])
+        finishes = self.finishes.get(machine_id, [])
+        # the op started just before left_time may still cover it
+        i = max(bisect.bisect_right(starts, left_time) - 1, 0)
+        windows = []
+        current = left_time
+        while i < len(starts) and starts[i] < right_time:
+            if starts[i] > current:
+                windows.append([current, starts[i]])
+            current = max(current, finishes[i])
+            i += 1
+        if current < right_time:
+            windows.append([current, right_time])
+        return windows
+
+
 class DJSP_Logger(object):
     def __init__(self):
         self.history = []
+        self.interval_index = MachineIntervalIndex()
         self.jobs_to_schedule = []
         self.order = 0
         self.NOOP_JOB_ID = 1 << 20
@@ -82,6 +146,7 @@ class DJSP_Logger(object):
         }
         self.order += 1
         self.history.append(op_info)
+        self.interval_index.add(op_info)
 
     def save(self, json_out_file):
         with open(json_out_file, 'w') as f:
@@ -90,6 +155,12 @@ class DJSP_Logger(object):
     def load(self, json_in_file):
         with open(json_in_file, 'r') as f:
             self.history = list(json.load(f))
+        self.interval_index.build(self.history)
+
+    def load_schedule(self, schedule):
+        # schedule_arrays.Schedule returned by the solvers with as_schedule=True
+        self.history = schedule.to_op_infos()
+        self.interval_index.build(self.history)
 
     def arrange_history_by(self, key, need_sort=False):
         res = {}
@@ -127,64 +198,58 @@ class DJSP_Logger(object):
         history_in_machine_id[current_op_info['machine_id']]
 
     def _find_all_empty_intervals(self, left_time, right_time, machine_id):
-        # print('left_time, right_time, machine_id:', left_time, right_time, machine_id)
-        history_in_machine_id = self.arrange_history_by('machine_id', need_sort=True)
-        op_infos_in_machine_id = history_in_machine_id[machine_id]
-        if left_time >= right_time:
-            return []
-        else:
-            nonempty_intervals = []
-            empty_intervals = []
-            for op_info in op_infos_in_machine_id:
-                if left_time < op_info['finish_time'] and op_info['finish_time'] <= right_time:
-                    # print('op_info:', op_info)
-                    nonempty_intervals.append([op_info['start_time'], op_info['finish_time']])
-            # print('\tnonempty_intervals:', nonempty_intervals)
-            if len(nonempty_intervals) == 0:
-                return [[left_time, right_time]]
-            if nonempty_intervals[0][0] < left_time:
-                left_time = nonempty_intervals[0][1]
-            elif nonempty_intervals[0][0] > left_time:
-                empty_intervals.append([left_time, nonempty_intervals[0][0]])
-            if nonempty_intervals[-1][1] < right_time:
-                empty_intervals.append([nonempty_intervals[-1][1], right_time])
-            for i, interval in enumerate(nonempty_intervals):
-                if i == len(nonempty_intervals)-1:
-                    continue
-                noop_start = nonempty_intervals[i][1]
-                noop_finish = nonempty_intervals[i+1][0]
-                if noop_start < noop_finish:
-                    empty_intervals.append([noop_start, noop_finish])
-            # print('\tempty_intervals:', empty_intervals)
-            return empty_intervals
+        return self.interval_index.idle_windows(machine_id, left_time, right_time)
+
+    def _ready_times(self):
+        # finish time of the previous op in the same job (0 for the first op)
+        ops_in_job = {}
+        for machine_id in self.interval_index.machines():
+            for op_info in self.interval_index.ops_on(machine_id):
+                ops_in_job.setdefault(op_info['job_id'], []).append(op_info)
+        ready_times = {}
+        for job_id, op_infos in ops_in_job.items():
+            op_infos.sort(key=lambda op_info: op_info['start_time'])
+            previous_finish = 0
+            for op_info in op_infos:
+                ready_times[id(op_info)] = previous_finish
+                previous_finish = op_info['finish_time']
+        return ready_times
+
     def find_noop(self):
-        history_in_job_id = self.arrange_history_by('job_id', need_sort=True)
-        # pprint(history_in_job_id)
-        for job_id, op_infos in history_in_job_id.items():
-            previous_op_info = None
-            for op_id, op_info in enumerate(op_infos):
-                # print('pre_op_info:\t', previous_op_info)
-                # print('op_info:\t', op_info)
-                if previous_op_info == None:
-                    empty_intervals = self._find_all_empty_intervals(0, op_info['start_time'], op_info['machine_id'])
-                else:
-                    empty_intervals = self._find_all_empty_intervals(previous_op_info['finish_time'], op_info['start_time'], op_info['machine_id'])
-                for interval in empty_intervals:
-                    noop_start = interval[0]
-                    noop_finish = interval[1]
-                    if noop_start < noop_finish:
-                        noop_info = {
-                            'Order':        None,
-                            'job_id':       op_info['job_id'],
-                            'op_id':        op_info['op_id'],
-                            'machine_id':   op_info['machine_id'],
-                            'start_time':   noop_start, 
-                            'process_time': noop_finish-noop_start,
-                            'finish_time':  noop_finish,
-                            'job_type':     'NOOP',
-                        }
-                        self.history.append(noop_info)
-                previous_op_info = op_info
+        # A NOOP is machine idle time while the job of a later op on the same
+        # machine was already ready. One sweep per machine in start order: the
+        # idle pieces not yet claimed are kept on a stack, and each op claims
+        # the pieces lying after its ready time.
+        ready_times = self._ready_times()
+        noop_infos = []
+        for machine_id in self.interval_index.machines():
+            unclaimed = []
+            busy_until = 0
+            for op_info in self.interval_index.ops_on(machine_id):
+                if op_info['start_time'] > busy_until:
+                    unclaimed.append([busy_until, op_info['start_time']])
+                ready_time = ready_times[id(op_info)]
+                claimed = []
+                while unclaimed and unclaimed[-1][1] > ready_time:
+                    noop_start, noop_finish = unclaimed.pop()
+                    if noop_start < ready_time:
+                        unclaimed.append([noop_start, ready_time])
+                        noop_start = ready_time
+                    claimed.append([noop_start, noop_finish])
+                for noop_start, noop_finish in reversed(claimed):
+                    noop_info = {
+                        'Order':        None,
+                        'job_id':       op_info['job_id'],
+                        'op_id':        op_info['op_id'],
+                        'machine_id':   machine_id,
+                        'start_time':   noop_start, 
+                        'process_time': noop_finish-noop_start,
+                        'finish_time':  noop_finish,
+                        'job_type':     'NOOP',
+                    }
+                    noop_infos.append(noop_info)
+                busy_until = max(busy_until, op_info['finish_time'])
+        self.history.extend(noop_infos)
     
     def get_plotly_timeline_input(self, color_by):        
         unix_epoch = datetime.strptime('1970-01-01', '%Y-%m-%d')
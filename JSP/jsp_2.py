@@ -1,37 +1,31 @@
 import os
+import sys
 import json
+import time
 import collections
+import numpy as np
 from ortools.sat.python import cp_model
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import bulk_model
+import dispatch_hint
+import lns_driver
+import param_tuning
+import phase_profiler
+import jsp_instance
+import schedule_arrays
+import stop_policy
+import time_windows
+
+@phase_profiler.profiled('parse')
 def load_instance(filename):
-    data = []
-    
-    f = open(filename)
-    line = f.readline()
-    while line[0] == '#':
-        line = f.readline()
-    line = line.split()
-    num_job, num_machine = int(line[0]), int(line[1])
-
-    for i in range(num_job):
-        job_data = []
-        line = f.readline().split()
-        for j in range(num_machine):
-            machine_id, processing_time = int(line[j * 2]), int(line[j * 2 + 1])
-            # print('Machine', machine_id, 'processing_time:', processing_time)
-            job_data.append((machine_id, processing_time))
-        data.append(job_data)
-    return data
-
-def solve(file_name, time_limit=10.0):
-    result = []
-    # jobs_data = [  # task = (machine_id, processing_time).
-    #     [(0, 3), (1, 2), (2, 2)],  # Job0
-    #     [(0, 2), (2, 1), (1, 4)],  # Job1
-    #     [(1, 4), (2, 3)]  # Job2
-    # ]
-    jobs_data = load_instance(file_name)
+    return jsp_instance.load_jobs_data(filename)
 
+# Named tuple to store information about created variables.
+task_type = collections.namedtuple('task_type', 'start end interval')
+
+def build_model(jobs_data, windows=None):
+    # windows: time_windows.compute() of the jobs, [0, horizon] domains if None
     machines_count = 1 + max(task[0] for job in jobs_data for task in job)
     all_machines = range(machines_count)
     # Computes horizon dynamically as the sum of all durations.
@@ -40,12 +34,6 @@ def solve(file_name, time_limit=10.0):
     # Create the model.
     model = cp_model.CpModel()
 
-    # Named tuple to store information about created variables.
-    task_type = collections.namedtuple('task_type', 'start end interval')
-    # Named tuple to manipulate solution information.
-    assigned_task_type = collections.namedtuple('assigned_task_type',
-                                                'start job index duration')
-
     # Creates job intervals and add to the corresponding machine lists.
     all_tasks = {}
     machine_to_intervals = collections.defaultdict(list)
@@ -55,8 +43,14 @@ def solve(file_name, time_limit=10.0):
             machine = task[0]
             duration = task[1]
             suffix = '_%i_%i' % (job_id, task_id)
-            start_var = model.NewIntVar(0, horizon, 'start' + suffix)
-            end_var = model.NewIntVar(0, horizon, 'end' + suffix)
+            if windows is None:
+                start_var = model.NewIntVar(0, horizon, 'start' + suffix)
+                end_var = model.NewIntVar(0, horizon, 'end' + suffix)
+            else:
+                start_var = model.NewIntVar(
+                    *time_windows.start_domain(windows, job_id, task_id), 'start' + suffix)
+                end_var = model.NewIntVar(
+                    *time_windows.end_domain(windows, job_id, task_id), 'end' + suffix)
             interval_var = model.NewIntervalVar(start_var, duration, end_var,
                                                 'interval' + suffix)
             all_tasks[job_id, task_id] = task_type(start=start_var,
@@ -75,61 +69,206 @@ def solve(file_name, time_limit=10.0):
                                 1].start >= all_tasks[job_id, task_id].end)
 
     # Makespan objective.
-    obj_var = model.NewIntVar(0, horizon, 'makespan')
+    if windows is None:
+        obj_var = model.NewIntVar(0, horizon, 'makespan')
+    else:
+        obj_var = model.NewIntVar(windows.lower_bound, windows.upper_bound, 'makespan')
     model.AddMaxEquality(obj_var, [
         all_tasks[job_id, len(job) - 1].end
         for job_id, job in enumerate(jobs_data)
     ])
     model.Minimize(obj_var)
+    return model, all_tasks, obj_var
+
+def add_dispatch_hint(model, jobs_data, all_tasks, rule='SPT', windows=None):
+    schedule = dispatch_hint.dispatch(dispatch_hint.jsp_alternatives(jobs_data), rule)
+    schedule = time_windows.fit_hint(windows, schedule)
+    dispatch_hint.add_hint(
+        model, schedule,
+        {key: task.start for key, task in all_tasks.items()},
+        {key: task.end for key, task in all_tasks.items()})
+    return schedule
+
+def _schedule(jobs_data, starts):
+    # Schedule of the start times in job / op order
+    op_job, op_index, op_machine, op_duration = bulk_model.jsp_arrays(jobs_data)
+    return schedule_arrays.Schedule(op_job, op_index, op_machine, starts, op_duration)
+
+def solve(file_name, time_limit=10.0, num_workers=None, stats=None, hint_rule=None,
+          as_schedule=False, bulk=False, model_cache=None, tighten=True, result_cache=None,
+          seed=None, callback=None, stop=None, params=None):
+    result = []
+    # jobs_data = [  # task = (machine_id, processing_time).
+    #     [(0, 3), (1, 2), (2, 2)],  # Job0
+    #     [(0, 2), (2, 1), (1, 4)],  # Job1
+    #     [(1, 4), (2, 3)]  # Job2
+    # ]
+    jobs_data = load_instance(file_name)
 
     # Creates the solver.
     solver = cp_model.CpSolver()
-    # set limit
-    solver.parameters.max_time_in_seconds = time_limit
+    # job shop profile, limits of the call on top
+    params = param_tuning.apply_profile(solver, 'jsp', params=params,
+                                        max_time_in_seconds=time_limit,
+                                        num_workers=num_workers, random_seed=seed)
+
+    # A solve with the same settings before: its result at once.
+    warm = None
+    if result_cache is not None:
+        instance = result_cache.instance_hash(file_name)
+        key_params = dict(params, tighten=tighten)
+        del key_params['max_time_in_seconds']
+        entry = result_cache.get(instance, 'jsp_2', key_params, time_limit, seed)
+        if entry is not None:
+            print('%s\t%f\t%f\t%r\tcached' %(
+                file_name, entry['objective'], 0.0, entry['optimal']))
+            if stats is not None:
+                stats['objective'] = entry['objective']
+                stats['wall_time'] = 0.0
+                stats['optimal'] = entry['optimal']
+                stats['cached'] = True
+            schedule = _schedule(jobs_data, entry['solution'])
+            if as_schedule:
+                return schedule
+            return schedule.to_op_infos()
+        warm = result_cache.warm_start(instance, 'jsp_2', time_limit)
+
+    with phase_profiler.phase('build'):
+        tic = time.time()
+        windows = None
+        if tighten:
+            windows = time_windows.compute(dispatch_hint.jsp_alternatives(jobs_data))
+            if stats is not None:
+                stats['domain_shrink'] = time_windows.domain_shrink(windows, jobs_data)
+        # a shorter solve's incumbent instead of the dispatching rule, if it
+        # fits into the windows
+        if warm is not None and windows is not None and warm['objective'] > windows.upper_bound:
+            warm = None
+        if bulk or model_cache is not None:
+            # the same model written into the proto at once, without names
+            op_job, op_index, op_machine, op_duration = bulk_model.jsp_arrays(jobs_data)
+            def build():
+                bulk_vars = bulk_model.build_jsp(op_job, op_index, op_machine, op_duration,
+                                                 windows=windows)
+                return bulk_vars.model, {'starts': bulk_vars.starts.tolist()}
+            if model_cache is not None:
+                model, index_maps = model_cache.get_or_build(
+                    file_name, 'jsp_2', {'tighten': tighten}, build)
+            else:
+                model, index_maps = build()
+            start_indices = np.array(index_maps['starts'], dtype=np.int64)
+            if warm is not None:
+                bulk_model.add_hint(model, start_indices, warm['solution'])
+            elif hint_rule is not None:
+                schedule = dispatch_hint.dispatch(dispatch_hint.jsp_alternatives(jobs_data), hint_rule)
+                schedule = time_windows.fit_hint(windows, schedule)
+                bulk_model.add_hint(model, start_indices, schedule.starts[op_job, op_index])
+        else:
+            model, all_tasks, obj_var = build_model(jobs_data, windows)
+            keys = [(job_id, task_id) for job_id, job in enumerate(jobs_data)
+                    for task_id in range(len(job))]
+            if warm is not None:
+                for key, start in zip(keys, warm['solution']):
+                    model.AddHint(all_tasks[key].start, start)
+            elif hint_rule is not None:
+                add_dispatch_hint(model, jobs_data, all_tasks, hint_rule, windows)
+        build_time = time.time() - tic
+
     # solve
-    status = solver.Solve(model)
+    with phase_profiler.phase('solve'):
+        status = stop_policy.solve(solver, model, stop, callback)
+    if stats is not None:
+        stats['build_time'] = build_time
+        stats['solve_time'] = solver.WallTime()
+        stats['stop_reason'] = stop_policy.reason(stop, status)
 
     if status == cp_model.OPTIMAL or status == cp_model.FEASIBLE:
         print('%s\t%f\t%f\t%r' %(
             file_name, 
             solver.ObjectiveValue(), solver.WallTime(), 
             bool(status == cp_model.OPTIMAL)))
-        # Create one list of assigned tasks per machine.
-        assigned_jobs = collections.defaultdict(list)
-        for job_id, job in enumerate(jobs_data):
-            for task_id, task in enumerate(job):
-                machine = task[0]
-                assigned_jobs[machine].append(
-                    assigned_task_type(start=solver.Value(
-                        all_tasks[job_id, task_id].start),
-                                       job=job_id,
-                                       index=task_id,
-                                       duration=task[1]))
-
-        # Create per machine output lines.
-        output = ''
-        for machine in all_machines:
-            # Sort by starting time.
-            assigned_jobs[machine].sort()
-            for assigned_task in assigned_jobs[machine]:
-                start = assigned_task.start
-                duration = assigned_task.duration
-                # Add spaces to output to align columns.
-                op_info = {
-                    'Order':        None,
-                    'job_id':       assigned_task.job,
-                    'op_id':        assigned_task.index,
-                    'machine_id':   machine,
-                    'start_time':   start,
-                    'process_time': duration,
-                    'finish_time':  start + duration,
-                    'job_type':     None,
-                }
-                result.append(op_info)
+        if stats is not None:
+            stats['objective'] = solver.ObjectiveValue()
+            stats['wall_time'] = solver.WallTime()
+            stats['optimal'] = bool(status == cp_model.OPTIMAL)
+        # One row per operation, ordered by machine and start time.
+        with phase_profiler.phase('extract'):
+            if bulk or model_cache is not None:
+                starts = bulk_model.values(solver, start_indices)
+            else:
+                starts = bulk_model.values(
+                    solver, bulk_model.indices(all_tasks[key].start for key in keys))
+            schedule = _schedule(jobs_data, starts)
+        if result_cache is not None:
+            result_cache.put(instance, 'jsp_2', key_params, time_limit, seed,
+                             solver.ObjectiveValue(), status == cp_model.OPTIMAL,
+                             np.asarray(starts).tolist())
+        if as_schedule:
+            return schedule
+        result = schedule.to_op_infos()
     else:
         print('No solution found.')
     return result
 
+def tuning_run(params, file_name, time_limit):
+    # param_tuning run: makespan with the parameters params, None if no solution
+    bulk_vars = bulk_model.build_jsp(*bulk_model.jsp_arrays(load_instance(file_name)))
+    solver = cp_model.CpSolver()
+    param_tuning.apply_params(solver, dict(params, max_time_in_seconds=time_limit))
+    status = solver.Solve(bulk_vars.model)
+    if status == cp_model.OPTIMAL or status == cp_model.FEASIBLE:
+        return solver.ObjectiveValue()
+    return None
+
+def compare_builders(file_name, time_limit=10.0, num_workers=None):
+    # build and solve time of the CpModel API and the bulk builder
+    report = {}
+    for bulk in (False, True):
+        stats = {}
+        solve(file_name, time_limit=time_limit, num_workers=num_workers, stats=stats, bulk=bulk)
+        report['bulk' if bulk else 'api'] = stats
+        print('%s\t%s\tbuild %f\tsolve %f\t%s' %(
+            file_name, 'bulk' if bulk else 'api', stats['build_time'],
+            stats['solve_time'], stats.get('objective')))
+    return report
+
+def compare_tightening(file_names, time_limit=10.0, num_workers=None):
+    # [0, horizon] domains against the time windows, per instance
+    print('instance\tshrink\twall loose\twall tight\tspeedup\tobjective loose\tobjective tight')
+    report = {}
+    for file_name in file_names:
+        loose, tight = {}, {}
+        solve(file_name, time_limit=time_limit, num_workers=num_workers, stats=loose, tighten=False)
+        solve(file_name, time_limit=time_limit, num_workers=num_workers, stats=tight, tighten=True)
+        report[file_name] = (loose, tight)
+        loose_time = loose['build_time'] + loose['solve_time']
+        tight_time = tight['build_time'] + tight['solve_time']
+        print('%s\t%f\t%f\t%f\t%f\t%s\t%s' %(
+            file_name, tight['domain_shrink'], loose_time, tight_time, loose_time / tight_time,
+            loose.get('objective'), tight.get('objective')))
+    return report
+
+def lns_solve(file_name, time_limit=10.0, stats=None, **lns_options):
+    # same result as solve(), searched by lns_driver from an MWKR schedule
+    jobs_data = load_instance(file_name)
+    def build():
+        model, all_tasks, obj_var = build_model(jobs_data)
+        return (model,
+                {key: task.start for key, task in all_tasks.items()},
+                {key: task.end for key, task in all_tasks.items()},
+                None, obj_var)
+    jobs = dispatch_hint.jsp_alternatives(jobs_data)
+    tic = time.time()
+    schedule, history = lns_driver.lns(build, jobs, time_limit, **lns_options)
+    wall_time = time.time() - tic
+    print('%s\t%f\t%f\t%r' %(file_name, schedule.makespan, wall_time, False))
+    if stats is not None:
+        stats['objective'] = schedule.makespan
+        stats['wall_time'] = wall_time
+        stats['optimal'] = False
+        stats['history'] = history
+    return lns_driver.op_infos(schedule, jobs)
+
 
 if __name__ == '__main__':
     # file_name = 'instances/abz5'
@@ -150,4 +289,40 @@ if __name__ == '__main__':
     file_name = 'instances/abz5'
     time_limit = 6000
     out_dir = 'ortools_result_%d' %(time_limit)
-    result = solve(file_name, time_limit=time_limit)
+    result = solve(file_name, time_limit=time_limit, hint_rule='MWKR')
+
+    ### model build time of the CpModel API and the bulk builder
+    # for fn in ['ta71', 'ta80']:
+    #     compare_builders(os.path.join('instances', fn), time_limit=10)
+
+    ### time limit sweep, the model is built once
+    # import model_cache
+    # cache = model_cache.ModelCache('model_cache', max_bytes=1 << 30)
+    # for time_limit in [600, 6000]:
+    #     for fn in sorted(os.listdir('instances')):
+    #         solve(os.path.join('instances', fn), time_limit=time_limit, model_cache=cache)
+
+    ### batch run again: results of the same settings at once, shorter runs as hint
+    # import result_cache
+    # cache = result_cache.ResultCache('result_cache', max_bytes=1 << 28)
+    # for time_limit in [60, 600]:
+    #     for fn in sorted(os.listdir('instances')):
+    #         solve(os.path.join('instances', fn), time_limit=time_limit, result_cache=cache)
+
+    ### domain shrink and speedup of the time windows
+    # compare_tightening([os.path.join('instances', fn) for fn in sorted(os.listdir('instances'))],
+    #                    time_limit=60)
+
+    ### large neighbourhood search with the same budget
+    # result = lns_solve(file_name, time_limit=time_limit, initial_time=60,
+    #                    num_neighbourhoods=4, num_workers=2)
+
+    ### time to first solution with / without the dispatching hint
+    # jobs_data = load_instance(file_name)
+    # def build():
+    #     model, all_tasks, _ = build_model(jobs_data)
+    #     starts = {key: task.start for key, task in all_tasks.items()}
+    #     ends = {key: task.end for key, task in all_tasks.items()}
+    #     return model, starts, ends, None
+    # dispatch_hint.compare_first_solution(
+    #     build, dispatch_hint.jsp_alternatives(jobs_data), rule='MWKR')
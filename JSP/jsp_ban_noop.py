@@ -2,86 +2,35 @@
 import collections
 from ortools.sat.python import cp_model
 
+import os
 import sys
+import time
 import numpy as np
 
+import jsp_instance
 
-# def read_data(name):
-#   data = []
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import schedule_arrays
+import dispatch_hint
+import param_tuning
+import stop_policy
 
-#   with open(name) as f:
-#     while line := f.readline():
-#       if line[0] != '#':
-#         break
-#     n, m = [int(x) for x in line.split()]
-#     for i in range(n):
-#       line = f.readline()
-#       nums = [int(x) for x in line.split()]
-#       data.append(list())
-#       for j in range(m):
-#         data[i].append((nums[j * 2], nums[j * 2 + 1]))
-
-#   return data
 
 def read_data(filename):
-    data = []
-    
-    f = open(filename)
-    line = f.readline()
-    while line[0] == '#':
-        line = f.readline()
-    line = line.split()
-    num_job, num_machine = int(line[0]), int(line[1])
-
-    for i in range(num_job):
-        job_data = []
-        line = f.readline().split()
-        for j in range(num_machine):
-            machine_id, processing_time = int(line[j * 2]), int(line[j * 2 + 1])
-            # print('Machine', machine_id, 'processing_time:', processing_time)
-            job_data.append((machine_id, processing_time))
-        data.append(job_data)
-    return data
-
-
-def solve(file_name, time_limit=10.0):
-  """Minimal jobshop problem."""
+    return jsp_instance.load_jobs_data(filename)
 
-  # if len(sys.argv) == 2:
-  #   file_name = sys.argv[1]
-  # else:
-  #   print('No file name')
-  #   print(f'Usage: python {sys.argv[0]} file_name')
-  #   return
 
-  # Data
-  jobs_data = read_data(file_name)
+# Named tuple to store information about created variables.
+task_type = collections.namedtuple('task_type', 'start end interval')
 
-  machines_count = 1 + max(task[0] for job in jobs_data for task in job)
-  all_machines = range(machines_count)
-  # Compute horizon dynamically as the sum of all durations.
-  horizon = sum(task[1] for job in jobs_data for task in job)
+SUCCESSOR = 'successor'
+IDLE_INTERVAL = 'idle_interval'
 
-  # Create the model.
-  model = cp_model.CpModel()
 
-  # Named tuple to store information about created variables.
-  task_type = collections.namedtuple('task_type', 'start end interval')
-  # Named tuple to manipulate solution information.
-  assigned_task_type = collections.namedtuple('assigned_task_type',
-                                              'start job index duration')
-
-  # Create job intervals and add to the corresponding machine lists.
+def _add_tasks(model, jobs_data, horizon):
   all_tasks = {}
-  all_waits = {}
-  all_idles = {}
-  machine_to_intervals = collections.defaultdict(list)
-
   machine_to_tasks = collections.defaultdict(list)
-  machine_to_waits = collections.defaultdict(list)
-
   for job_id, job in enumerate(jobs_data):
-    pre_end = 0
     for task_id, task in enumerate(job):
       machine = task[0]
       duration = task[1]
@@ -92,21 +41,58 @@ def solve(file_name, time_limit=10.0):
                                           'interval' + suffix)
       all_tasks[job_id, task_id] = task_type(
           start=start_var, end=end_var, interval=interval_var)
-      machine_to_intervals[machine].append(interval_var)
-      machine_to_tasks[machine].append(all_tasks[job_id, task_id])
+      machine_to_tasks[machine].append((job_id, task_id))
+  return all_tasks, machine_to_tasks
+
+
+def _add_jobshop(model, jobs_data, horizon, all_tasks, machine_to_tasks):
+  # Create and add disjunctive constraints.
+  for machine in sorted(machine_to_tasks):
+    model.AddNoOverlap([all_tasks[key].interval for key in machine_to_tasks[machine]])
 
-      # Job wait
+  # Precedences inside a job.
+  for job_id, job in enumerate(jobs_data):
+    for task_id in range(len(job) - 1):
+      model.Add(all_tasks[job_id, task_id + 1].start >= all_tasks[job_id,
+                                                                  task_id].end)
+
+  # Makespan objective.
+  makespan_var = model.NewIntVar(0, horizon, 'makespan')
+  model.AddMaxEquality(makespan_var, [
+      all_tasks[job_id, len(job) - 1].end
+      for job_id, job in enumerate(jobs_data)
+  ])
+  model.Minimize(makespan_var)
+  return makespan_var
+
+
+def build_idle_interval_model(jobs_data):
+  """One idle interval per circuit arc, kept apart from every wait interval.
+
+  (n + 1)^2 arcs per machine with five variables each, and one AddNoOverlap
+  per arc and operation on the machine; only small instances build fast.
+  """
+  # Compute horizon dynamically as the sum of all durations.
+  horizon = sum(task[1] for job in jobs_data for task in job)
+  model = cp_model.CpModel()
+  all_tasks, machine_to_tasks = _add_tasks(model, jobs_data, horizon)
+
+  # Job wait
+  machine_to_waits = collections.defaultdict(list)
+  for job_id, job in enumerate(jobs_data):
+    pre_end = 0
+    for task_id, task in enumerate(job):
+      suffix = f'_{job_id}_{task_id}'
       wait_time = model.NewIntVar(0, horizon, 'wait time' + suffix)
-      wait = model.NewIntervalVar(pre_end, wait_time, start_var,
-                                  'wait' + suffix)
-      machine_to_waits[machine].append(wait)
-      all_waits[job_id, task_id] = task_type(
-          start=pre_end, end=start_var, interval=wait)
-      pre_end = end_var
+      wait = model.NewIntervalVar(pre_end, wait_time,
+                                  all_tasks[job_id, task_id].start, 'wait' + suffix)
+      machine_to_waits[task[0]].append(wait)
+      pre_end = all_tasks[job_id, task_id].end
 
   # Create no-op constraints.
-  for machine in all_machines:
-    num = len(machine_to_tasks[machine])
+  for machine in sorted(machine_to_tasks):
+    machine_tasks = [all_tasks[key] for key in machine_to_tasks[machine]]
+    num = len(machine_tasks)
     arcs = []
     for j1 in range(num + 1):
       for j2 in range(num + 1):
@@ -116,15 +102,13 @@ def solve(file_name, time_limit=10.0):
         arcs.append([j1, j2, lit])
         if j2 == 0:
           continue
-        j1_end = machine_to_tasks[machine][j1 - 1].end if j1 > 0 else 0
-        j2_start = machine_to_tasks[machine][j2 - 1].start
+        j1_end = machine_tasks[j1 - 1].end if j1 > 0 else 0
+        j2_start = machine_tasks[j2 - 1].start
         idle_time = model.NewIntVar(0, horizon, f'idle_{j1}_{j2} on {machine}')
         start = model.NewIntVar(0, horizon, f'start_{j1}_{j2} on {machine}')
         end = model.NewIntVar(0, horizon, f'end_{j1}_{j2} on {machine}')
         idle = model.NewIntervalVar(start, idle_time, end,
                                     f'idle_{j1}_{j2} on {machine}')
-        all_idles[machine, j1, j2] = task_type(
-            start=start, end=end, interval=idle)
         tmp_start = model.NewIntVar(0, horizon,
                                     f'tmp_start_{j1}_{j2} on {machine}')
         tmp_end = model.NewIntVar(0, horizon, f'tmp_end_{j1}_{j2} on {machine}')
@@ -143,33 +127,174 @@ def solve(file_name, time_limit=10.0):
           model.AddNoOverlap([idle, wait])
     model.AddCircuit(arcs)
 
-  # Create and add disjunctive constraints.
-  for machine in all_machines:
-    model.AddNoOverlap(machine_to_intervals[machine])
+  makespan_var = _add_jobshop(model, jobs_data, horizon, all_tasks, machine_to_tasks)
+  return model, all_tasks, makespan_var
 
-  # Precedences inside a job.
-  for job_id, job in enumerate(jobs_data):
-    for task_id in range(len(job) - 1):
-      model.Add(all_tasks[job_id, task_id + 1].start >= all_tasks[job_id,
-                                                                  task_id].end)
 
-  # Makespan objective.
-  makespan_var = model.NewIntVar(0, horizon, 'makespan')
-  model.AddMaxEquality(makespan_var, [
-      all_tasks[job_id, len(job) - 1].end
-      for job_id, job in enumerate(jobs_data)
-  ])
+def build_successor_model(jobs_data):
+  """Same schedules as build_idle_interval_model, O(n^2) literals per machine.
+
+  A machine may only idle while no operation on it waits, i.e. an operation
+  that starts after it is ready must find the machine busy without a gap
+  from its ready time on. Every operation k gets the end of its machine
+  predecessor pred_end_k and the start block_k of the busy block it ends;
+  one circuit literal per ordered pair hands them down the sequence.
+  """
+  horizon = sum(task[1] for job in jobs_data for task in job)
+  model = cp_model.CpModel()
+  all_tasks, machine_to_tasks = _add_tasks(model, jobs_data, horizon)
+
+  for machine in sorted(machine_to_tasks):
+    keys = machine_to_tasks[machine]
+    pred_end, pred_block, block = [], [], []
+    for job_id, task_id in keys:
+      suffix = f'_{job_id}_{task_id}'
+      pred_end.append(model.NewIntVar(0, horizon, 'pred_end' + suffix))
+      pred_block.append(model.NewIntVar(0, horizon, 'pred_block' + suffix))
+      block.append(model.NewIntVar(0, horizon, 'block' + suffix))
+
+    # Node 0 is the start and the end of the machine sequence.
+    arcs = []
+    for k, key in enumerate(keys):
+      lit = model.NewBoolVar(f'{key} first on {machine}')
+      arcs.append([0, k + 1, lit])
+      model.Add(pred_end[k] == 0).OnlyEnforceIf(lit)
+      model.Add(pred_block[k] == 0).OnlyEnforceIf(lit)
+      arcs.append([k + 1, 0, model.NewBoolVar(f'{key} last on {machine}')])
+      for i, pred in enumerate(keys):
+        if i == k:
+          continue
+        lit = model.NewBoolVar(f'{key} follows {pred} on {machine}')
+        arcs.append([i + 1, k + 1, lit])
+        model.Add(all_tasks[key].start >= all_tasks[pred].end).OnlyEnforceIf(lit)
+        model.Add(pred_end[k] == all_tasks[pred].end).OnlyEnforceIf(lit)
+        model.Add(pred_block[k] == block[i]).OnlyEnforceIf(lit)
+    model.AddCircuit(arcs)
+
+    for k, (job_id, task_id) in enumerate(keys):
+      suffix = f'_{job_id}_{task_id}'
+      start = all_tasks[job_id, task_id].start
+      ready = all_tasks[job_id, task_id - 1].end if task_id > 0 else 0
+      contiguous = model.NewBoolVar('contiguous' + suffix)
+      model.Add(start == pred_end[k]).OnlyEnforceIf(contiguous)
+      model.Add(block[k] == pred_block[k]).OnlyEnforceIf(contiguous)
+      model.Add(start > pred_end[k]).OnlyEnforceIf(contiguous.Not())
+      model.Add(block[k] == start).OnlyEnforceIf(contiguous.Not())
+      # No wait without the machine busy since the ready time.
+      waited = model.NewBoolVar('waited' + suffix)
+      model.Add(start <= ready).OnlyEnforceIf(waited.Not())
+      model.AddImplication(waited, contiguous)
+      model.Add(pred_block[k] <= ready).OnlyEnforceIf(waited)
+
+  makespan_var = _add_jobshop(model, jobs_data, horizon, all_tasks, machine_to_tasks)
+  return model, all_tasks, makespan_var
+
+
+FORMULATIONS = {
+    SUCCESSOR: build_successor_model,
+    IDLE_INTERVAL: build_idle_interval_model,
+}
+
+
+def model_size(model):
+  proto = model.Proto()
+  return len(proto.variables), len(proto.constraints)
 
-  obj_var = makespan_var
-  model.Minimize(obj_var)
+
+def compare_formulations(file_name, formulations=(SUCCESSOR, IDLE_INTERVAL)):
+  """Model size and build time of the formulations on one instance."""
+  jobs_data = read_data(file_name)
+  report = {}
+  for formulation in formulations:
+    tic = time.time()
+    model, _, _ = FORMULATIONS[formulation](jobs_data)
+    build_time = time.time() - tic
+    num_vars, num_constraints = model_size(model)
+    report[formulation] = {
+        'num_vars': num_vars,
+        'num_constraints': num_constraints,
+        'build_time': build_time,
+    }
+    print(f'{os.path.basename(file_name)}\t{formulation}\t{num_vars}\t'
+          f'{num_constraints}\t{build_time:f}')
+  return report
+
+
+def build_cached(model_cache, file_name, jobs_data, formulation):
+  """FORMULATIONS[formulation](jobs_data) through a model_cache.ModelCache."""
+  def build():
+    model, all_tasks, _ = FORMULATIONS[formulation](jobs_data)
+    keys = sorted(all_tasks)
+    return model, {
+        'keys': keys,
+        'starts': [all_tasks[key].start.Index() for key in keys],
+        'ends': [all_tasks[key].end.Index() for key in keys],
+    }
+  model, index_maps = model_cache.get_or_build(
+      file_name, 'jsp_ban_noop', {'formulation': formulation}, build)
+  all_tasks = {}
+  for key, start, end in zip(index_maps['keys'], index_maps['starts'], index_maps['ends']):
+    all_tasks[tuple(key)] = task_type(start=model.GetIntVarFromProtoIndex(start),
+                                      end=model.GetIntVarFromProtoIndex(end),
+                                      interval=None)
+  return model, all_tasks
+
+
+def add_dispatch_hint(model, jobs_data, all_tasks, rule='MWKR'):
+  # Dispatching builds non-delay schedules, which never idle a machine
+  # while an operation waits for it, so the hint is always feasible.
+  schedule = dispatch_hint.dispatch(dispatch_hint.jsp_alternatives(jobs_data), rule)
+  dispatch_hint.add_hint(
+      model, schedule,
+      {key: task.start for key, task in all_tasks.items()},
+      {key: task.end for key, task in all_tasks.items()})
+  return schedule
+
+
+def solve(file_name, time_limit=10.0, num_workers=None, stats=None, as_schedule=False,
+          formulation=SUCCESSOR, hint_rule='MWKR', model_cache=None, stop=None,
+          params=None):
+  """Minimal jobshop problem."""
+
+  # if len(sys.argv) == 2:
+  #   file_name = sys.argv[1]
+  # else:
+  #   print('No file name')
+  #   print(f'Usage: python {sys.argv[0]} file_name')
+  #   return
+
+  # Data
+  jobs_data = read_data(file_name)
+
+  machines_count = 1 + max(task[0] for job in jobs_data for task in job)
+  all_machines = range(machines_count)
+
+  # Named tuple to manipulate solution information.
+  assigned_task_type = collections.namedtuple('assigned_task_type',
+                                              'start job index duration')
+
+  # Create the model.
+  if model_cache is not None:
+    model, all_tasks = build_cached(model_cache, file_name, jobs_data, formulation)
+  else:
+    model, all_tasks, _ = FORMULATIONS[formulation](jobs_data)
+  if hint_rule is not None:
+    add_dispatch_hint(model, jobs_data, all_tasks, hint_rule)
 
   # Create the solver and solve.
   solver = cp_model.CpSolver()
-  solver.parameters.max_time_in_seconds = time_limit
-  status = solver.Solve(model)
+  param_tuning.apply_profile(solver, 'jsp', params=params, max_time_in_seconds=time_limit,
+                             num_workers=num_workers)
+  status = stop_policy.solve(solver, model, stop)
+  if stats is not None:
+    stats['stop_reason'] = stop_policy.reason(stop, status)
 
   if status == cp_model.OPTIMAL or status == cp_model.FEASIBLE:
     print('Solution:')
+    if stats is not None:
+      stats['objective'] = solver.ObjectiveValue()
+      stats['wall_time'] = solver.WallTime()
+      stats['optimal'] = bool(status == cp_model.OPTIMAL)
     # Create on elist of assigned tasks per machine.
     assigned_jobs = collections.defaultdict(list)
     for job_id, job in enumerate(jobs_data):
@@ -193,7 +318,7 @@ def solve(file_name, time_limit=10.0):
       idle_line = ' idle '
       wait_line = ' wait '
 
-      j1 = 0
+      pre_end = 0
       for assigned_task in assigned_jobs[machine]:
         op_info = {
                 'Order':        None,
@@ -218,27 +343,15 @@ def solve(file_name, time_limit=10.0):
         sol_line += f'{sol_tmp:15s}'
 
         # idle
-        j2 = assigned_task.job + 1
-        item = all_idles[machine, j1, j2]
-        start = item.start
-        if type(start) != int:
-          start = solver.Value(start)
-        end = item.end
-        if type(end) != int:
-          end = solver.Value(end)
-        idle_tmp = f'[{start},{end}]'
+        idle_tmp = f'[{pre_end},{start}]' if pre_end != start else '[0,0]'
         idle_line += f'{idle_tmp:15s}'
-        j1 = j2
+        pre_end = start + duration
 
         # wait
-        item = all_waits[assigned_task.job, assigned_task.index]
-        start = item.start
-        if type(start) != int:
-          start = solver.Value(start)
-        end = item.end
-        if type(end) != int:
-          end = solver.Value(end)
-        wait_tmp = f'[{start},{end}]'
+        ready = 0
+        if assigned_task.index > 0:
+          ready = solver.Value(all_tasks[assigned_task.job, assigned_task.index - 1].end)
+        wait_tmp = f'[{ready},{start}]'
         wait_line += f'{wait_tmp:15s}'
 
       sol_line += '\n'
@@ -253,6 +366,8 @@ def solve(file_name, time_limit=10.0):
     # Finally print the solution found.
     print(f'Optimal Schedule Objective: {solver.ObjectiveValue()}')
     print(output)
+    if as_schedule:
+      return schedule_arrays.Schedule.from_op_infos(result)
     return result
 
   else:
@@ -285,6 +400,12 @@ if __name__ == '__main__':
     # with open(out_file, 'w') as f:
     #     json.dump(result, f, indent=4)
 
+    ### model size and build time of both formulations
+    # jsp_instance_dir = '../instances'
+    # print('instance\tformulation\tvars\tconstraints\tbuild time')
+    # for fn in sorted(os.listdir(jsp_instance_dir)):
+    #     compare_formulations(os.path.join(jsp_instance_dir, fn))
+
     ### run all
     jsp_instance_dir = '../instances'
     time_limit = 60
@@ -0,0 +1,115 @@
+import os
+import json
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import jsp_2
+import jsp_ban_noop
+import phase_profiler
+import stop_policy
+
+SOLVERS = {
+    'jsp_2':        jsp_2.solve,
+    'jsp_ban_noop': jsp_ban_noop.solve,
+}
+
+def instance_size(file_name):
+    # number of operations, read from the "num_job num_machine" header line
+    with open(file_name) as f:
+        for line in f:
+            if line[0] == '#' or not line.strip():
+                continue
+            num_job, num_machine = line.split()[:2]
+            return int(num_job) * int(num_machine)
+    return 0
+
+def pending_instances(jsp_instance_dir, out_dir):
+    # instances without a result in out_dir, largest first so that the long
+    # solves start early and the small ones fill the remaining slots
+    done = set(os.path.splitext(fn)[0] for fn in os.listdir(out_dir))
+    queue = []
+    for fn in os.listdir(jsp_instance_dir):
+        if fn in done:
+            continue
+        file_name = os.path.join(jsp_instance_dir, fn)
+        queue.append((instance_size(file_name), fn))
+    queue.sort(key=lambda item: (-item[0], item[1]))
+    return [fn for _, fn in queue]
+
+def split_cores(num_workers, num_cores=None):
+    # each concurrent solve gets num_workers CP-SAT workers
+    if num_cores is None:
+        num_cores = os.cpu_count() or 1
+    num_workers = max(1, min(num_workers, num_cores))
+    return num_cores // num_workers, num_workers
+
+def _solve_instance(solver_name, file_name, time_limit, num_workers, stop_options=None,
+                    profile_log=None):
+    # stop_options: StopPolicy arguments, the policy itself is made in the worker
+    stats = {}
+    stop = stop_policy.StopPolicy(**stop_options) if stop_options is not None else None
+    # the phases of each instance are a run of their own in profile_log; a
+    # worker solves several instances, peak_growth_mb is the one of this one
+    with phase_profiler.profile(os.path.basename(file_name), profile_log):
+        result = SOLVERS[solver_name](file_name, time_limit=time_limit,
+                                      num_workers=num_workers, stats=stats, stop=stop)
+    return file_name, result, stats
+
+def run_batch(jsp_instance_dir, out_dir, log_file, time_limit,
+              num_workers=8, num_cores=None, solver_name='jsp_2', stop_options=None,
+              profile_log=None):
+    if not os.path.exists(out_dir):
+        os.makedirs(out_dir)
+    queue = pending_instances(jsp_instance_dir, out_dir)
+    num_processes, num_workers = split_cores(num_workers, num_cores)
+    print('%d instances left, %d processes x %d workers' %(
+        len(queue), num_processes, num_workers))
+
+    # spawned workers: a forked one would report the parent's peak RSS
+    with ProcessPoolExecutor(max_workers=num_processes,
+                             mp_context=multiprocessing.get_context('spawn')) as executor, \
+            open(log_file, 'a') as log:
+        futures = {
+            executor.submit(_solve_instance, solver_name,
+                            os.path.join(jsp_instance_dir, fn), time_limit, num_workers,
+                            stop_options, profile_log): fn
+            for fn in queue
+        }
+        for future in as_completed(futures):
+            try:
+                file_name, result, stats = future.result()
+            except Exception as e:
+                print('%s failed: %r' %(futures[future], e))
+                continue
+            if 'objective' not in stats:
+                # no solution found, leave it for the next run
+                continue
+            out_file = os.path.join(out_dir, os.path.basename(file_name)+'.json')
+            with phase_profiler.phase('write'):
+                with open(out_file, 'w') as f:
+                    json.dump(result, f, indent=4)
+            log.write('%s\t%f\t%f\t%r\t%s\n' %(
+                file_name, stats['objective'], stats['wall_time'], stats['optimal'],
+                stats['stop_reason']))
+            log.flush()
+
+
+if __name__ == '__main__':
+    jsp_instance_dir = 'instances'
+    time_limit = 6000
+    out_dir = 'ortools_result_%d' %(time_limit)
+    log_file = 'jsp_log_%d.txt' %(time_limit)
+    profile_log = 'jsp_phases_%d.jsonl' %(time_limit)
+    # stop after 10 minutes without a better makespan
+    # 'batch', not 'total', the instances have a total of their own
+    with phase_profiler.profile('jsp_batch', profile_log, total_phase='batch'):
+        run_batch(jsp_instance_dir, out_dir, log_file, time_limit, num_workers=8,
+                  stop_options={'stall_time': 600}, profile_log=profile_log)
+    phase_profiler.print_summary(phase_profiler.load(profile_log))
+
+    ### ban noop
+    # time_limit = 60
+    # out_dir = 'ortools_result_ban_noop_%d' %(time_limit)
+    # log_file = 'jsp_ban_noop_log_%d.txt' %(time_limit)
+    # run_batch(jsp_instance_dir, out_dir, log_file, time_limit,
+    #           num_workers=8, solver_name='jsp_ban_noop')
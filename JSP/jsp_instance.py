@@ -0,0 +1,112 @@
+"""Job shop instance files (OR-Library and Taillard formats).
+
+A file is read at once and every instance in it becomes a jsp_instance
+with (num_job, num_op) int arrays of machine ids and processing times:
+
+- OR-Library: "num_job num_machine", then one line per job of
+  "machine duration" pairs; comment lines start with '#' or are text,
+  several instances may follow each other ("instance abz5" names them)
+- Taillard: "num_job num_machine ...", a "Times" matrix, a "Machines"
+  matrix with machines numbered from 1
+"""
+import os
+import collections
+import numpy as np
+
+jsp_instance = collections.namedtuple('jsp_instance', 'name machines durations comments')
+
+def _is_numeric(line):
+    token = line.split(None, 1)[0]
+    return token.lstrip('-').isdigit()
+
+def _next_line(lines, i):
+    while i < len(lines) and not lines[i].strip():
+        i += 1
+    return i
+
+def _matrix(lines, i, num_rows):
+    # the next num_rows non-empty lines as one int array
+    rows = []
+    while len(rows) < num_rows:
+        i = _next_line(lines, i)
+        if i >= len(lines):
+            raise ValueError('expected %d rows, file ends after %d' %(num_rows, len(rows)))
+        rows.append(lines[i])
+        i += 1
+    values = np.array(' '.join(rows).split(), dtype=np.int64)
+    return values.reshape(num_rows, -1), i
+
+def parse(text, name=None):
+    instances = []
+    lines = text.splitlines()
+    comments = []
+    instance_name = None
+    i = 0
+    while i < len(lines):
+        line = lines[i].strip()
+        i += 1
+        if not line:
+            continue
+        if not _is_numeric(line):
+            comment = line.lstrip('#').strip()
+            if comment.startswith('instance '):
+                instance_name = comment.split()[1]
+            if comment.strip('+-= '):
+                comments.append(comment)
+            continue
+
+        header = line.split()
+        num_job, num_machine = int(header[0]), int(header[1])
+        j = _next_line(lines, i)
+        if j < len(lines) and lines[j].strip().lower().startswith('times'):
+            durations, i = _matrix(lines, j + 1, num_job)
+            j = _next_line(lines, i)
+            if j >= len(lines) or not lines[j].strip().lower().startswith('machines'):
+                raise ValueError('Taillard instance without a Machines matrix')
+            machines, i = _matrix(lines, j + 1, num_job)
+            machines = machines - 1
+        else:
+            rows, i = _matrix(lines, i, num_job)
+            machines, durations = rows[:, 0::2], rows[:, 1::2]
+        if machines.shape != (num_job, num_machine) or durations.shape != machines.shape:
+            raise ValueError('expected %d x %d operations, got %r' %(
+                num_job, num_machine, machines.shape))
+        instances.append(jsp_instance(instance_name or name, machines, durations, comments))
+        comments = []
+        instance_name = None
+    return instances
+
+def load_all(path):
+    with open(path) as f:
+        text = f.read()
+    return parse(text, name=os.path.basename(path))
+
+def load(path):
+    instances = load_all(path)
+    if not instances:
+        raise ValueError('no instance in %s' %(path))
+    return instances[0]
+
+def to_jobs_data(instance):
+    # [[(machine_id, processing_time), ...], ...] as the CP-SAT models take it
+    return [list(zip(machines, durations)) for machines, durations in
+            zip(instance.machines.tolist(), instance.durations.tolist())]
+
+def load_jobs_data(path):
+    return to_jobs_data(load(path))
+
+def iter_instances(jsp_instance_dir):
+    # lazily, file by file in name order; files without an instance are skipped
+    for fn in sorted(os.listdir(jsp_instance_dir)):
+        path = os.path.join(jsp_instance_dir, fn)
+        if not os.path.isfile(path):
+            continue
+        for instance in load_all(path):
+            yield instance
+
+
+if __name__ == '__main__':
+    import time
+    tic = time.time()
+    instances = list(iter_instances('instances'))
+    print('%d instances in %f s' %(len(instances), time.time() - tic))
@@ -0,0 +1,246 @@
+"""Rolling-horizon scheduling of a stream of job arrivals.
+
+Jobs arrive over time (dynamic_job, as DJSP_Logger.add_job takes them, with
+their operations as (machine_id, processing_time) pairs). Every arrival is
+a decision epoch: the operations of the current plan that have started by
+then are frozen and committed to the logger, and only the operations not
+started yet are re-optimized, with the previous plan as hint. Each re-solve
+is bounded by time_limit; with window set, operations planned later than
+now + window keep their machine order, which keeps the open part small.
+
+    scheduler = RollingHorizonScheduler(time_limit=1.0)
+    for job in jobs:
+        scheduler.add_job(job, now=job.arrival_time)
+    scheduler.finish()
+    scheduler.logger.save(json_out_file)
+"""
+import os
+import sys
+import time
+import random
+import collections
+import numpy as np
+from ortools.sat.python import cp_model
+
+from djsp_logger import DJSP_Logger
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import stop_policy
+
+MAKESPAN = 'makespan'
+TARDINESS = 'tardiness'
+OBJECTIVES = (MAKESPAN, TARDINESS)
+
+dynamic_job = collections.namedtuple(
+    'dynamic_job', 'job_id arrival_time due_date job_type DDT ops')
+# the op format of DJSP_Logger.add_op
+started_op = collections.namedtuple(
+    'started_op', 'job_id op_id selected_machine_id start_time process_times finish_time')
+epoch_info = collections.namedtuple(
+    'epoch_info', 'now num_frozen num_open status objective latency')
+
+def random_arrivals(jobs_data, mean_interarrival, DDT=1.5, seed=0):
+    # jobs_data jobs arriving one after another, due DDT times their work after arrival
+    rng = random.Random(seed)
+    jobs = []
+    arrival_time = 0
+    for job_id, ops in enumerate(jobs_data):
+        work = sum(duration for _, duration in ops)
+        jobs.append(dynamic_job(job_id, arrival_time, arrival_time + int(DDT * work),
+                                None, DDT, list(ops)))
+        arrival_time += int(round(rng.expovariate(1.0 / mean_interarrival)))
+    return jobs
+
+
+class RollingHorizonScheduler(object):
+    def __init__(self, time_limit=1.0, num_workers=None, objective=MAKESPAN,
+                 window=None, logger=None, stop=None):
+        if objective not in OBJECTIVES:
+            raise ValueError('unknown objective %r' %(objective))
+        self.time_limit = time_limit
+        self.num_workers = num_workers
+        self.objective = objective
+        self.window = window
+        # StopPolicy of every re-solve, e.g. a stall time well below time_limit
+        self.stop = stop
+        self.logger = logger if logger is not None else DJSP_Logger()
+        self.jobs = {}
+        # (job_id, op_id) -> start time in the current plan
+        self.plan = {}
+        self.frozen = set()
+        self.now = 0
+        self.epochs = []
+
+    def _duration(self, key):
+        job_id, op_id = key
+        return self.jobs[job_id].ops[op_id][1]
+
+    def _machine(self, key):
+        job_id, op_id = key
+        return self.jobs[job_id].ops[op_id][0]
+
+    def _freeze(self, now):
+        # operations of the plan started before now cannot move any more
+        for key in sorted(self.plan, key=lambda key: self.plan[key]):
+            if key in self.frozen or self.plan[key] >= now:
+                continue
+            self.frozen.add(key)
+            job_id, op_id = key
+            machine_id = self._machine(key)
+            start = self.plan[key]
+            duration = self._duration(key)
+            self.logger.add_op(started_op(job_id, op_id, machine_id, start,
+                                          {machine_id: duration}, start + duration))
+
+    def _open_ops(self):
+        return [(job_id, op_id) for job_id, job in self.jobs.items()
+                for op_id in range(len(job.ops)) if (job_id, op_id) not in self.frozen]
+
+    def _greedy_plan(self, now, open_ops):
+        # the open operations appended in the order of the previous plan,
+        # new jobs last; always feasible, so it is the hint and the fallback
+        machine_free = collections.defaultdict(lambda: now)
+        job_ready = {}
+        for key in self.frozen:
+            finish = self.plan[key] + self._duration(key)
+            machine = self._machine(key)
+            machine_free[machine] = max(machine_free[machine], finish)
+            job_ready[key[0]] = max(job_ready.get(key[0], 0), finish)
+        order = sorted(open_ops, key=lambda key: (
+            self.plan.get(key, float('inf')), self.jobs[key[0]].arrival_time, key))
+        # keep the job order inside the sort
+        pending = collections.deque(order)
+        plan = {}
+        while pending:
+            key = pending.popleft()
+            job_id, op_id = key
+            if op_id > 0 and (job_id, op_id - 1) not in plan and (job_id, op_id - 1) not in self.frozen:
+                pending.append(key)
+                continue
+            machine = self._machine(key)
+            start = max(now, self.jobs[job_id].arrival_time, machine_free[machine],
+                        job_ready.get(job_id, 0))
+            plan[key] = start
+            machine_free[machine] = start + self._duration(key)
+            job_ready[job_id] = start + self._duration(key)
+        return plan
+
+    def _build(self, now, open_ops, hint):
+        model = cp_model.CpModel()
+        horizon = max([now] + [self.plan[key] + self._duration(key) for key in self.frozen]) + \
+            sum(self._duration(key) for key in open_ops)
+        starts, ends = {}, {}
+        machine_to_intervals = collections.defaultdict(list)
+        for key in self.frozen:
+            start = self.plan[key]
+            starts[key] = start
+            ends[key] = start + self._duration(key)
+            # only the frozen operations still running matter
+            if ends[key] > now:
+                machine_to_intervals[self._machine(key)].append(model.NewFixedSizeIntervalVar(
+                    start, self._duration(key), 'frozen_%d_%d' %(key)))
+        for key in open_ops:
+            job_id, op_id = key
+            earliest = max(now, self.jobs[job_id].arrival_time)
+            suffix = '_%d_%d' %(key)
+            starts[key] = model.NewIntVar(earliest, horizon, 'start' + suffix)
+            ends[key] = model.NewIntVar(earliest, horizon, 'end' + suffix)
+            machine_to_intervals[self._machine(key)].append(model.NewIntervalVar(
+                starts[key], self._duration(key), ends[key], 'interval' + suffix))
+            model.AddHint(starts[key], hint[key])
+            model.AddHint(ends[key], hint[key] + self._duration(key))
+        for intervals in machine_to_intervals.values():
+            model.AddNoOverlap(intervals)
+        for job_id, op_id in open_ops:
+            if op_id > 0:
+                model.Add(starts[job_id, op_id] >= ends[job_id, op_id - 1])
+
+        if self.window is not None:
+            # beyond the window the previous machine order is kept
+            late = [key for key in open_ops if key in self.plan and self.plan[key] >= now + self.window]
+            late.sort(key=lambda key: self.plan[key])
+            last_on_machine = {}
+            for key in late:
+                machine = self._machine(key)
+                if machine in last_on_machine:
+                    model.Add(ends[last_on_machine[machine]] <= starts[key])
+                last_on_machine[machine] = key
+
+        last_ends = [ends[job_id, len(job.ops) - 1] for job_id, job in self.jobs.items()]
+        if self.objective == MAKESPAN:
+            makespan = model.NewIntVar(0, horizon, 'makespan')
+            model.AddMaxEquality(makespan, last_ends)
+            model.Minimize(makespan)
+        else:
+            tardiness = []
+            for job_id, job in self.jobs.items():
+                var = model.NewIntVar(0, horizon, 'tardiness_%d' %(job_id))
+                model.Add(var >= ends[job_id, len(job.ops) - 1] - job.due_date)
+                tardiness.append(var)
+            model.Minimize(sum(tardiness))
+        return model, starts
+
+    def reoptimize(self, now):
+        tic = time.time()
+        self.now = max(self.now, now)
+        self._freeze(self.now)
+        open_ops = self._open_ops()
+        hint = self._greedy_plan(self.now, open_ops)
+        status_name, objective = 'GREEDY', None
+        if open_ops:
+            model, starts = self._build(self.now, open_ops, hint)
+            solver = cp_model.CpSolver()
+            solver.parameters.max_time_in_seconds = self.time_limit
+            if self.num_workers is not None:
+                solver.parameters.num_workers = self.num_workers
+            status = stop_policy.solve(solver, model, self.stop)
+            if status == cp_model.OPTIMAL or status == cp_model.FEASIBLE:
+                hint = {key: solver.Value(starts[key]) for key in open_ops}
+                status_name, objective = solver.StatusName(status), solver.ObjectiveValue()
+        self.plan.update(hint)
+        self.epochs.append(epoch_info(self.now, len(self.frozen), len(open_ops),
+                                      status_name, objective, time.time() - tic))
+        return self.epochs[-1]
+
+    def add_job(self, job, now=None):
+        # one decision epoch per arrival
+        self.jobs[job.job_id] = job
+        self.logger.add_job(job)
+        return self.reoptimize(job.arrival_time if now is None else now)
+
+    def makespan(self):
+        return max(self.plan[key] + self._duration(key) for key in self.plan)
+
+    def total_tardiness(self):
+        return sum(max(0, self.plan[job_id, len(job.ops) - 1] + job.ops[-1][1] - job.due_date)
+                   for job_id, job in self.jobs.items())
+
+    def finish(self):
+        # commit the rest of the plan
+        self._freeze(float('inf'))
+        return self.makespan()
+
+
+if __name__ == '__main__':
+    import jsp_instance
+
+    in_file = 'la11'
+    jsp_instance_dir = 'instances'
+    time_limit = 1.0
+    out_dir = 'rolling_horizon_result'
+    if not os.path.exists(out_dir):
+        os.mkdir(out_dir)
+    jobs_data = jsp_instance.load_jobs_data(os.path.join(jsp_instance_dir, in_file))
+    jobs = random_arrivals(jobs_data, mean_interarrival=30, seed=0)
+
+    scheduler = RollingHorizonScheduler(time_limit=time_limit, objective=TARDINESS, window=200)
+    print('now\tfrozen\topen\tstatus\tobjective\tlatency')
+    for job in jobs:
+        epoch = scheduler.add_job(job)
+        print('%d\t%d\t%d\t%s\t%s\t%f' %(epoch.now, epoch.num_frozen, epoch.num_open,
+                                        epoch.status, epoch.objective, epoch.latency))
+    makespan = scheduler.finish()
+    latencies = np.array([epoch.latency for epoch in scheduler.epochs])
+    print('makespan %d, total tardiness %d, latency max %f mean %f' %(
+        makespan, scheduler.total_tardiness(), latencies.max(), latencies.mean()))
+    scheduler.logger.save(os.path.join(out_dir, in_file + '.json'))
@@ -1,14 +1,20 @@
 """OR-Tools solution to the N-queens problem."""
+import os
 import sys
 import time
 from ortools.sat.python import cp_model
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import progress_recorder
 
-class NQueenSolutionPrinter(cp_model.CpSolverSolutionCallback):
-    """Print intermediate solutions."""
 
-    def __init__(self, queens):
-        cp_model.CpSolverSolutionCallback.__init__(self)
+class NQueenSolutionPrinter(progress_recorder.ProgressRecorder):
+    """Print intermediate solutions, and record them if progress_file is set."""
+
+    def __init__(self, queens, progress_file=None, run_id=None):
+        # every enumerated solution, none of them improves on another
+        progress_recorder.ProgressRecorder.__init__(self, progress_file, run_id,
+                                                    improving_only=False)
         self.__queens = queens
         self.__solution_count = 0
         self.__start_time = time.time()
@@ -16,7 +22,7 @@ class NQueenSolutionPrinter(cp_model.CpSolverSolutionCallback):
     def solution_count(self):
         return self.__solution_count
 
-    def on_solution_callback(self):
+    def record(self, callback):
         current_time = time.time()
         print('Solution %i, time = %f s' %
               (self.__solution_count, current_time - self.__start_time))
@@ -25,17 +31,18 @@ class NQueenSolutionPrinter(cp_model.CpSolverSolutionCallback):
         all_queens = range(len(self.__queens))
         for i in all_queens:
             for j in all_queens:
-                if self.Value(self.__queens[j]) == i:
+                if callback.Value(self.__queens[j]) == i:
                     # There is a queen in column j, row i.
                     print('Q', end=' ')
                 else:
                     print('_', end=' ')
             print()
         print()
+        progress_recorder.ProgressRecorder.record(self, callback)
 
 
 
-def main(board_size, time_limit=10):
+def main(board_size, time_limit=10, progress_file=None):
     # Creates the solver.
     model = cp_model.CpModel()
 
@@ -60,10 +67,11 @@ def main(board_size, time_limit=10):
 
     # Solve the model.
     solver = cp_model.CpSolver()
-    solution_printer = NQueenSolutionPrinter(queens)
+    solution_printer = NQueenSolutionPrinter(queens, progress_file)
     solver.parameters.enumerate_all_solutions = True
     solver.parameters.max_time_in_seconds = time_limit
     status = solver.Solve(model, solution_printer)
+    solution_printer.close()
     print('status:', status)
 
     # Statistics.
@@ -1,42 +1,51 @@
+import os
+import sys
 from ortools.sat.python import cp_model
 
-def set_cover(universe, time_limit):
-    model = cp_model.CpModel()
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import phase_profiler
+import stop_policy
 
-    # 定义变量
-    num_subsets = len(universe)
-    num_elements = len(universe[0])
-    subsets = [model.NewBoolVar(f'subset{i}') for i in range(num_subsets)]
-    elements_covered = [model.NewBoolVar(f'element{i}') for i in range(num_elements)]
+def set_cover(universe, time_limit, stop=None):
+    with phase_profiler.phase('build'):
+        model = cp_model.CpModel()
 
-    # 定义约束条件
-    for j in range(num_elements):
-        model.Add(sum([subsets[i] * universe[i][j] for i in range(num_subsets)]) >= elements_covered[j])
+        # 定义变量
+        num_subsets = len(universe)
+        num_elements = len(universe[0])
+        subsets = [model.NewBoolVar(f'subset{i}') for i in range(num_subsets)]
+        elements_covered = [model.NewBoolVar(f'element{i}') for i in range(num_elements)]
 
-    for i in range(num_subsets):
-        model.Add(sum([universe[i][j] * elements_covered[j] for j in range(num_elements)]) >= subsets[i])
+        # 定义约束条件
+        for j in range(num_elements):
+            model.Add(sum([subsets[i] * universe[i][j] for i in range(num_subsets)]) >= elements_covered[j])
 
-    # 定义目标函数
-    model.Maximize(sum(subsets))
+        for i in range(num_subsets):
+            model.Add(sum([universe[i][j] * elements_covered[j] for j in range(num_elements)]) >= subsets[i])
 
-    # 添加互斥约束条件
-    for i in range(num_subsets):
-        for j in range(i+1, num_subsets):
-            model.Add(sum([subsets[i], subsets[j]]) <= 1)
+        # 定义目标函数
+        model.Maximize(sum(subsets))
+
+        # 添加互斥约束条件
+        for i in range(num_subsets):
+            for j in range(i+1, num_subsets):
+                model.Add(sum([subsets[i], subsets[j]]) <= 1)
 
     # 设置求解器
     solver = cp_model.CpSolver()
     solver.parameters.max_time_in_seconds = time_limit
 
     # 求解模型
-    status = solver.Solve(model)
-
-    # 输出结果
-    if status == cp_model.OPTIMAL:
-        num_subsets_used = sum([solver.Value(subsets[i]) for i in range(num_subsets)])
-        subset_sizes = [sum(universe[i]) for i in range(num_subsets)]
-        used_subsets = [i for i in range(num_subsets) if solver.Value(subsets[i])]
-        elements_covered = [i for i in range(num_elements) if solver.Value(elements_covered[i])]
+    with phase_profiler.phase('solve'):
+        status = stop_policy.solve(solver, model, stop)
+
+    # 输出结果, also the best one when the stop policy ended the search
+    if status == cp_model.OPTIMAL or status == cp_model.FEASIBLE:
+        with phase_profiler.phase('extract'):
+            num_subsets_used = sum([solver.Value(subsets[i]) for i in range(num_subsets)])
+            subset_sizes = [sum(universe[i]) for i in range(num_subsets)]
+            used_subsets = [i for i in range(num_subsets) if solver.Value(subsets[i])]
+            elements_covered = [i for i in range(num_elements) if solver.Value(elements_covered[i])]
         return (num_subsets_used, subset_sizes, used_subsets, elements_covered)
     else:
         return None
@@ -50,7 +59,9 @@ universe = [
     [0,1,1],
     [0,0,0]]
 
-print(set_cover(universe, 1000))
+with phase_profiler.profile('weighted3') as run:
+    print(set_cover(universe, 1000))
+run.print_summary()
 
 # num_subsets, num_elements, covered_elements = set_cover(universe, 1000)
 # print(f'Number of subsets selected: {num_subsets}')
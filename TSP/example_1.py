@@ -43,6 +43,41 @@ def print_solution(manager, routing, solution):
     plan_output += 'Route distance: {}miles\n'.format(route_distance)
 
 
+def solve(distance_matrix, time_limit=10, stats=None):
+    """Tour of node indices by the routing library, guided local search until time_limit."""
+    manager = pywrapcp.RoutingIndexManager(len(distance_matrix), 1, 0)
+    routing = pywrapcp.RoutingModel(manager)
+    # the routing library takes integer arc costs
+    distances = [[int(round(d)) for d in row] for row in distance_matrix]
+
+    def distance_callback(from_index, to_index):
+        return distances[manager.IndexToNode(from_index)][manager.IndexToNode(to_index)]
+
+    transit_callback_index = routing.RegisterTransitCallback(distance_callback)
+    routing.SetArcCostEvaluatorOfAllVehicles(transit_callback_index)
+
+    search_parameters = pywrapcp.DefaultRoutingSearchParameters()
+    search_parameters.first_solution_strategy = (
+        routing_enums_pb2.FirstSolutionStrategy.PATH_CHEAPEST_ARC)
+    search_parameters.local_search_metaheuristic = (
+        routing_enums_pb2.LocalSearchMetaheuristic.GUIDED_LOCAL_SEARCH)
+    search_parameters.time_limit.FromMilliseconds(int(time_limit * 1000))
+    solution = routing.SolveWithParameters(search_parameters)
+    if not solution:
+        return None
+
+    tour = []
+    index = routing.Start(0)
+    while not routing.IsEnd(index):
+        tour.append(manager.IndexToNode(index))
+        index = solution.Value(routing.NextVar(index))
+    if stats is not None:
+        stats['objective'] = solution.ObjectiveValue()
+        # a local search proves nothing
+        stats['optimal'] = False
+    return tour
+
+
 def main():
     """Entry point of the program."""
     # Instantiate the data problem.
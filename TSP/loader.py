@@ -1,12 +1,37 @@
 import os
+import sys
 import tsplib95
 import numpy as np
 
+import tsplib_matrix
+from matrix_cache import MatrixCache, matrix_key
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import phase_profiler
+
 class Loader:
-    def __init__(self, path):
-        self.problem = tsplib95.load(path)
-        self.num_node = len(list(self.problem.get_nodes()))
-        self.nodes = [list(self.problem.get_nodes())]
+    @phase_profiler.profiled('parse')
+    def __init__(self, path, cache=None):
+        self.path = path
+        self.cache = cache if cache is not None else MatrixCache()
+        self.key = matrix_key(path)
+        self._problem = None
+        # a cached matrix means the file does not have to be parsed at all
+        self._weight_matrix = self.cache.load(self.key)
+        if self._weight_matrix is not None:
+            self.num_node = len(self._weight_matrix)
+        else:
+            self.num_node = len(list(self.problem.get_nodes()))
+
+    @property
+    def problem(self):
+        if self._problem is None:
+            self._problem = tsplib95.load(self.path)
+        return self._problem
+
+    @property
+    def nodes(self):
+        return [list(self.problem.get_nodes())]
 
     def load_tour(self, path):
         tour = tsplib95.load(path)
@@ -29,7 +54,19 @@ class Loader:
             f"and node {end} {self.problem.node_coords[end]}: "
             f"{self.problem.get_weight(start, end)}")
 
+    @phase_profiler.profiled('matrix')
     def get_weight_matrix(self):
+        if self._weight_matrix is None:
+            self.cache.save(self.key, self._compute_weight_matrix())
+            # read back memory-mapped, a miss returns the same read-only array as a hit
+            self._weight_matrix = self.cache.load(self.key)
+        return self._weight_matrix
+
+    def _compute_weight_matrix(self):
+        weight_matrix = tsplib_matrix.weight_matrix(self.problem)
+        if weight_matrix is not None:
+            return weight_matrix
+        # unsupported edge weight type, ask tsplib95 pair by pair
         weight_matrix = np.zeros((self.num_node, self.num_node))
         for start in self.problem.get_nodes():
             for end in self.problem.get_nodes():
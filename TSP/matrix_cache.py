@@ -0,0 +1,76 @@
+import os
+import sys
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from model_cache import instance_hash
+
+DEFAULT_CACHE_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', 'VRP', 'caches', 'weight_matrix')
+DEFAULT_MAX_BYTES = 1 << 30
+# bump when the way matrices are computed changes, old entries are then never hit
+CACHE_VERSION = 1
+
+def matrix_key(path, variant=''):
+    return '%s_v%d%s' %(instance_hash(path), CACHE_VERSION, variant)
+
+class MatrixCache:
+    # .npy files named by key; a hit is opened memory-mapped (no copy, read
+    # only) and touched, so that eviction by oldest mtime is least-recently-used
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + '.npy')
+
+    def load(self, key):
+        path = self._path(key)
+        try:
+            os.utime(path)
+            return np.load(path, mmap_mode='r')
+        except FileNotFoundError:
+            # never written, or evicted by another process
+            return None
+
+    def save(self, key, array):
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        path = self._path(key)
+        tmp_path = '%s.%d.tmp' %(path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            np.save(f, array)
+        os.replace(tmp_path, path)
+        self.evict(keep=key)
+
+    def evict(self, keep=None):
+        # keep: the entry just written, never evicted even if over the limit;
+        # other processes share the directory, their entries may vanish meanwhile
+        entries = []
+        for fn in os.listdir(self.cache_dir):
+            if not fn.endswith('.npy'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, fn))
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, fn[:-len('.npy')]))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        for _, size, key in entries:
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+        if not os.path.exists(self.cache_dir):
+            return
+        for fn in os.listdir(self.cache_dir):
+            if fn.endswith('.npy'):
+                os.remove(os.path.join(self.cache_dir, fn))
@@ -0,0 +1,183 @@
+"""2-opt / Or-opt local search on a tour of a symmetric weight matrix.
+
+A CP-SAT solve that runs into its time limit returns the circuit it had;
+polish() improves it with the classic moves, restricted to the
+num_neighbors nearest nodes of each node and driven by don't-look bits:
+only the nodes next to a changed edge are looked at again. The gains of
+all candidate moves at a node are computed at once with NumPy.
+
+- 2-opt: remove two edges, reconnect by reversing the path between them
+- Or-opt: move a path of 1 to 3 nodes between two other neighbours,
+  either way round
+
+    tour = tour_polish.polish(weight_matrix, tour, stats=stats)
+
+The first node of the tour stays first (the depot of a route).
+polish_routes() polishes each route of a VRP solution on its own.
+"""
+import time
+import collections
+import numpy as np
+
+OR_OPT_LENGTHS = (1, 2, 3)
+EPS = 1e-9
+
+def neighbor_lists(weight_matrix, num_neighbors):
+    # the num_neighbors nearest other nodes of every node, nearest first
+    num_nodes = len(weight_matrix)
+    k = min(num_neighbors, num_nodes - 1)
+    dist = np.array(weight_matrix, dtype=np.float64)
+    np.fill_diagonal(dist, np.inf)
+    nearest = np.argpartition(dist, k - 1, axis=1)[:, :k]
+    order = np.argsort(np.take_along_axis(dist, nearest, axis=1), axis=1)
+    return np.take_along_axis(nearest, order, axis=1)
+
+def tour_cost(weight_matrix, tour):
+    tour = np.asarray(tour, dtype=np.int64)
+    return np.asarray(weight_matrix)[tour, np.roll(tour, -1)].sum()
+
+
+class TourPolisher(object):
+    def __init__(self, weight_matrix, tour, num_neighbors=10):
+        self.dist = np.asarray(weight_matrix, dtype=np.float64)
+        if not np.allclose(self.dist, self.dist.T):
+            raise ValueError('2-opt reverses paths, the weight matrix must be symmetric')
+        self.n = len(tour)
+        self.tour = np.array(tour, dtype=np.int64)
+        self.pos = np.empty(self.n, dtype=np.int64)
+        self.pos[self.tour] = np.arange(self.n)
+        self.neighbors = neighbor_lists(self.dist, num_neighbors)
+        self.moves = collections.Counter()
+        # don't-look bits: the nodes still to look at, in a queue
+        self.queue = collections.deque(self.tour.tolist())
+        self.queued = np.ones(self.n, dtype=bool)
+
+    def _succ(self, nodes):
+        return self.tour[(self.pos[nodes] + 1) % self.n]
+
+    def _pred(self, nodes):
+        return self.tour[self.pos[nodes] - 1]
+
+    def _wake(self, nodes):
+        for node in nodes:
+            if not self.queued[node]:
+                self.queued[node] = True
+                self.queue.append(node)
+
+    def _reverse(self, e1, e2):
+        # replace the edges leaving positions e1 < e2 by reversing tour[e1+1..e2]
+        self.tour[e1 + 1:e2 + 1] = self.tour[e1 + 1:e2 + 1][::-1].copy()
+        self.pos[self.tour[e1 + 1:e2 + 1]] = np.arange(e1 + 1, e2 + 1)
+
+    def two_opt(self, a):
+        d = self.dist
+        c = self.neighbors[a]
+        sa, pa = self._succ(a), self._pred(a)
+        sc, pc = self._succ(c), self._pred(c)
+        # new edges (a, c) (sa, sc), or (a, c) (pa, pc)
+        succ_gain = d[a, c] + d[sa, sc] - d[a, sa] - d[c, sc]
+        pred_gain = d[a, c] + d[pa, pc] - d[pa, a] - d[pc, c]
+        k_succ, k_pred = np.argmin(succ_gain), np.argmin(pred_gain)
+        if min(succ_gain[k_succ], pred_gain[k_pred]) >= -EPS:
+            return False
+        if succ_gain[k_succ] <= pred_gain[k_pred]:
+            c = c[k_succ]
+            e1, e2 = sorted((self.pos[a], self.pos[c]))
+            touched = (a, sa, c, sc[k_succ])
+        else:
+            c = c[k_pred]
+            e1, e2 = sorted((self.pos[pa], self.pos[pc[k_pred]]))
+            touched = (a, pa, c, pc[k_pred])
+        self._reverse(e1, e2)
+        self.moves['2-opt'] += 1
+        self._wake(touched)
+        return True
+
+    def or_opt(self, a):
+        d = self.dist
+        i = self.pos[a]
+        for length in OR_OPT_LENGTHS:
+            # the path tour[i..i+length-1], the first node stays in place
+            if i == 0 or i + length > self.n or length > self.n - 3:
+                break
+            segment = self.tour[i:i + length]
+            s0, s1 = segment[0], segment[-1]
+            p, nx = self.tour[i - 1], self.tour[(i + length) % self.n]
+            removal_gain = d[p, s0] + d[s1, nx] - d[p, nx]
+            # insert between c and its successor, c next to either end
+            c = np.unique(np.concatenate((self.neighbors[s0], self._pred(self.neighbors[s0]),
+                                          self.neighbors[s1], self._pred(self.neighbors[s1]))))
+            c = c[~np.isin(c, segment) & (c != p)]
+            if len(c) == 0:
+                continue
+            sc = self._succ(c)
+            forward = d[c, s0] + d[s1, sc] - d[c, sc]
+            backward = d[c, s1] + d[s0, sc] - d[c, sc]
+            added = np.minimum(forward, backward)
+            k = np.argmin(added)
+            if added[k] - removal_gain >= -EPS:
+                continue
+            c, sc = c[k], sc[k]
+            path = segment if forward[k] <= backward[k] else segment[::-1]
+            rest = np.concatenate((self.tour[:i], self.tour[i + length:]))
+            j = int(np.nonzero(rest == c)[0][0])
+            self.tour = np.concatenate((rest[:j + 1], path, rest[j + 1:]))
+            self.pos[self.tour] = np.arange(self.n)
+            self.moves['or-opt'] += 1
+            self._wake((p, nx, c, sc, s0, s1))
+            return True
+        return False
+
+    def run(self, time_limit=None):
+        tic = time.time()
+        while self.queue:
+            if time_limit is not None and time.time() - tic > time_limit:
+                break
+            a = self.queue.popleft()
+            self.queued[a] = False
+            if self.two_opt(a) or self.or_opt(a):
+                # look at a again until it has no improving move
+                self._wake((a,))
+        return self.tour.tolist()
+
+
+def polish(weight_matrix, tour, num_neighbors=10, time_limit=None, stats=None):
+    # tour: node list starting at the node that stays first
+    tic = time.time()
+    initial_cost = tour_cost(weight_matrix, tour)
+    if len(tour) < 5:
+        polished = list(tour)
+        moves = collections.Counter()
+    else:
+        polisher = TourPolisher(weight_matrix, tour, num_neighbors)
+        polished = polisher.run(time_limit)
+        moves = polisher.moves
+    cost = tour_cost(weight_matrix, polished)
+    if stats is not None:
+        stats['initial_cost'] = initial_cost
+        stats['cost'] = cost
+        stats['improvement'] = 100.0 * (initial_cost - cost) / initial_cost if initial_cost else 0.0
+        stats['time'] = time.time() - tic
+        stats['moves'] = dict(moves)
+    return polished
+
+def polish_routes(weight_matrix, routes, num_neighbors=10, time_limit=None, stats=None):
+    # each route [depot, node, ...] polished as a closed tour on its own nodes
+    tic = time.time()
+    weight_matrix = np.asarray(weight_matrix)
+    polished, initial_cost, cost = [], 0.0, 0.0
+    for route in routes:
+        route = np.asarray(route, dtype=np.int64)
+        route_stats = {}
+        remaining = None if time_limit is None else max(0.0, time_limit - (time.time() - tic))
+        local = polish(weight_matrix[np.ix_(route, route)], list(range(len(route))),
+                       num_neighbors, remaining, route_stats)
+        polished.append(route[local].tolist())
+        initial_cost += route_stats['initial_cost']
+        cost += route_stats['cost']
+    if stats is not None:
+        stats['initial_cost'] = initial_cost
+        stats['cost'] = cost
+        stats['improvement'] = 100.0 * (initial_cost - cost) / initial_cost if initial_cost else 0.0
+        stats['time'] = time.time() - tic
+    return polished
@@ -1,14 +1,37 @@
-import os 
+import os
+import sys
+import numpy as np
 from ortools.sat.python import cp_model
 
 from loader import Loader
+import tour_polish
+from tour_polish import tour_cost
 
-def solve(tsp_path, time_limit=60, num_thread=8):
-    loader = Loader(tsp_path)
-    weight_matrix = loader.get_weight_matrix()
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import bulk_model
+import param_tuning
+import phase_profiler
+import stop_policy
+
+# part of the remaining time a sparse model gets before the arcs are widened
+SPARSE_TIME_SHARE = 0.5
+
+def candidate_arcs(weight_matrix, num_neighbors):
+    # arcs to the num_neighbors nearest nodes of every node, in both directions
+    num_nodes = len(weight_matrix)
+    k = min(num_neighbors, num_nodes - 1)
+    dist = np.array(weight_matrix, dtype=np.float64)
+    np.fill_diagonal(dist, np.inf)
+    nearest = np.argpartition(dist, k - 1, axis=1)[:, :k]
+    candidates = np.zeros((num_nodes, num_nodes), dtype=bool)
+    candidates[np.arange(num_nodes)[:, None], nearest] = True
+    candidates |= candidates.T
+    return candidates
+
+@phase_profiler.profiled('build')
+def build_model(weight_matrix, candidates=None):
     num_nodes = len(weight_matrix)
     all_nodes = range(num_nodes)
-    # print('Num nodes =', num_nodes)
 
     # Model.
     model = cp_model.CpModel()
@@ -19,59 +42,190 @@ def solve(tsp_path, time_limit=60, num_thread=8):
     # Create the circuit constraint.
     arcs = []
     arc_literals = {}
-    for i in all_nodes:
-        for j in all_nodes:
-            if i == j:
-                continue
+    # tail, head and proto index of every arc literal, to read the tour at once
+    arc_array = []
+    if candidates is None:
+        pairs = ((i, j) for i in all_nodes for j in all_nodes)
+    else:
+        # only the candidate arcs, not a test for each of the n^2 pairs
+        tails, heads = np.nonzero(candidates)
+        pairs = zip(tails.tolist(), heads.tolist())
+    for i, j in pairs:
+        if i == j:
+            continue
 
-            lit = model.NewBoolVar('%i follows %i' % (j, i))
-            arcs.append([i, j, lit])
-            arc_literals[i, j] = lit
+        lit = model.NewBoolVar('%i follows %i' % (j, i))
+        arcs.append([i, j, lit])
+        arc_literals[i, j] = lit
+        arc_array.append((i, j, lit.Index()))
 
-            obj_vars.append(lit)
-            obj_coeffs.append(weight_matrix[i][j])
+        obj_vars.append(lit)
+        obj_coeffs.append(weight_matrix[i][j])
 
     model.AddCircuit(arcs)
 
     # Minimize weighted sum of arcs. Because this s
     model.Minimize(
         sum(obj_vars[i] * obj_coeffs[i] for i in range(len(obj_vars))))
+    return model, arc_literals, np.array(arc_array, dtype=np.int64).reshape(-1, 3)
 
-    # Solve and print out the solution.
-    solver = cp_model.CpSolver()
-    # time limit
-    solver.parameters.max_time_in_seconds = time_limit
-    # number of threads
-    solver.parameters.num_workers = num_thread
-    solver.parameters.log_search_progress = False
-    # To benefit from the linearization of the circuit constraint.
-    solver.parameters.linearization_level = 2
+def successor_tour(tails, heads):
+    # tour from node 0 along the chosen arcs (tails[k] -> heads[k]), O(n)
+    successor = np.empty(len(tails), dtype=np.int64)
+    successor[tails] = heads
+    successor = successor.tolist()
+    tour = [0]
+    node = successor[0]
+    while node != 0:
+        tour.append(node)
+        node = successor[node]
+    return tour
 
-    status = solver.Solve(model)
-    # print(solver.ResponseStats())
-
-    current_node = 0
-    str_route = '%i' % current_node
-    route_is_finished = False
-    tour_cost = 0
-    while not route_is_finished:
-        for i in all_nodes:
-            if i == current_node:
-                continue
-            if solver.BooleanValue(arc_literals[current_node, i]):
-                str_route += ' -> %i' % i
-                tour_cost += weight_matrix[current_node][i]
-                current_node = i
-                if current_node == 0:
-                    route_is_finished = True
-                break
+def solve(tsp_path, time_limit=60, num_thread=None, num_neighbors=None, result_cache=None,
+          seed=None, stats=None, callback=None, stop=None, params=None, polish=True):
+    loader = Loader(tsp_path)
+    weight_matrix = loader.get_weight_matrix()
+    num_nodes = len(weight_matrix)
+    # print('Num nodes =', num_nodes)
+
+    # A solve with the same settings before: its tour at once.
+    warm_arcs = None
+    if result_cache is not None:
+        instance = result_cache.instance_hash(tsp_path)
+        solver = cp_model.CpSolver()
+        key_params = param_tuning.apply_profile(solver, 'tsp', params=params,
+                                                num_workers=num_thread, random_seed=seed)
+        key_params['num_neighbors'] = num_neighbors
+        key_params['polish'] = polish
+        entry = result_cache.get(instance, 'tsp_cp', key_params, time_limit, seed)
+        if entry is not None:
+            print(f"{tsp_path}\t{loader.num_node}\t{entry['objective']}\t0.0\t"
+                  f"{entry['optimal']}\tcached")
+            if stats is not None:
+                stats['objective'] = entry['objective']
+                stats['wall_time'] = 0.0
+                stats['optimal'] = entry['optimal']
+                stats['cached'] = True
+            return entry['solution']
+        warm = result_cache.warm_start(instance, 'tsp_cp', time_limit)
+        if warm is not None:
+            tour = warm['solution']
+            warm_arcs = set(zip(tour, tour[1:] + tour[:1]))
+
+    # Sparse mode keeps only the arcs to the nearest neighbours. If that
+    # graph has no Hamiltonian circuit, or no circuit is found within
+    # SPARSE_TIME_SHARE of the remaining time, the pruned arcs are added
+    # back by doubling num_neighbors until the model is the full one.
+    remaining_time = time_limit
+    # arc values of a first sparse solve, kept until the continuation finds a circuit
+    arc_values = None
+    while True:
+        if num_neighbors is None or num_neighbors >= num_nodes - 1:
+            candidates = None
+            attempt_time = remaining_time
+        else:
+            candidates = candidate_arcs(weight_matrix, num_neighbors)
+            attempt_time = remaining_time * SPARSE_TIME_SHARE
+        model, arc_literals, arc_array = build_model(weight_matrix, candidates)
+
+        # Solve and print out the solution.
+        solver = cp_model.CpSolver()
+        # TSP profile (8 workers, linearization_level 2 to benefit from the
+        # linearization of the circuit constraint), limits of the call on top
+        param_tuning.apply_profile(solver, 'tsp', params=params,
+                                   max_time_in_seconds=attempt_time,
+                                   num_workers=num_thread, random_seed=seed)
+        solver.parameters.log_search_progress = False
+        # the tour of a shorter solve as hint, on the arcs the model has
+        if warm_arcs is not None:
+            for arc, lit in arc_literals.items():
+                model.AddHint(lit, arc in warm_arcs)
+
+        with phase_profiler.phase('solve'):
+            status = stop_policy.solve(solver, model, stop, callback)
+        # print(solver.ResponseStats())
+        remaining_time -= solver.WallTime()
+        if candidates is not None and status == cp_model.FEASIBLE and remaining_time > 0 and \
+                stop_policy.reason(stop, status) == stop_policy.LIMIT:
+            # a circuit within the time share: the rest of the time goes to
+            # the same arcs, starting from that circuit
+            arc_values = bulk_model.values(solver, arc_array[:, 2])
+            model.clear_hints()
+            for lit, value in zip(arc_literals.values(), arc_values.tolist()):
+                model.AddHint(lit, value)
+            solver.parameters.max_time_in_seconds = remaining_time
+            with phase_profiler.phase('solve'):
+                status = stop_policy.solve(solver, model, stop, callback)
+            remaining_time -= solver.WallTime()
+            if status == cp_model.OPTIMAL or status == cp_model.FEASIBLE:
+                arc_values = None
+            else:
+                # cut off without a circuit, e.g. cancelled by a portfolio:
+                # the circuit of the first solve is still a solution
+                status = cp_model.FEASIBLE
+            break
+        # UNKNOWN: the time share ran out without any circuit
+        if status not in (cp_model.INFEASIBLE, cp_model.UNKNOWN) or \
+                candidates is None or remaining_time <= 0:
+            break
+        num_neighbors *= 2
+
+    if stats is not None:
+        stats['stop_reason'] = stop_policy.reason(stop, status)
+    if status != cp_model.OPTIMAL and status != cp_model.FEASIBLE:
+        print(f"{tsp_path}\tNo solution found.")
+        return
+
+    with phase_profiler.phase('extract'):
+        # all arc values in one array instead of a BooleanValue call per arc
+        if arc_values is None:
+            arc_values = bulk_model.values(solver, arc_array[:, 2])
+        chosen = arc_values == 1
+        tour = successor_tour(arc_array[chosen, 0], arc_array[chosen, 1])
+        cost = tour_cost(weight_matrix, tour)
+    optimal = bool(status == cp_model.OPTIMAL and candidates is None)
+    wall_time = time_limit - remaining_time
+    # the circuit of a solve cut off by its limit, improved by local search
+    polish_stats = {}
+    if polish and not optimal:
+        with phase_profiler.phase('polish'):
+            tour = tour_polish.polish(weight_matrix, tour, stats=polish_stats)
+        cost = polish_stats['cost']
+        wall_time += polish_stats['time']
+        print(f"{tsp_path}\tpolish\t{polish_stats['initial_cost']} -> {cost}\t"
+              f"{polish_stats['improvement']:.2f}%\t{polish_stats['time']:.2f}s")
     # print('Route:', str_route)
     # print('Travelled distance:', route_distance)
     print(f"{tsp_path}\t"
           f"{loader.num_node}\t"
-          f"{tour_cost}\t"
-          f"{round(solver.WallTime(), 2)}\t"
-          f"{bool(status == cp_model.OPTIMAL)}\t")
+          f"{cost}\t"
+          f"{round(wall_time, 2)}\t"
+          # optimality of the sparse model says nothing about the full one
+          f"{optimal}\t")
+    if stats is not None:
+        stats['objective'] = cost
+        stats['wall_time'] = wall_time
+        stats['optimal'] = optimal
+        if polish_stats:
+            stats['polish'] = polish_stats
+    if result_cache is not None:
+        result_cache.put(instance, 'tsp_cp', key_params, time_limit, seed, cost, optimal,
+                         [int(node) for node in tour])
+    return tour
+
+def tuning_run(params, tsp_path, time_limit, num_neighbors=10):
+    # param_tuning run: tour length with the parameters params, None if no solution
+    weight_matrix = Loader(tsp_path).get_weight_matrix()
+    candidates = None
+    if num_neighbors is not None and num_neighbors < len(weight_matrix) - 1:
+        candidates = candidate_arcs(weight_matrix, num_neighbors)
+    model, _, _ = build_model(weight_matrix, candidates)
+    solver = cp_model.CpSolver()
+    param_tuning.apply_params(solver, dict(params, max_time_in_seconds=time_limit))
+    status = solver.Solve(model)
+    if status == cp_model.OPTIMAL or status == cp_model.FEASIBLE:
+        return solver.ObjectiveValue()
+    return None
 
 
 if __name__ == '__main__':
@@ -81,11 +235,14 @@ if __name__ == '__main__':
     # tsp_path = "ALL_tsp/bays29.tsp"
     # tsp_path = "ALL_tsp/gr96.tsp"
     # solve(tsp_path)
-    
+
     tsp_dir = "ALL_tsp"
+    profile_log = "tsp_cp_phases.jsonl"
     for tsp_file in os.listdir(tsp_dir):
         name, ext = os.path.splitext(tsp_file)
         if ext == ".tsp":
             tsp_path = os.path.join(tsp_dir, tsp_file)
-            loader = Loader(tsp_path)
-            solve(tsp_path)
+            # parse / matrix / build / solve / extract of each instance
+            with phase_profiler.profile(name, profile_log):
+                solve(tsp_path, num_neighbors=10)
+    phase_profiler.print_summary(phase_profiler.load(profile_log))
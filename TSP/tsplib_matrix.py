@@ -0,0 +1,122 @@
+import numpy as np
+
+# constants of the TSPLIB95 specification
+PI = 3.141592
+RRR = 6378.388
+
+def nint(x):
+    return np.floor(x + 0.5)
+
+def coords_array(problem, nodes):
+    return np.array([problem.node_coords[node] for node in nodes], dtype=np.float64)
+
+def _deltas(coords):
+    for d in range(coords.shape[1]):
+        yield coords[:, None, d] - coords[None, :, d]
+
+def euclidean(coords, rounding=nint):
+    square_sum = np.zeros((len(coords), len(coords)))
+    for delta in _deltas(coords):
+        square_sum += delta * delta
+    return rounding(np.sqrt(square_sum))
+
+def manhattan(coords):
+    total = np.zeros((len(coords), len(coords)))
+    for delta in _deltas(coords):
+        total += np.abs(delta)
+    return nint(total)
+
+def maximum(coords):
+    total = np.zeros((len(coords), len(coords)))
+    for delta in _deltas(coords):
+        np.maximum(total, np.abs(delta), out=total)
+    return nint(total)
+
+def pseudo_euclidean(coords):
+    square_sum = np.zeros((len(coords), len(coords)))
+    for delta in _deltas(coords):
+        square_sum += delta * delta
+    value = np.sqrt(square_sum / 10.0)
+    distance = nint(value)
+    distance[distance < value] += 1
+    return distance
+
+def _to_radians(x):
+    degrees = np.trunc(x)
+    minutes = x - degrees
+    return PI * (degrees + 5.0 * minutes / 3.0) / 180.0
+
+def geographical(coords):
+    latitude = _to_radians(coords[:, 0])
+    longitude = _to_radians(coords[:, 1])
+    q1 = np.cos(longitude[:, None] - longitude[None, :])
+    q2 = np.cos(latitude[:, None] - latitude[None, :])
+    q3 = np.cos(latitude[:, None] + latitude[None, :])
+    cosine = np.clip(0.5 * ((1.0 + q1) * q2 - (1.0 - q1) * q3), -1.0, 1.0)
+    return np.trunc(RRR * np.arccos(cosine) + 1.0)
+
+COORD_TYPES = {
+    'EUC_2D':   euclidean,
+    'EUC_3D':   euclidean,
+    'CEIL_2D':  lambda coords: euclidean(coords, rounding=np.ceil),
+    'MAN_2D':   manhattan,
+    'MAN_3D':   manhattan,
+    'MAX_2D':   maximum,
+    'MAX_3D':   maximum,
+    'ATT':      pseudo_euclidean,
+    'GEO':      geographical,
+}
+
+# (triangle, with diagonal) of the row-major layout each format is read as;
+# the column-major formats are the transposed row-major ones, which is the
+# same matrix once mirrored
+EXPLICIT_FORMATS = {
+    'UPPER_ROW':        ('upper', False),
+    'LOWER_ROW':        ('lower', False),
+    'UPPER_DIAG_ROW':   ('upper', True),
+    'LOWER_DIAG_ROW':   ('lower', True),
+    'UPPER_COL':        ('lower', False),
+    'LOWER_COL':        ('upper', False),
+    'UPPER_DIAG_COL':   ('lower', True),
+    'LOWER_DIAG_COL':   ('upper', True),
+}
+
+def _flatten(edge_weights):
+    numbers = []
+    for row in edge_weights:
+        if isinstance(row, (list, tuple)):
+            numbers.extend(row)
+        else:
+            numbers.append(row)
+    return np.array(numbers, dtype=np.float64)
+
+def explicit_matrix(problem, num_node):
+    numbers = _flatten(problem.edge_weights)
+    edge_weight_format = problem.edge_weight_format
+    if edge_weight_format == 'FULL_MATRIX':
+        return numbers[:num_node * num_node].reshape(num_node, num_node).copy()
+    if edge_weight_format not in EXPLICIT_FORMATS:
+        return None
+    triangle, has_diagonal = EXPLICIT_FORMATS[edge_weight_format]
+    offset = 0 if has_diagonal else 1
+    if triangle == 'upper':
+        rows, cols = np.triu_indices(num_node, offset)
+    else:
+        rows, cols = np.tril_indices(num_node, -offset)
+    weight_matrix = np.zeros((num_node, num_node))
+    weight_matrix[rows, cols] = numbers[:len(rows)]
+    weight_matrix[cols, rows] = numbers[:len(rows)]
+    return weight_matrix
+
+def weight_matrix(problem):
+    # whole matrix at once, or None when the edge weight type is not
+    # supported here and the caller has to fall back on problem.get_weight
+    nodes = list(problem.get_nodes())
+    if problem.is_explicit():
+        return explicit_matrix(problem, len(nodes))
+    if problem.is_special() or not problem.node_coords:
+        return None
+    distance = COORD_TYPES.get(problem.edge_weight_type)
+    if distance is None:
+        return None
+    return distance(coords_array(problem, nodes))
@@ -8,20 +8,32 @@
    Distances are in meters.
 """
 
+import os
+import sys
 from ortools.constraint_solver import routing_enums_pb2
 from ortools.constraint_solver import pywrapcp
 
 from loader import Loader
 
-def print_solution(data, manager, routing, solution):
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'TSP'))
+import phase_profiler
+import tour_polish
+
+@phase_profiler.profiled('extract')
+def print_solution(data, manager, routing, solution, routes=None):
     """Prints solution on console."""
     print(f'Objective: {solution.ObjectiveValue()}')
     max_route_distance = 0
     for vehicle_id in range(data['num_vehicles']):
+        tour = []
+        if routes is not None:
+            routes.append(tour)
         index = routing.Start(vehicle_id)
         plan_output = 'Route for vehicle {}:\n'.format(vehicle_id)
         route_distance = 0
         while not routing.IsEnd(index):
+            tour.append(manager.IndexToNode(index))
             plan_output += ' {} -> '.format(manager.IndexToNode(index))
             previous_index = index
             index = solution.Value(routing.NextVar(index))
@@ -33,7 +45,7 @@ def print_solution(data, manager, routing, solution):
         max_route_distance = max(route_distance, max_route_distance)
     print('Maximum of the route distances: {}m'.format(max_route_distance))
 
-def solve(tsp_path, num_vehicles=2):
+def solve(tsp_path, num_vehicles=2, polish=False):
     loader = Loader(tsp_path)
     loader.check_tsp_instance()
     data = {}
@@ -41,53 +53,68 @@ def solve(tsp_path, num_vehicles=2):
     data['num_vehicles'] = num_vehicles
     data['depot'] = 0
 
-    # Create the routing index manager.
-    manager = pywrapcp.RoutingIndexManager(len(data['distance_matrix']),
-                                           data['num_vehicles'], data['depot'])
+    with phase_profiler.phase('build'):
+        # Create the routing index manager.
+        manager = pywrapcp.RoutingIndexManager(len(data['distance_matrix']),
+                                               data['num_vehicles'], data['depot'])
 
-    # Create Routing Model.
-    routing = pywrapcp.RoutingModel(manager)
+        # Create Routing Model.
+        routing = pywrapcp.RoutingModel(manager)
 
 
-    # Create and register a transit callback.
-    def distance_callback(from_index, to_index):
-        """Returns the distance between the two nodes."""
-        # Convert from routing variable Index to distance matrix NodeIndex.
-        from_node = manager.IndexToNode(from_index)
-        to_node = manager.IndexToNode(to_index)
-        return data['distance_matrix'][from_node][to_node]
+        # Create and register a transit callback.
+        def distance_callback(from_index, to_index):
+            """Returns the distance between the two nodes."""
+            # Convert from routing variable Index to distance matrix NodeIndex.
+            from_node = manager.IndexToNode(from_index)
+            to_node = manager.IndexToNode(to_index)
+            return data['distance_matrix'][from_node][to_node]
 
-    transit_callback_index = routing.RegisterTransitCallback(distance_callback)
+        transit_callback_index = routing.RegisterTransitCallback(distance_callback)
 
-    # Define cost of each arc.
-    routing.SetArcCostEvaluatorOfAllVehicles(transit_callback_index)
+        # Define cost of each arc.
+        routing.SetArcCostEvaluatorOfAllVehicles(transit_callback_index)
 
-    # Add Distance constraint.
-    dimension_name = 'Distance'
-    routing.AddDimension(
-        transit_callback_index,
-        0,  # no slack
-        3000,  # vehicle maximum travel distance
-        True,  # start cumul to zero
-        dimension_name)
-    distance_dimension = routing.GetDimensionOrDie(dimension_name)
-    distance_dimension.SetGlobalSpanCostCoefficient(100)
+        # Add Distance constraint.
+        dimension_name = 'Distance'
+        routing.AddDimension(
+            transit_callback_index,
+            0,  # no slack
+            3000,  # vehicle maximum travel distance
+            True,  # start cumul to zero
+            dimension_name)
+        distance_dimension = routing.GetDimensionOrDie(dimension_name)
+        distance_dimension.SetGlobalSpanCostCoefficient(100)
 
-    # Setting first solution heuristic.
-    search_parameters = pywrapcp.DefaultRoutingSearchParameters()
-    search_parameters.first_solution_strategy = (
-        routing_enums_pb2.FirstSolutionStrategy.PATH_CHEAPEST_ARC)
+        # Setting first solution heuristic.
+        search_parameters = pywrapcp.DefaultRoutingSearchParameters()
+        search_parameters.first_solution_strategy = (
+            routing_enums_pb2.FirstSolutionStrategy.PATH_CHEAPEST_ARC)
 
     # Solve the problem.
-    solution = routing.SolveWithParameters(search_parameters)
+    with phase_profiler.phase('solve'):
+        solution = routing.SolveWithParameters(search_parameters)
 
     # Print solution on console.
     if solution:
-        print_solution(data, manager, routing, solution)
+        routes = []
+        print_solution(data, manager, routing, solution, routes)
+        if polish:
+            # 2-opt / Or-opt inside each route, the route lengths only shrink
+            polish_stats = {}
+            with phase_profiler.phase('polish'):
+                routes = tour_polish.polish_routes(data['distance_matrix'], routes,
+                                                   stats=polish_stats)
+            print('Polished routes: {} -> {}m ({:.2f}%, {:.2f}s)'.format(
+                polish_stats['initial_cost'], polish_stats['cost'],
+                polish_stats['improvement'], polish_stats['time']))
+        return routes
     else:
         print('No solution found !')
 
 
 if __name__ == '__main__':
     tsp_path = "../TSP/ALL_tsp/eil51.tsp"
-    solve(tsp_path, num_vehicles=3)
\ No newline at end of file
+    with phase_profiler.profile('eil51', 'vrp_cp_phases.jsonl') as run:
+        solve(tsp_path, num_vehicles=3)
+    run.print_summary()
\ No newline at end of file
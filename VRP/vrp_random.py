@@ -1,10 +1,16 @@
 """Vehicles Routing Problem (VRP)."""
 
 from __future__ import print_function
+import os
+import sys
+import numpy as np
 from ortools.constraint_solver import routing_enums_pb2
 from ortools.constraint_solver import pywrapcp
 import torch
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'TSP'))
+import tour_polish
+
 C = 10000
 def Euclidean_distance(coords):
     city_square = torch.sum(coords ** 2, dim=1, keepdim=True)
@@ -47,12 +53,14 @@ def computing_tourlen(data, tour):
     temp = xcoord - ycoord
     return torch.sum(torch.sqrt(temp[:, 0] ** 2 + temp[:, 1] ** 2))
 
-def print_solution(data, manager, routing, solution):
+def print_solution(data, manager, routing, solution, routes=None):
     """Prints solution on console."""
     tourlen = torch.zeros(data['num_vehicles'])
     max_route_distance = 0
     for vehicle_id in range(data['num_vehicles']):
         tour = []
+        if routes is not None:
+            routes.append(tour)
         index = routing.Start(vehicle_id)
         plan_output = 'Route for vehicle {}:\n'.format(vehicle_id)
         route_distance = 0
@@ -73,11 +81,29 @@ def print_solution(data, manager, routing, solution):
     return tourlen
 
 
-def entrance(cnum, anum, timeLimitation=1800):
+def entrance(cnum, anum, timeLimitation=1800, seed=None, result_cache=None, polish=False):
     """Solve the CVRP problem."""
     # Instantiate the data problem.
+    if seed is not None:
+        torch.manual_seed(seed)
     data, coords = create_data_model(cnum, anum)
 
+    # Routes of a solve with the same settings before, at once.
+    warm_routes = None
+    if result_cache is not None:
+        instance = result_cache.array_hash(coords.numpy())
+        params = {'num_vehicles': anum, 'first_solution_strategy': 'PATH_CHEAPEST_ARC',
+                  'polish': polish}
+        entry = result_cache.get(instance, 'vrp_random', params, timeLimitation, seed)
+        if entry is not None:
+            tourlen = torch.zeros(data['num_vehicles'])
+            for vehicle_id, tour in enumerate(entry['solution']):
+                tourlen[vehicle_id] = computing_tourlen(data, tour)
+            return tourlen, coords
+        warm = result_cache.warm_start(instance, 'vrp_random', timeLimitation)
+        if warm is not None:
+            warm_routes = warm['solution']
+
     # Create the routing index manager.
     manager = pywrapcp.RoutingIndexManager(len(data['distance_matrix']),
                                            data['num_vehicles'], data['depot'])
@@ -116,12 +142,38 @@ def entrance(cnum, anum, timeLimitation=1800):
         routing_enums_pb2.FirstSolutionStrategy.PATH_CHEAPEST_ARC)
     search_parameters.time_limit.seconds = timeLimitation
     
-    # Solve the problem.
-    solution = routing.SolveWithParameters(search_parameters)
+    # Solve the problem, from the routes of a shorter solve if there are.
+    solution = None
+    if warm_routes is not None:
+        routing.CloseModelWithParameters(search_parameters)
+        # the stored routes start at the depot, which is not part of them here
+        initial_solution = routing.ReadAssignmentFromRoutes(
+            [[manager.NodeToIndex(node) for node in tour[1:]] for tour in warm_routes], True)
+        if initial_solution is not None:
+            solution = routing.SolveFromAssignmentWithParameters(
+                initial_solution, search_parameters)
+    if solution is None:
+        solution = routing.SolveWithParameters(search_parameters)
 
     # Print solution on console.
     if solution:
-        tourlen = print_solution(data, manager, routing, solution)
+        routes = []
+        tourlen = print_solution(data, manager, routing, solution, routes)
+        dist = np.array(data['distance_matrix'], dtype=np.float64)
+        if polish:
+            # 2-opt / Or-opt inside each route; the float32 distances are not
+            # exactly symmetric, the lengths are measured on the coordinates
+            polish_stats = {}
+            routes = tour_polish.polish_routes((dist + dist.T) / 2, routes, stats=polish_stats)
+            for vehicle_id, tour in enumerate(routes):
+                tourlen[vehicle_id] = computing_tourlen(data, tour)
+            print('polish: %.2f%% in %.2fs' %(polish_stats['improvement'], polish_stats['time']))
+        if result_cache is not None:
+            # the length of the routes returned, polished or not, so that all
+            # entries compare alike (not the routing objective with its span cost)
+            cost = float(sum(tour_polish.tour_cost(dist, tour) for tour in routes))
+            result_cache.put(instance, 'vrp_random', params, timeLimitation, seed,
+                             cost, False, [[int(node) for node in tour] for tour in routes])
         return tourlen, coords
 
 
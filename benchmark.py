@@ -0,0 +1,236 @@
+"""Benchmark runs against best-known values, with regression checks.
+
+best_known.json holds the published best-known makespans of the JSP
+instances (Taillard's and the OR-Library tables, optimal where proven;
+update_best_known() only lowers them) and the optimal tour lengths of the
+TSPLIB instances. run_suite() solves a chosen subset with a fixed time
+limit, each instance in a freshly spawned process so that its peak RSS is
+its own, and writes one CSV row per instance:
+
+    instance, objective, best_known, gap, optimal, wall_time, time_to_target, peak_rss_mb
+
+gap is in % of the best-known value, time_to_target the solver time until
+the incumbent was within target_gap % of it (empty if never). A results
+file can be stored as baseline; compare() flags the instances that got
+worse than the baseline:
+
+- a solution lost, or the gap grown by more than gap_tolerance points
+- time to target slower by more than time_factor, or the target lost
+- peak memory larger by more than memory_factor
+"""
+import os
+import csv
+import sys
+import json
+import multiprocessing
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from ortools.sat.python import cp_model
+
+import phase_profiler
+import stop_policy
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+BEST_KNOWN_FILE = os.path.join(ROOT, 'best_known.json')
+FIELDS = ('instance', 'objective', 'best_known', 'gap', 'optimal', 'wall_time',
+          'time_to_target', 'peak_rss_mb')
+
+# default subsets, small to large
+JSP_SUITE = ['ft06', 'la01', 'la06', 'la11', 'la16', 'la21', 'ft10', 'abz5', 'orb01', 'swv01',
+             'ta01', 'ta21']
+TSP_SUITE = ['burma14', 'ulysses22', 'bays29', 'att48', 'berlin52', 'st70', 'kroA100', 'ch150']
+
+def load_best_known(best_known_file=BEST_KNOWN_FILE):
+    with open(best_known_file, 'r') as f:
+        return json.load(f)
+
+def update_best_known(problem_class, objectives, best_known_file=BEST_KNOWN_FILE):
+    # lower the stored values that a run beat; returns the improved instances
+    best_known = load_best_known(best_known_file)
+    values = best_known.setdefault(problem_class, {})
+    improved = []
+    for name, objective in objectives.items():
+        if objective is not None and (name not in values or objective < values[name]):
+            values[name] = int(round(objective))
+            improved.append(name)
+    if improved:
+        with open(best_known_file, 'w') as f:
+            json.dump(best_known, f, indent=4, sort_keys=True)
+    return improved
+
+def instance_name(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+def gap(objective, best):
+    return 100.0 * (objective - best) / best
+
+
+class SolutionTrace(cp_model.CpSolverSolutionCallback):
+    """Wall time and objective of every improving solution."""
+
+    def __init__(self):
+        cp_model.CpSolverSolutionCallback.__init__(self)
+        self.wall_times = []
+        self.objectives = []
+
+    def on_solution_callback(self):
+        self.record(self)
+
+    def record(self, callback):
+        # also the on_solution hook of a StopPolicy
+        self.wall_times.append(callback.WallTime())
+        self.objectives.append(callback.ObjectiveValue())
+
+    def time_to(self, target):
+        # first time the incumbent reached target, None if it never did
+        objectives = np.array(self.objectives)
+        reached = np.nonzero(objectives <= target + 1e-6)[0]
+        if len(reached) == 0:
+            return None
+        return self.wall_times[reached[0]]
+
+
+def jsp_run(path, time_limit, callback, stop=None):
+    sys.path.append(os.path.join(ROOT, 'JSP'))
+    import jsp_2
+    stats = {}
+    jsp_2.solve(path, time_limit=time_limit, stats=stats, bulk=True, callback=callback,
+                stop=stop)
+    return stats
+
+def tsp_run(path, time_limit, callback, stop=None):
+    sys.path.append(os.path.join(ROOT, 'TSP'))
+    import tsp_cp
+    stats = {}
+    tsp_cp.solve(path, time_limit=time_limit, num_neighbors=10, stats=stats, callback=callback,
+                 stop=stop)
+    return stats
+
+RUNS = {
+    'jsp': jsp_run,
+    'tsp': tsp_run,
+}
+
+def _run_instance(problem_class, path, time_limit, best, target_gap, stop_options=None):
+    # stop_options: StopPolicy arguments, the policy passes solutions on to the trace
+    stop = stop_policy.StopPolicy(**stop_options) if stop_options is not None else None
+    trace = SolutionTrace()
+    stats = RUNS[problem_class](path, time_limit, trace, stop)
+    row = dict.fromkeys(FIELDS)
+    row['instance'] = instance_name(path)
+    row['best_known'] = best
+    row['wall_time'] = stats.get('wall_time', time_limit)
+    if 'objective' in stats:
+        row['objective'] = stats['objective']
+        row['optimal'] = stats['optimal']
+        if best is not None:
+            row['gap'] = gap(stats['objective'], best)
+            row['time_to_target'] = trace.time_to(best * (1.0 + target_gap / 100.0))
+    # a spawned process per instance
+    row['peak_rss_mb'] = phase_profiler.peak_rss_mb()
+    return row
+
+def run_suite(problem_class, paths, time_limit, results_file, target_gap=1.0,
+              best_known_file=BEST_KNOWN_FILE, stop_options=None):
+    best_known = load_best_known(best_known_file).get(problem_class, {})
+    rows = []
+    with open(results_file, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        writer.writeheader()
+        for path in paths:
+            # one spawned process per instance, the peak memory of one does not
+            # hide the next and the parent's is not inherited as with fork
+            with ProcessPoolExecutor(max_workers=1,
+                                     mp_context=multiprocessing.get_context('spawn')) as executor:
+                row = executor.submit(_run_instance, problem_class, path, time_limit,
+                                      best_known.get(instance_name(path)), target_gap,
+                                      stop_options).result()
+            writer.writerow(row)
+            f.flush()
+            rows.append(row)
+    return rows
+
+def load_results(results_file):
+    # {instance: row}, numbers parsed, empty fields None
+    results = {}
+    with open(results_file, 'r', newline='') as f:
+        for row in csv.DictReader(f):
+            for field in FIELDS[1:]:
+                value = row[field]
+                if value == '':
+                    row[field] = None
+                elif field == 'optimal':
+                    row[field] = value == 'True'
+                else:
+                    row[field] = float(value)
+            results[row['instance']] = row
+    return results
+
+def save_baseline(results_file, baseline_file):
+    with open(baseline_file, 'w') as f:
+        json.dump(load_results(results_file), f, indent=4, sort_keys=True)
+
+def compare(results, baseline, gap_tolerance=0.5, time_factor=1.5, memory_factor=1.5):
+    # {instance: [reason, ...]} of the instances that got worse
+    regressions = {}
+    for name, row in sorted(results.items()):
+        if name not in baseline:
+            continue
+        base = baseline[name]
+        reasons = []
+        if row['objective'] is None and base['objective'] is not None:
+            reasons.append('no solution')
+        elif row['gap'] is not None and base['gap'] is not None and \
+                row['gap'] > base['gap'] + gap_tolerance:
+            reasons.append('gap %.2f%% -> %.2f%%' %(base['gap'], row['gap']))
+        if base['time_to_target'] is not None:
+            if row['time_to_target'] is None:
+                reasons.append('target not reached')
+            elif row['time_to_target'] > time_factor * base['time_to_target'] + 0.1:
+                reasons.append('time to target %.2f s -> %.2f s' %(
+                    base['time_to_target'], row['time_to_target']))
+        if row['peak_rss_mb'] > memory_factor * base['peak_rss_mb']:
+            reasons.append('memory %.0f MB -> %.0f MB' %(base['peak_rss_mb'], row['peak_rss_mb']))
+        if reasons:
+            regressions[name] = reasons
+    return regressions
+
+def _cell(value, fmt):
+    return '-' if value is None else fmt %(value)
+
+def print_table(results, regressions=None):
+    regressions = regressions or {}
+    print('instance\tobjective\tbest\tgap %\toptimal\ttime\tto target\tRSS MB\tregression')
+    for name, row in sorted(results.items()):
+        print('%s\t%s\t%s\t%s\t%s\t%.2f\t%s\t%.0f\t%s' %(
+            name, _cell(row['objective'], '%.0f'), _cell(row['best_known'], '%d'),
+            _cell(row['gap'], '%.2f'), row['optimal'], row['wall_time'],
+            _cell(row['time_to_target'], '%.2f'), row['peak_rss_mb'],
+            '; '.join(regressions.get(name, []))))
+    gaps = [row['gap'] for row in results.values() if row['gap'] is not None]
+    if gaps:
+        print('mean gap %.2f%%, %d / %d solved, %d regressions' %(
+            np.mean(gaps), len(gaps), len(results), len(regressions)))
+
+
+if __name__ == '__main__':
+    problem_class = 'jsp'
+    time_limit = 10
+    suite_dir = os.path.join(ROOT, 'JSP', 'instances')
+    paths = [os.path.join(suite_dir, name) for name in JSP_SUITE]
+    # problem_class = 'tsp'
+    # suite_dir = os.path.join(ROOT, 'TSP', 'ALL_tsp')
+    # paths = [os.path.join(suite_dir, name + '.tsp') for name in TSP_SUITE]
+
+    results_file = 'benchmark_%s_%d.csv' %(problem_class, time_limit)
+    baseline_file = 'benchmark_%s_%d_baseline.json' %(problem_class, time_limit)
+    run_suite(problem_class, paths, time_limit, results_file)
+    results = load_results(results_file)
+    if os.path.exists(baseline_file):
+        with open(baseline_file, 'r') as f:
+            regressions = compare(results, json.load(f))
+        print_table(results, regressions)
+    else:
+        # the first run is the baseline of the later ones
+        save_baseline(results_file, baseline_file)
+        print_table(results)
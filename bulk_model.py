@@ -0,0 +1,198 @@
+"""Job shop / flexible job shop CP-SAT models filled in bulk from arrays.
+
+The model builders of jsp_2 and fjsp_demo create every variable and
+interval through the CpModel API, one Python call and one formatted name
+each. Here the whole CpModelProto is written from flat operation arrays in
+one piece of text format and parsed at once; names are left out unless
+asked for. Variables are returned as index arrays into the proto:
+
+    bulk = bulk_model.build_jsp(*bulk_model.jsp_arrays(jobs_data))
+    status = solver.Solve(bulk.model)
+    starts = bulk_model.values(solver, bulk.starts)
+
+Variable layout, n operations and a alternatives:
+
+- jsp:  start 0..n-1, end n..2n-1, makespan 2n
+- fjsp: start, end as for jsp, makespan 2n, presence 2n+1..2n+a (a
+  constant 1 for single-alternative operations)
+
+Solutions are read the same way for models built through the API: the
+proto indices of the variables once, then all values of the response in
+one array instead of a solver.Value call per variable:
+
+    solution = bulk_model.solution(solver)
+    starts = solution[bulk_model.indices(task.start for task in tasks)]
+"""
+import collections
+import numpy as np
+from ortools.sat.python import cp_model
+
+bulk_model = collections.namedtuple(
+    'bulk_model', 'model starts ends presences makespan')
+
+def jsp_arrays(jobs_data):
+    # flat (job, op, machine, duration) arrays of [[(machine_id, processing_time), ...], ...]
+    ops = [(job_id, op_id, task[0], task[1]) for job_id, job in enumerate(jobs_data)
+           for op_id, task in enumerate(job)]
+    return tuple(np.array(column, dtype=np.int64) for column in zip(*ops))
+
+def fjsp_arrays(jobs):
+    # flat op arrays (job, op) and alternative arrays (op row, machine,
+    # duration) of jobs as lists of operations of (processing_time, machine_id)
+    op_job, op_index, alt_op, alt_machine, alt_duration = [], [], [], [], []
+    for job_id, job in enumerate(jobs):
+        for op_id, op in enumerate(job):
+            for duration, machine in op:
+                alt_op.append(len(op_job))
+                alt_machine.append(machine)
+                alt_duration.append(duration)
+            op_job.append(job_id)
+            op_index.append(op_id)
+    return tuple(np.array(column, dtype=np.int64) for column in
+                 (op_job, op_index, alt_op, alt_machine, alt_duration))
+
+def merge_text(model, text):
+    proto = model.Proto()
+    if hasattr(proto, 'merge_text_format'):
+        proto.merge_text_format(text)
+    else:
+        # CpModelProto as a Python protobuf message
+        from google.protobuf import text_format
+        text_format.Merge(text, proto)
+
+def _variables(domain, count, names=None):
+    if names is None:
+        return 'variables { domain: %d domain: %d }\n' %(domain) * count
+    return ''.join(['variables { name: "%s" domain: %d domain: %d }\n' %(
+        (name,) + domain) for name in names])
+
+def _domains(lows, highs, names=None):
+    if names is None:
+        return ''.join(['variables { domain: %d domain: %d }\n' %(low, high)
+                        for low, high in zip(lows.tolist(), highs.tolist())])
+    return ''.join(['variables { name: "%s" domain: %d domain: %d }\n' %(name, low, high)
+                    for name, low, high in zip(names, lows.tolist(), highs.tolist())])
+
+def _op_variables(op_job, op_index, horizon, windows, names):
+    # start, end of every operation and the makespan
+    n = len(op_job)
+    if windows is None:
+        if not names:
+            return _variables((0, horizon), 2 * n + 1)
+        return (_variables((0, horizon), n, _names('start', op_job, op_index)) +
+                _variables((0, horizon), n, _names('end', op_job, op_index)) +
+                _variables((0, horizon), 1, ['makespan']))
+    earliest = windows.earliest_start[op_job, op_index]
+    latest = windows.latest_finish[op_job, op_index]
+    duration = windows.min_durations[op_job, op_index]
+    makespan = (windows.lower_bound, windows.upper_bound)
+    if not names:
+        return (_domains(earliest, latest - duration) + _domains(earliest + duration, latest) +
+                _variables(makespan, 1))
+    return (_domains(earliest, latest - duration, _names('start', op_job, op_index)) +
+            _domains(earliest + duration, latest, _names('end', op_job, op_index)) +
+            _variables(makespan, 1, ['makespan']))
+
+def _names(prefix, op_job, op_index):
+    return ['%s_%d_%d' %(prefix, job_id, op_id)
+            for job_id, op_id in zip(op_job.tolist(), op_index.tolist())]
+
+def _no_overlaps(interval_machine, interval_ids):
+    # one no_overlap per machine, in interval order
+    order = np.argsort(interval_machine, kind='stable')
+    machines = interval_machine[order]
+    bounds = np.searchsorted(machines, np.arange(machines.max() + 2)) if len(machines) else []
+    text = []
+    for left, right in zip(bounds[:-1], bounds[1:]):
+        if right - left > 1:
+            text.append('constraints { no_overlap { %s } }\n' %(
+                ' '.join(['intervals: %d' %(i) for i in interval_ids[order[left:right]].tolist()])))
+    return ''.join(text)
+
+def _job_structure(op_job, horizon, n):
+    # precedences inside the jobs and makespan >= every job end
+    nxt = np.nonzero(op_job[1:] == op_job[:-1])[0]
+    text = [''.join(['constraints { linear { vars: %d vars: %d coeffs: 1 coeffs: -1 '
+                     'domain: 0 domain: %d } }\n' %(after, before, horizon)
+                     for after, before in zip((nxt + 1).tolist(), (n + nxt).tolist())])]
+    last = n + np.nonzero(np.append(op_job[1:] != op_job[:-1], True))[0]
+    text.append('constraints { lin_max { target { vars: %d coeffs: 1 } %s } }\n' %(
+        2 * n, ' '.join(['exprs { vars: %d coeffs: 1 }' %(i) for i in last.tolist()])))
+    text.append('objective { vars: %d coeffs: 1 }\n' %(2 * n))
+    return ''.join(text)
+
+def build_jsp(op_job, op_index, op_machine, op_duration, names=False, windows=None):
+    # operations sorted by job and op, as jsp_arrays returns them; windows
+    # from time_windows.compute() narrow the [0, horizon] domains
+    model = cp_model.CpModel()
+    n = len(op_job)
+    horizon = int(op_duration.sum())
+    ids = np.arange(n)
+    text = [_op_variables(op_job, op_index, horizon, windows, names)]
+    text.append(''.join([
+        'constraints { interval { start { vars: %d coeffs: 1 } end { vars: %d coeffs: 1 } '
+        'size { offset: %d } } }\n' %(i, n + i, d)
+        for i, d in zip(ids.tolist(), op_duration.tolist())]))
+    text.append(_no_overlaps(op_machine, ids))
+    text.append(_job_structure(op_job, horizon, n))
+    merge_text(model, ''.join(text))
+    return bulk_model(model, ids, n + ids, None, 2 * n)
+
+def build_fjsp(op_job, op_index, alt_op, alt_machine, alt_duration, names=False, windows=None):
+    # one optional interval per alternative on the start / end of its
+    # operation, or a plain interval for single-alternative operations
+    model = cp_model.CpModel()
+    n = len(op_job)
+    a = len(alt_op)
+    max_duration = np.zeros(n, dtype=np.int64)
+    np.maximum.at(max_duration, alt_op, alt_duration)
+    horizon = int(max_duration.sum())
+    num_alts = np.bincount(alt_op, minlength=n)
+    single = num_alts[alt_op] == 1
+    presences = 2 * n + 1 + np.arange(a)
+
+    text = [_op_variables(op_job, op_index, horizon, windows, names)]
+    if names:
+        text.append(''.join(['variables { name: "presence_j%d_t%d_a%d" domain: %d domain: 1 }\n' %(
+            op_job[i], op_index[i], k, int(s)) for k, (i, s) in enumerate(zip(
+                alt_op.tolist(), single.tolist()))]))
+    else:
+        text.append(''.join(['variables { domain: %d domain: 1 }\n' %(s) for s in single.tolist()]))
+    # interval k belongs to alternative k
+    text.append(''.join([
+        'constraints { %s interval { start { vars: %d coeffs: 1 } end { vars: %d coeffs: 1 } '
+        'size { offset: %d } } }\n' %(
+            '' if s else 'enforcement_literal: %d' %(p), i, n + i, d)
+        for i, d, p, s in zip(alt_op.tolist(), alt_duration.tolist(),
+                              presences.tolist(), single.tolist())]))
+    # exactly one alternative, end == start + its duration
+    first = np.searchsorted(alt_op, np.arange(n))
+    text.append(''.join([
+        'constraints { exactly_one { %s } }\n'
+        'constraints { linear { vars: %d vars: %d %s coeffs: 1 coeffs: -1 %s domain: 0 domain: 0 } }\n' %(
+            ' '.join(['literals: %d' %(p) for p in presences[left:left + k].tolist()]),
+            n + i, i,
+            ' '.join(['vars: %d' %(p) for p in presences[left:left + k].tolist()]),
+            ' '.join(['coeffs: %d' %(-d) for d in alt_duration[left:left + k].tolist()]))
+        for i, left, k in zip(range(n), first.tolist(), num_alts.tolist()) if k > 1]))
+    text.append(_no_overlaps(alt_machine, np.arange(a)))
+    text.append(_job_structure(op_job, horizon, n))
+    merge_text(model, ''.join(text))
+    return bulk_model(model, np.arange(n), n + np.arange(n), presences, 2 * n)
+
+def add_hint(model, indices, hint_values):
+    proto = model.Proto()
+    proto.solution_hint.vars.extend(np.asarray(indices).ravel().tolist())
+    proto.solution_hint.values.extend(np.asarray(hint_values).ravel().astype(np.int64).tolist())
+
+def indices(variables):
+    # proto indices of CpModel API variables, not of negated literals
+    return np.fromiter((variable.Index() for variable in variables), dtype=np.int64)
+
+def solution(solver):
+    # values of all variables of the last solve, indexed by proto index
+    return np.asarray(solver.ResponseProto().solution, dtype=np.int64)
+
+def values(solver, indices):
+    # solution values of the variables at indices, as an array of their shape
+    return solution(solver)[indices]
@@ -0,0 +1,153 @@
+"""Dispatching-rule schedules used as CP-SAT solution hints.
+
+A non-delay schedule is built one operation at a time: among the next
+operations of all jobs, those that can start the earliest compete and the
+dispatching rule picks one of them.
+
+- SPT:  shortest processing time
+- MWKR: most work remaining in the job
+- EDD:  earliest due date (needs due_dates)
+
+Jobs are given as lists of operations, each operation a list of
+alternatives (processing_time, machine_id), as in the FJSP models. Job shop
+data (machine_id, processing_time) is converted with jsp_alternatives().
+"""
+import time
+import collections
+import numpy as np
+from ortools.sat.python import cp_model
+
+RULES = ('SPT', 'MWKR', 'EDD')
+
+dispatch_schedule = collections.namedtuple(
+    'dispatch_schedule', 'starts durations machines alternatives makespan')
+
+def jsp_alternatives(jobs_data):
+    return [[[(op[1], op[0])] for op in job] for job in jobs_data]
+
+def _pad(jobs):
+    num_jobs = len(jobs)
+    num_ops = np.array([len(job) for job in jobs])
+    max_ops = max(num_ops.max(), 1)
+    max_alts = max(len(op) for job in jobs for op in job)
+    durations = np.full((num_jobs, max_ops, max_alts), np.inf)
+    machines = np.zeros((num_jobs, max_ops, max_alts), dtype=np.int64)
+    for job_id, job in enumerate(jobs):
+        for op_id, op in enumerate(job):
+            for alt_id, (duration, machine) in enumerate(op):
+                durations[job_id, op_id, alt_id] = duration
+                machines[job_id, op_id, alt_id] = machine
+    return num_ops, durations, machines
+
+def dispatch(jobs, rule='SPT', due_dates=None):
+    if rule not in RULES:
+        raise ValueError('unknown dispatching rule %r' %(rule))
+    if rule == 'EDD' and due_dates is None:
+        raise ValueError('EDD needs due_dates')
+    num_ops, durations, machines = _pad(jobs)
+    num_jobs = len(jobs)
+    all_jobs = np.arange(num_jobs)
+    # remaining work of a job from op o on, with the shortest alternatives
+    min_durations = durations.min(axis=2)
+    min_durations[np.isinf(min_durations)] = 0
+    work_left = np.cumsum(min_durations[:, ::-1], axis=1)[:, ::-1]
+    if due_dates is not None:
+        due_dates = np.asarray(due_dates, dtype=np.float64)
+
+    starts = np.zeros(durations.shape[:2], dtype=np.int64)
+    chosen_durations = np.zeros(durations.shape[:2], dtype=np.int64)
+    chosen_machines = np.zeros(durations.shape[:2], dtype=np.int64)
+    alternatives = np.zeros(durations.shape[:2], dtype=np.int64)
+    next_op = np.zeros(num_jobs, dtype=np.int64)
+    job_ready = np.zeros(num_jobs)
+    machine_free = np.zeros(machines.max() + 1)
+
+    for _ in range(int(num_ops.sum())):
+        active = next_op < num_ops
+        op = np.minimum(next_op, durations.shape[1] - 1)
+        op_durations = durations[all_jobs, op]
+        op_machines = machines[all_jobs, op]
+        alt_starts = np.maximum(job_ready[:, None], machine_free[op_machines])
+        # every job takes its alternative finishing first
+        alt = np.argmin(alt_starts + op_durations, axis=1)
+        est = alt_starts[all_jobs, alt]
+        est[~active] = np.inf
+        candidates = est == est.min()
+        if rule == 'SPT':
+            priority = op_durations[all_jobs, alt]
+        elif rule == 'MWKR':
+            priority = -work_left[all_jobs, op]
+        else:
+            priority = due_dates.copy()
+        priority = np.where(candidates, priority, np.inf)
+        job_id = int(np.argmin(priority))
+
+        op_id = op[job_id]
+        a = alt[job_id]
+        start = est[job_id]
+        duration = durations[job_id, op_id, a]
+        machine = machines[job_id, op_id, a]
+        starts[job_id, op_id] = start
+        chosen_durations[job_id, op_id] = duration
+        chosen_machines[job_id, op_id] = machine
+        alternatives[job_id, op_id] = a
+        job_ready[job_id] = start + duration
+        machine_free[machine] = start + duration
+        next_op[job_id] += 1
+
+    return dispatch_schedule(starts=starts, durations=chosen_durations,
+                             machines=chosen_machines, alternatives=alternatives,
+                             makespan=int(job_ready.max()) if num_jobs else 0)
+
+def add_hint(model, schedule, starts, ends=None, presences=None):
+    # starts / ends indexed by (job_id, op_id), presences by (job_id, op_id, alt_id)
+    for (job_id, op_id), var in starts.items():
+        model.AddHint(var, int(schedule.starts[job_id, op_id]))
+    if ends is not None:
+        for (job_id, op_id), var in ends.items():
+            model.AddHint(var, int(schedule.starts[job_id, op_id] + schedule.durations[job_id, op_id]))
+    if presences is not None:
+        # single alternatives share one constant, hinted once
+        hinted = set()
+        for (job_id, op_id, alt_id), var in presences.items():
+            if var.Index() in hinted:
+                continue
+            hinted.add(var.Index())
+            model.AddHint(var, int(schedule.alternatives[job_id, op_id] == alt_id))
+
+
+class FirstSolutionTimer(cp_model.CpSolverSolutionCallback):
+    """Remember when the first solution was found."""
+
+    def __init__(self):
+        cp_model.CpSolverSolutionCallback.__init__(self)
+        self.first_time = None
+        self.first_objective = None
+
+    def on_solution_callback(self):
+        if self.first_time is None:
+            self.first_time = self.WallTime()
+            self.first_objective = self.ObjectiveValue()
+
+
+def compare_first_solution(build, jobs, rule='SPT', due_dates=None, time_limit=10.0):
+    # build() returns (model, starts, ends, presences); the same model is
+    # solved without and with the hint until the first solution
+    report = {}
+    for name in ('no_hint', rule):
+        model, starts, ends, presences = build()
+        if name != 'no_hint':
+            tic = time.time()
+            schedule = dispatch(jobs, rule, due_dates)
+            add_hint(model, schedule, starts, ends, presences)
+            report['dispatch_time'] = time.time() - tic
+            report['dispatch_objective'] = schedule.makespan
+        solver = cp_model.CpSolver()
+        solver.parameters.max_time_in_seconds = time_limit
+        solver.parameters.stop_after_first_solution = True
+        timer = FirstSolutionTimer()
+        solver.Solve(model, timer)
+        report[name] = (timer.first_time, timer.first_objective)
+    print('time to first solution: %s without hint, %s with %s hint' %(
+        report['no_hint'][0], report[rule][0], rule))
+    return report
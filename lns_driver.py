@@ -0,0 +1,175 @@
+"""Large neighbourhood search around the job shop / flexible job shop models.
+
+Starting from an incumbent schedule, every round frees the operations of a
+few neighbourhoods, keeps the machine assignment and the order on each
+machine of all other operations, and re-solves the model for a short time
+with the incumbent as hint. The neighbourhoods of a round are solved in
+parallel and the best one becomes the new incumbent.
+
+- window:  operations running in a random time window
+- machine: operations on a few random machines
+
+Jobs are in the alternatives format of dispatch_hint (lists of operations,
+each a list of (processing_time, machine_id)). build() returns
+(model, starts, ends, presences, makespan) as the model builders of jsp_2
+and fjsp_demo do; presences may be None when every operation has a single
+alternative.
+
+stop is a StopPolicy: it governs the initial whole-model solve like any
+other, and between rounds its target and stall_time end the search as
+well (the neighbourhood solves prove no bound, so relative_gap only counts
+in the initial solve); stop.reason says why lns() returned.
+"""
+import time
+import random
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from ortools.sat.python import cp_model
+
+import dispatch_hint
+import schedule_arrays
+import stop_policy
+
+NEIGHBOURHOODS = ('window', 'machine')
+
+def schedule_from_solver(solver, jobs, starts, presences):
+    num_ops = max(len(job) for job in jobs)
+    shape = (len(jobs), num_ops)
+    op_starts = np.zeros(shape, dtype=np.int64)
+    durations = np.zeros(shape, dtype=np.int64)
+    machines = np.zeros(shape, dtype=np.int64)
+    alternatives = np.zeros(shape, dtype=np.int64)
+    for job_id, job in enumerate(jobs):
+        for op_id, op in enumerate(job):
+            alt_id = 0
+            if presences is not None and len(op) > 1:
+                for a in range(len(op)):
+                    if solver.Value(presences[job_id, op_id, a]):
+                        alt_id = a
+            op_starts[job_id, op_id] = solver.Value(starts[job_id, op_id])
+            durations[job_id, op_id] = op[alt_id][0]
+            machines[job_id, op_id] = op[alt_id][1]
+            alternatives[job_id, op_id] = alt_id
+    makespan = int((op_starts + durations).max())
+    return dispatch_hint.dispatch_schedule(op_starts, durations, machines, alternatives, makespan)
+
+def to_schedule(schedule, jobs):
+    mask = _op_mask(jobs)
+    job_ids, op_ids = np.nonzero(mask)
+    return schedule_arrays.Schedule(
+        job_ids, op_ids, schedule.machines[mask], schedule.starts[mask], schedule.durations[mask])
+
+def op_infos(schedule, jobs):
+    # result format of jsp_2.solve / fjsp_demo.solve
+    return to_schedule(schedule, jobs).to_op_infos()
+
+def _op_mask(jobs):
+    mask = np.zeros((len(jobs), max(len(job) for job in jobs)), dtype=bool)
+    for job_id, job in enumerate(jobs):
+        mask[job_id, :len(job)] = True
+    return mask
+
+def _free_window(schedule, mask, rng, fraction):
+    width = max(1, int(schedule.makespan * fraction))
+    left = rng.randint(0, max(0, schedule.makespan - width))
+    ends = schedule.starts + schedule.durations
+    return mask & (schedule.starts < left + width) & (ends > left)
+
+def _free_machines(schedule, mask, rng, fraction):
+    all_machines = sorted(set(schedule.machines[mask].tolist()))
+    k = max(1, int(round(len(all_machines) * fraction)))
+    chosen = rng.sample(all_machines, min(k, len(all_machines)))
+    return mask & np.isin(schedule.machines, chosen)
+
+def _solve_neighbourhood(build, jobs, schedule, fixed, time_limit, num_workers, stop=None):
+    model, starts, ends, presences, makespan = build()
+    # keep assignment and machine order of the operations that are not free
+    for machine in np.unique(schedule.machines[fixed]):
+        job_ids, op_ids = np.nonzero(fixed & (schedule.machines == machine))
+        order = np.argsort(schedule.starts[job_ids, op_ids], kind='stable')
+        ops = [(int(job_ids[i]), int(op_ids[i])) for i in order]
+        for before, after in zip(ops, ops[1:]):
+            model.Add(ends[before] <= starts[after])
+    if presences is not None:
+        for (job_id, op_id, alt_id), var in presences.items():
+            if fixed[job_id, op_id]:
+                model.Add(var == int(schedule.alternatives[job_id, op_id] == alt_id))
+    model.Add(makespan <= schedule.makespan)
+    dispatch_hint.add_hint(model, schedule, starts, ends, presences)
+
+    solver = cp_model.CpSolver()
+    solver.parameters.max_time_in_seconds = time_limit
+    solver.parameters.num_workers = num_workers
+    status = stop_policy.solve(solver, model, stop)
+    if status != cp_model.OPTIMAL and status != cp_model.FEASIBLE:
+        return None
+    return schedule_from_solver(solver, jobs, starts, presences)
+
+def lns(build, jobs, time_limit, schedule=None, initial_time=0.0, sub_time_limit=2.0,
+        num_neighbourhoods=4, num_workers=2, window_fraction=0.2,
+        machine_fraction=0.25, seed=0, log=print, stop=None):
+    # schedule: initial incumbent, an MWKR dispatch if None; with
+    # initial_time the whole model is first solved that long from it
+    tic = time.time()
+    rng = random.Random(seed)
+    mask = _op_mask(jobs)
+    if schedule is None:
+        schedule = dispatch_hint.dispatch(jobs, 'MWKR')
+    if initial_time > 0:
+        candidate = _solve_neighbourhood(build, jobs, schedule, np.zeros_like(mask),
+                                         initial_time, num_neighbourhoods * num_workers, stop)
+        if candidate is not None:
+            schedule = candidate
+    initial_makespan = schedule.makespan
+    # the LNS rounds start now, after the initial solve; so does the stall clock
+    lns_start = time.time()
+    history = [(lns_start - tic, schedule.makespan)]
+    log('%f\t%d' %(history[0][0], schedule.makespan))
+    if stop is not None:
+        # nothing left to search for after an optimum, the gap or the target
+        if stop.reason in (stop_policy.OPTIMAL, stop_policy.GAP, stop_policy.TARGET):
+            return schedule, history
+        stop.reason = None
+
+    with ThreadPoolExecutor(max_workers=num_neighbourhoods) as executor:
+        round_id = 0
+        while time.time() - tic < time_limit:
+            if stop is not None and _should_stop(stop, schedule, history, time.time() - tic):
+                break
+            remaining = time_limit - (time.time() - tic)
+            sub_limit = max(0.1, min(sub_time_limit, remaining))
+            futures = []
+            for i in range(num_neighbourhoods):
+                kind = NEIGHBOURHOODS[(round_id + i) % len(NEIGHBOURHOODS)]
+                if kind == 'window':
+                    free = _free_window(schedule, mask, rng, window_fraction)
+                else:
+                    free = _free_machines(schedule, mask, rng, machine_fraction)
+                futures.append(executor.submit(
+                    _solve_neighbourhood, build, jobs, schedule, mask & ~free,
+                    sub_limit, num_workers))
+            round_start = schedule.makespan
+            for future in futures:
+                candidate = future.result()
+                # equal makespans are accepted too, to move on the plateau
+                if candidate is not None and candidate.makespan <= schedule.makespan:
+                    schedule = candidate
+            round_id += 1
+            elapsed = time.time() - tic
+            if schedule.makespan < round_start:
+                history.append((elapsed, schedule.makespan))
+                # improvement per second of the rounds, the initial solve not counted
+                log('%f\t%d\t%f' %(elapsed, schedule.makespan,
+                                   (initial_makespan - schedule.makespan) /
+                                   (time.time() - lns_start)))
+    if stop is not None and stop.reason is None:
+        stop.reason = stop_policy.LIMIT
+    return schedule, history
+
+def _should_stop(stop, schedule, history, elapsed):
+    # the rules of the policy that make sense between rounds
+    if stop.target is not None and schedule.makespan <= stop.target:
+        stop.reason = stop_policy.TARGET
+    elif stop.stall_time is not None and elapsed - history[-1][0] >= stop.stall_time:
+        stop.reason = stop_policy.STALL
+    return stop.reason is not None
@@ -0,0 +1,135 @@
+"""On-disk cache of built CP-SAT models.
+
+Parameter and time-limit sweeps solve the same models over and over. The
+cache keeps each built CpModelProto in text format under a key made of the
+instance file hash, the formulation and its options, together with the
+variable-index maps the caller needs to hint the model and read back a
+solution (lists of proto indices, stored as JSON):
+
+    cache = model_cache.ModelCache('model_cache', max_bytes=1 << 30)
+    model, index_maps = cache.get_or_build(
+        file_name, 'jsp_2', {}, lambda: build(file_name))
+
+Entries are files <key>.txt / <key>.json in cache_dir. Every hit touches
+them, and after every put the least recently used entries are removed
+until the directory holds at most max_bytes.
+"""
+import os
+import json
+import time
+import hashlib
+
+import bulk_model
+
+def instance_hash(file_name):
+    sha1 = hashlib.sha1()
+    with open(file_name, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+def cache_key(file_name, formulation, options=None):
+    # the path does not matter, only the content of the instance file
+    text = json.dumps([instance_hash(file_name), formulation, options or {}], sort_keys=True)
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+class ModelCache(object):
+    def __init__(self, cache_dir, max_bytes=1 << 30):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+    def _paths(self, key):
+        return (os.path.join(self.cache_dir, key + '.txt'),
+                os.path.join(self.cache_dir, key + '.json'))
+
+    def get(self, key):
+        # (model, index_maps), or None if the key is not cached
+        from ortools.sat.python import cp_model
+        model_file, map_file = self._paths(key)
+        if not os.path.exists(model_file) or not os.path.exists(map_file):
+            return None
+        with open(map_file, 'r') as f:
+            index_maps = json.load(f)
+        with open(model_file, 'r') as f:
+            model = cp_model.CpModel()
+            bulk_model.merge_text(model, f.read())
+        now = time.time()
+        os.utime(model_file, (now, now))
+        os.utime(map_file, (now, now))
+        return model, index_maps
+
+    def put(self, key, model, index_maps):
+        from ortools.sat.python import cp_model
+        model_file, map_file = self._paths(key)
+        # names are not needed to solve and take most of the parse time; they
+        # are removed from a copy, the caller keeps using its named model
+        if hasattr(model, 'remove_all_names'):
+            stored = model.clone()
+            stored.remove_all_names()
+        else:
+            stored = cp_model.CpModel()
+            stored.CopyFrom(model)
+        # written under another name first, a reader never sees half a model
+        for path, text in ((model_file, str(stored.Proto())),
+                           (map_file, json.dumps(index_maps))):
+            with open(path + '.tmp', 'w') as f:
+                f.write(text)
+            os.replace(path + '.tmp', path)
+        self.evict(keep=key)
+
+    def get_or_build(self, file_name, formulation, options, build):
+        # build() returns (model, index_maps) before hints are added
+        key = cache_key(file_name, formulation, options)
+        entry = self.get(key)
+        if entry is not None:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        model, index_maps = build()
+        self.put(key, model, index_maps)
+        return model, index_maps
+
+    def entries(self):
+        # (last use, bytes, key), least recently used first
+        entries = {}
+        for fn in os.listdir(self.cache_dir):
+            key, ext = os.path.splitext(fn)
+            if ext not in ('.txt', '.json'):
+                continue
+            stat = os.stat(os.path.join(self.cache_dir, fn))
+            last_use, size = entries.get(key, (0, 0))
+            entries[key] = (max(last_use, stat.st_mtime), size + stat.st_size)
+        return sorted((last_use, size, key) for key, (last_use, size) in entries.items())
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self, keep=None):
+        # keep: the entry just written, never evicted even if over the limit
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, key in entries:
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            for path in self._paths(key):
+                if os.path.exists(path):
+                    os.remove(path)
+            total -= size
+
+    def clear(self):
+        for _, _, key in self.entries():
+            for path in self._paths(key):
+                if os.path.exists(path):
+                    os.remove(path)
+
+
+def int_vars(model, indices):
+    # IntVars of the proto indices of a cached model
+    return [model.GetIntVarFromProtoIndex(int(index)) for index in indices]
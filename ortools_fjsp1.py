@@ -31,23 +31,27 @@ import json
 
 from .. import utils 
 from utils import Machine
+import dispatch_hint
+import progress_recorder
+import stop_policy
 
 
-class SolutionPrinter(cp_model.CpSolverSolutionCallback):
-    """Print intermediate solutions."""
+class SolutionPrinter(progress_recorder.ProgressRecorder):
+    """Print intermediate solutions, and record them if progress_file is set."""
 
-    def __init__(self):
-        cp_model.CpSolverSolutionCallback.__init__(self)
+    def __init__(self, progress_file=None, run_id=None):
+        progress_recorder.ProgressRecorder.__init__(self, progress_file, run_id)
         self.__solution_count = 0
 
-    def on_solution_callback(self):
-        """Called at each new solution."""
+    def record(self, callback):
+        """Called at each new solution, also when passed on by a stop policy."""
         print('Solution %i, time = %f s, objective = %i' %
-              (self.__solution_count, self.WallTime(), self.ObjectiveValue()))
+              (self.__solution_count, callback.WallTime(), callback.ObjectiveValue()))
         self.__solution_count += 1
+        progress_recorder.ProgressRecorder.record(self, callback)
 
 
-def flexible_jobshop():
+def flexible_jobshop(hint_rule=None, progress_file=None, stop=None):
     """Solve a small flexible jobshop problem."""
     # Data part.
     jobs = [  # task = (processing_time, machine_id)
@@ -173,10 +177,17 @@ def flexible_jobshop():
     model.AddMaxEquality(makespan, job_ends)
     model.Minimize(makespan)
 
+    # Start from a dispatching-rule schedule.
+    if hint_rule is not None:
+        schedule = dispatch_hint.dispatch(jobs, hint_rule)
+        dispatch_hint.add_hint(model, schedule, starts, presences=presences)
+
     # Solve model.
     solver = cp_model.CpSolver()
-    solution_printer = SolutionPrinter()
-    status = solver.Solve(model, solution_printer)
+    solution_printer = SolutionPrinter(progress_file)
+    # the printer sees every solution, with a policy too
+    status = stop_policy.solve(solver, model, stop, solution_printer)
+    solution_printer.close()
 
     # Print final solution.
     for job_id in all_jobs:
@@ -196,6 +207,7 @@ def flexible_jobshop():
                 (job_id, task_id, start_value, selected, machine, duration))
 
     print('Solve status: %s' % solver.StatusName(status))
+    print('Stop reason: %s' % stop_policy.reason(stop, status))
     print('Optimal objective value: %i' % solver.ObjectiveValue())
     print('Statistics')
     print('  - conflicts : %i' % solver.NumConflicts())
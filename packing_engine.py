@@ -0,0 +1,196 @@
+"""Rectangle placement shared by the 2D packing models.
+
+Blocks use the all_block format of the packing scripts: dicts with the
+width 'w', the height 'h' and, if the block is fixed, its position 'x' / 'y'
+(None otherwise). Every block gets a pair of optional interval variables
+whose presence literal tells if it is placed, and the non-overlap is a
+single AddNoOverlap2D instead of four BoolVars and big-M constraints per
+pair of blocks. The pairwise formulation is kept for comparison.
+
+    placement = packing_engine.place_blocks(model, all_block, width, height, presences)
+    packing_engine.add_no_overlap(model, placement, width, height)
+
+Objectives that trade ratios off against each other (coverage = placed
+area / panel area, utilization = placed blocks / blocks) are composed with
+RatioObjective. By default the weighted ratios are brought to a common
+denominator, which leaves an integer linear objective; the older form with
+one AddDivisionEquality per ratio, scaled by 1e6, is kept for comparison.
+"""
+import math
+import time
+import random
+import fractions
+import collections
+from ortools.sat.python import cp_model
+
+import stop_policy
+
+NO_OVERLAP_2D = 'no_overlap_2d'
+PAIRWISE = 'pairwise'
+FORMULATIONS = (NO_OVERLAP_2D, PAIRWISE)
+
+LINEAR = 'linear'
+DIVISION = 'division'
+OBJECTIVE_FORMS = (LINEAR, DIVISION)
+SCALE = 1000000
+
+block_placement = collections.namedtuple(
+    'block_placement', 'x_st y_st x_ed y_ed presences x_intervals y_intervals')
+
+def blocks_from_sizes(widths, heights):
+    return [{'w': w, 'h': h, 'x': None, 'y': None} for w, h in zip(widths, heights)]
+
+def place_blocks(model, all_block, width, height, presences, prefix=''):
+    # presences: one literal (or constant) per block, 1 if it is placed
+    x_st, y_st, x_ed, y_ed, x_intervals, y_intervals = [], [], [], [], [], []
+    for i, block in enumerate(all_block):
+        if block['x'] is None:
+            x_st.append(model.NewIntVar(0, width - block['w'], f"{prefix}x{i}"))
+        else:
+            x_st.append(model.NewIntVar(block['x'], block['x'], f"{prefix}x{i}"))
+        if block['y'] is None:
+            y_st.append(model.NewIntVar(0, height - block['h'], f"{prefix}y{i}"))
+        else:
+            y_st.append(model.NewIntVar(block['y'], block['y'], f"{prefix}y{i}"))
+        x_ed.append(model.NewIntVar(0, width, f"{prefix}x_end{i}"))
+        y_ed.append(model.NewIntVar(0, height, f"{prefix}y_end{i}"))
+        # end == start + size only holds for present blocks
+        x_intervals.append(model.NewOptionalIntervalVar(
+            x_st[i], block['w'], x_ed[i], presences[i], f"{prefix}x_interval{i}"))
+        y_intervals.append(model.NewOptionalIntervalVar(
+            y_st[i], block['h'], y_ed[i], presences[i], f"{prefix}y_interval{i}"))
+    return block_placement(x_st, y_st, x_ed, y_ed, list(presences), x_intervals, y_intervals)
+
+def add_pairwise_no_overlap(model, placement, width, height, prefix=''):
+    # the original formulation: one of four big-M separations per pair
+    n = len(placement.x_st)
+    for i in range(n):
+        for j in range(i + 1, n):
+            bx_ij = model.NewBoolVar(f"{prefix}bx_{i}_{j}")
+            bx_ji = model.NewBoolVar(f"{prefix}bx_{j}_{i}")
+            by_ij = model.NewBoolVar(f"{prefix}by_{i}_{j}")
+            by_ji = model.NewBoolVar(f"{prefix}by_{j}_{i}")
+
+            model.Add(placement.x_ed[i] <= placement.x_st[j] + width * bx_ij)
+            model.Add(placement.x_ed[j] <= placement.x_st[i] + width * bx_ji)
+            model.Add(placement.y_ed[i] <= placement.y_st[j] + height * by_ij)
+            model.Add(placement.y_ed[j] <= placement.y_st[i] + height * by_ji)
+
+            model.AddBoolOr([bx_ij.Not(), bx_ji.Not(),
+                            by_ij.Not(), by_ji.Not()])
+
+def add_no_overlap(model, placement, width, height, formulation=NO_OVERLAP_2D, prefix=''):
+    if formulation == NO_OVERLAP_2D:
+        model.AddNoOverlap2D(placement.x_intervals, placement.y_intervals)
+    elif formulation == PAIRWISE:
+        add_pairwise_no_overlap(model, placement, width, height, prefix)
+    else:
+        raise ValueError('unknown formulation %r' %(formulation))
+
+def positions(solver, placement):
+    return [(solver.Value(x), solver.Value(y)) for x, y in zip(placement.x_st, placement.y_st)]
+
+# numerator: linear expression, denominator: positive int
+ratio_term = collections.namedtuple('ratio_term', 'name weight numerator denominator')
+
+class RatioObjective(object):
+    """Maximize (or minimize) sum(weight * numerator / denominator)."""
+
+    def __init__(self, model, terms, form=LINEAR, maximize=True, scale=SCALE):
+        if form not in OBJECTIVE_FORMS:
+            raise ValueError('unknown objective form %r' %(form))
+        self.terms = list(terms)
+        self.form = form
+        self.scale = scale
+        self.ratio_vars = {}
+        if form == LINEAR:
+            weights = [fractions.Fraction(term.weight) / term.denominator for term in self.terms]
+            self.denominator = 1
+            for weight in weights:
+                self.denominator = self.denominator * weight.denominator // math.gcd(
+                    self.denominator, weight.denominator)
+            objective = sum(int(weight * self.denominator) * term.numerator
+                            for weight, term in zip(weights, self.terms) if weight != 0)
+        else:
+            self.denominator = 1
+            for term in self.terms:
+                var = model.NewIntVar(0, 1 * scale, term.name)
+                model.AddDivisionEquality(var, term.numerator * scale, term.denominator)
+                self.ratio_vars[term.name] = var
+            objective = sum(self.ratio_vars[term.name] * (term.weight / scale)
+                            for term in self.terms if term.weight != 0)
+        if maximize:
+            model.Maximize(objective)
+        else:
+            model.Minimize(objective)
+
+    def ratio(self, solver, name):
+        # truncated to 1/scale, as the AddDivisionEquality form reports it
+        for term in self.terms:
+            if term.name == name:
+                if term.name in self.ratio_vars:
+                    return solver.Value(self.ratio_vars[name]) / self.scale
+                return (solver.Value(term.numerator) * self.scale // term.denominator) / self.scale
+        raise KeyError(name)
+
+    def value(self, solver):
+        return solver.ObjectiveValue() / self.denominator
+
+def model_size(model):
+    proto = model.Proto()
+    return len(proto.variables), len(proto.constraints)
+
+
+def _covered_area_model(all_block, width, height, formulation):
+    # place a subset of the blocks maximizing the covered area
+    model = cp_model.CpModel()
+    presences = [model.NewBoolVar(f"placed_{i}") for i in range(len(all_block))]
+    placement = place_blocks(model, all_block, width, height, presences)
+    add_no_overlap(model, placement, width, height, formulation)
+    model.Maximize(sum(presences[i] * block['w'] * block['h'] for i, block in enumerate(all_block)))
+    return model
+
+def random_blocks(n, max_w, max_h, seed=0):
+    rng = random.Random(seed)
+    return [{'w': rng.randint(1, max_w), 'h': rng.randint(1, max_h), 'x': None, 'y': None}
+            for _ in range(n)]
+
+def benchmark(all_block, width, height, time_limit=60, num_thread=8, build=None, stop=None):
+    # model size, build and solve time of both formulations on one instance;
+    # build(all_block, width, height, formulation) returns a CpModel, stop is
+    # the StopPolicy of every solve
+    if build is None:
+        build = _covered_area_model
+    report = {}
+    for formulation in FORMULATIONS:
+        tic = time.time()
+        model = build(all_block, width, height, formulation)
+        build_time = time.time() - tic
+        num_vars, num_constraints = model_size(model)
+        solver = cp_model.CpSolver()
+        solver.parameters.max_time_in_seconds = time_limit
+        solver.parameters.num_workers = num_thread
+        status = stop_policy.solve(solver, model, stop)
+        report[formulation] = {
+            'num_vars': num_vars,
+            'num_constraints': num_constraints,
+            'build_time': build_time,
+            'solve_time': solver.WallTime(),
+            'status': solver.StatusName(status),
+            'objective': solver.ObjectiveValue(),
+            'stop_reason': stop_policy.reason(stop, status),
+        }
+        print(f"{len(all_block)}\t{formulation}\t{num_vars}\t{num_constraints}\t"
+              f"{round(build_time, 3)}\t{round(solver.WallTime(), 3)}\t"
+              f"{solver.StatusName(status)}\t{solver.ObjectiveValue()}")
+    return report
+
+
+if __name__ == "__main__":
+    width = 20
+    height = 20
+    time_limit = 60
+    print("n\tformulation\tvars\tconstraints\tbuild\tsolve\tstatus\tobjective")
+    for n in [8, 16, 32, 64]:
+        all_block = random_blocks(n, 8, 8, seed=n)
+        benchmark(all_block, width, height, time_limit=time_limit)
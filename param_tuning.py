@@ -0,0 +1,215 @@
+"""CP-SAT parameter profiles and a successive-halving tuner for them.
+
+A profile is a dict of SatParameters fields for one problem class, kept in
+solver_profiles.json next to this file. The solve functions of the entry
+points apply the profile of their class by default; explicit arguments
+(time limit, number of workers) still win:
+
+    solver = cp_model.CpSolver()
+    param_tuning.apply_profile(solver, 'jsp', max_time_in_seconds=time_limit)
+
+tune() races candidate configurations on a training set of instances.
+Every round runs all remaining configurations on all instances, ranks them
+by their mean objective relative to the best one found on each instance
+(then by mean wall time), keeps the best 1/eta and multiplies the time
+limit by eta. Every run is appended to a CSV file and the winner becomes
+the profile of the class. The run functions are the tuning_run of jsp_2
+(jsp), fjsp_demo (fjsp, Brandimarte .fjs files), tsp_cp (tsp) and
+advance_process_2 (packing, wafer sampling JSON files).
+"""
+import os
+import csv
+import json
+import time
+import numpy as np
+
+PROFILE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'solver_profiles.json')
+
+# objective ratio of a run without solution
+NO_SOLUTION_SCORE = 2.0
+
+CANDIDATES = {
+    'jsp': [
+        {},
+        {'linearization_level': 0},
+        {'linearization_level': 2},
+        {'symmetry_level': 0},
+        {'search_branching': 'FIXED_SEARCH'},
+        {'optimize_with_core': True},
+        {'use_objective_lb_search': True},
+        {'cp_model_probing_level': 0},
+    ],
+    'fjsp': [
+        {},
+        {'linearization_level': 0},
+        {'linearization_level': 2},
+        {'symmetry_level': 0},
+        {'optimize_with_core': True},
+        {'use_objective_lb_search': True},
+        {'cp_model_probing_level': 0},
+    ],
+    'packing': [
+        {},
+        {'linearization_level': 0},
+        {'linearization_level': 2},
+        {'symmetry_level': 0},
+        {'cp_model_probing_level': 0},
+        {'optimize_with_core': True},
+    ],
+    'tsp': [
+        {},
+        {'linearization_level': 2},
+        {'linearization_level': 2, 'cp_model_probing_level': 0},
+        {'linearization_level': 2, 'symmetry_level': 0},
+        {'linearization_level': 0},
+        {'linearization_level': 2, 'optimize_with_core': True},
+    ],
+}
+
+def load_profiles(profile_file=PROFILE_FILE):
+    if not os.path.exists(profile_file):
+        return {}
+    with open(profile_file, 'r') as f:
+        return json.load(f)
+
+def load_profile(problem_class, profile_file=PROFILE_FILE):
+    return dict(load_profiles(profile_file).get(problem_class, {}))
+
+def save_profile(problem_class, params, profile_file=PROFILE_FILE):
+    profiles = load_profiles(profile_file)
+    profiles[problem_class] = params
+    with open(profile_file, 'w') as f:
+        json.dump(profiles, f, indent=4, sort_keys=True)
+
+def _text(params):
+    # SatParameters text format; enum values are given by name
+    items = []
+    for name, value in sorted(params.items()):
+        if isinstance(value, bool):
+            value = 'true' if value else 'false'
+        items.append('%s: %s' %(name, value))
+    return ' '.join(items)
+
+def apply_params(solver, params):
+    parameters = solver.parameters
+    if hasattr(parameters, 'merge_text_format'):
+        parameters.merge_text_format(_text(params))
+    else:
+        # SatParameters as a Python protobuf message
+        from google.protobuf import text_format
+        text_format.Merge(_text(params), parameters)
+
+def apply_profile(solver, problem_class, profile_file=PROFILE_FILE, params=None, **overrides):
+    # params: more fields on top of the profile; overrides that are None keep the value
+    params = dict(load_profile(problem_class, profile_file), **(params or {}))
+    params.update({name: value for name, value in overrides.items() if value is not None})
+    apply_params(solver, params)
+    return params
+
+def config_name(params):
+    return _text(params) or 'default'
+
+def successive_halving(configs, instances, run, time_limit, eta=2, num_rounds=None,
+                       results_file=None, log=print):
+    # run(params, instance, time_limit) -> objective to minimize, or None
+    if num_rounds is None:
+        num_rounds = max(1, int(np.ceil(np.log(len(configs)) / np.log(eta))) + 1)
+    alive = list(range(len(configs)))
+    history = []
+    writer = None
+    if results_file is not None:
+        is_new = not os.path.exists(results_file) or os.path.getsize(results_file) == 0
+        f = open(results_file, 'a', newline='', buffering=1)
+        writer = csv.writer(f)
+        if is_new:
+            writer.writerow(['round', 'config', 'instance', 'time_limit', 'objective', 'wall_time'])
+    try:
+        for round_id in range(num_rounds):
+            objectives = np.full((len(alive), len(instances)), np.nan)
+            wall_times = np.zeros((len(alive), len(instances)))
+            for row, c in enumerate(alive):
+                for col, instance in enumerate(instances):
+                    tic = time.time()
+                    objective = run(configs[c], instance, time_limit)
+                    wall_time = time.time() - tic
+                    wall_times[row, col] = wall_time
+                    if objective is not None:
+                        objectives[row, col] = objective
+                    history.append((round_id, c, instance, time_limit, objective, wall_time))
+                    if writer is not None:
+                        writer.writerow([round_id, config_name(configs[c]), instance,
+                                         time_limit, objective, wall_time])
+            best = np.nanmin(np.where(np.isnan(objectives), np.inf, objectives), axis=0)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                ratios = np.where(best > 0, objectives / best, 1.0 + (objectives - best))
+            ratios = np.where(np.isnan(ratios), NO_SOLUTION_SCORE, ratios)
+            scores = ratios.mean(axis=1)
+            # equal scores: the faster one first, e.g. the one proving optimality
+            order = np.lexsort((wall_times.mean(axis=1), scores))
+            for row in order:
+                log('round %d\t%f s\t%f\t%s' %(round_id, time_limit, scores[row],
+                                               config_name(configs[alive[row]])))
+            if len(alive) == 1:
+                break
+            alive = [alive[row] for row in order[:max(1, len(alive) // eta)]]
+            time_limit *= eta
+    finally:
+        if writer is not None:
+            f.close()
+    return configs[alive[0]], history
+
+def tune(problem_class, instances, run, time_limit, configs=None, eta=2, num_rounds=None,
+         results_file=None, profile_file=PROFILE_FILE, fixed=None):
+    # fixed: parameters every configuration gets, e.g. num_workers of the target machine
+    if configs is None:
+        configs = CANDIDATES[problem_class]
+    configs = [dict(fixed or {}, **params) for params in configs]
+    params, history = successive_halving(configs, instances, run, time_limit, eta=eta,
+                                         num_rounds=num_rounds, results_file=results_file)
+    save_profile(problem_class, params, profile_file)
+    print('%s profile: %s' %(problem_class, config_name(params)))
+    return params, history
+
+
+if __name__ == '__main__':
+    import sys
+    import random
+    root = os.path.dirname(os.path.abspath(__file__))
+    sys.path.append(os.path.join(root, 'JSP'))
+    sys.path.append(os.path.join(root, 'TSP'))
+    sys.path.append(os.path.join(root, 'FJSP'))
+    sys.path.append(os.path.join(root, 'AdvacneProcess'))
+    import jsp_2
+    import tsp_cp
+    import fjsp_demo
+    import advance_process_2
+
+    num_workers = 8
+    # training subset of the job shop instances
+    jsp_instance_dir = os.path.join(root, 'JSP', 'instances')
+    rng = random.Random(0)
+    instances = sorted(rng.sample(sorted(os.listdir(jsp_instance_dir)), 8))
+    tune('jsp', [os.path.join(jsp_instance_dir, fn) for fn in instances], jsp_2.tuning_run,
+         time_limit=5, results_file='tuning_jsp.csv', fixed={'num_workers': num_workers})
+
+    tsp_dir = os.path.join(root, 'TSP', 'ALL_tsp')
+    if os.path.isdir(tsp_dir):
+        instances = sorted(fn for fn in os.listdir(tsp_dir) if fn.endswith('.tsp'))
+        instances = sorted(rng.sample(instances, min(8, len(instances))))
+        tune('tsp', [os.path.join(tsp_dir, fn) for fn in instances], tsp_cp.tuning_run,
+             time_limit=5, results_file='tuning_tsp.csv', fixed={'num_workers': num_workers})
+
+    fjsp_dir = os.path.join(root, 'FJSP', 'instances')
+    if os.path.isdir(fjsp_dir):
+        instances = sorted(fn for fn in os.listdir(fjsp_dir) if fn.endswith('.fjs'))
+        instances = sorted(rng.sample(instances, min(8, len(instances))))
+        tune('fjsp', [os.path.join(fjsp_dir, fn) for fn in instances], fjsp_demo.tuning_run,
+             time_limit=5, results_file='tuning_fjsp.csv', fixed={'num_workers': num_workers})
+
+    block_dir = os.path.join(root, 'AdvacneProcess', 'block_data')
+    if os.path.isdir(block_dir):
+        instances = sorted(fn for fn in os.listdir(block_dir) if fn.endswith('.json'))
+        instances = sorted(rng.sample(instances, min(8, len(instances))))
+        tune('packing', [os.path.join(block_dir, fn) for fn in instances],
+             advance_process_2.tuning_run, time_limit=5, results_file='tuning_packing.csv',
+             fixed={'num_workers': num_workers})
@@ -0,0 +1,170 @@
+"""Per-phase wall time, CPU time and memory of the solver entry points.
+
+An entry point opens a profile for a run; code anywhere below it marks its
+phases with a context manager or a decorator:
+
+    with phase_profiler.profile('la16', log_file='phases.jsonl') as run:
+        with phase_profiler.phase('build'):
+            model = build_model(jobs_data)
+        with phase_profiler.phase('solve'):
+            status = solver.Solve(model)
+    run.print_summary()
+
+    @phase_profiler.profiled('parse')
+    def __init__(self, path): ...
+
+Without an open profile phase() and profiled() do nothing, so library code
+can be marked once and pay nothing outside profiled runs. Nested phases are
+named by their path ('solve/extract'). Each finished phase is one JSON line
+in log_file:
+
+    {"run": ..., "phase": ..., "start": ..., "wall": ..., "cpu": ...,
+     "rss_mb": ..., "peak_rss_mb": ..., "peak_growth_mb": ...}
+
+rss_mb is the resident set at the end of the phase. peak_rss_mb is the
+high water mark of the whole process so far, whatever ran in it before the
+phase (earlier phases and runs, other threads); peak_growth_mb, how much
+the phase raised it, is the per-phase figure. Worker processes should be
+spawned, not forked: a forked child starts with the peak of its parent.
+summary() / print_summary() sum the phases of one or more runs (load()
+reads a log back). The whole run is one more record, named by total_phase
+('total'); a run around other runs, such as a batch around its instances,
+takes another name so that the two are not summed together.
+"""
+import os
+import json
+import time
+import resource
+import functools
+import contextlib
+import collections
+
+# the open profiles, innermost last
+_active = []
+
+def peak_rss_mb():
+    # VmHWM is the peak of this process' own address space; ru_maxrss is
+    # carried over fork and even exec, it would report the parent's peak
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024.0
+    except (IOError, OSError):
+        pass
+    # ru_maxrss is in KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+def _rss_mb():
+    # resident set size now, None where /proc is not there
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024.0 * 1024.0)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+class Profile(object):
+    def __init__(self, run_id, log_file=None):
+        self.run_id = run_id
+        self.log_file = log_file
+        self.records = []
+        self._stack = []
+        self._tic = time.time()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        self._stack.append(name)
+        path = '/'.join(self._stack)
+        try:
+            with self._measure(path):
+                yield
+        finally:
+            self._stack.pop()
+
+    @contextlib.contextmanager
+    def _measure(self, path):
+        peak_before = peak_rss_mb()
+        start = time.time()
+        cpu = time.process_time()
+        try:
+            yield
+        finally:
+            peak = peak_rss_mb()
+            self._write(collections.OrderedDict([
+                ('run', self.run_id),
+                ('phase', path),
+                ('start', start - self._tic),
+                ('wall', time.time() - start),
+                ('cpu', time.process_time() - cpu),
+                ('rss_mb', _rss_mb()),
+                ('peak_rss_mb', peak),
+                ('peak_growth_mb', peak - peak_before),
+            ]))
+
+    def _write(self, record):
+        self.records.append(record)
+        if self.log_file is not None:
+            with open(self.log_file, 'a') as f:
+                f.write(json.dumps(record) + '\n')
+
+    def summary(self):
+        return summary(self.records)
+
+    def print_summary(self):
+        print_summary(self.records)
+
+
+@contextlib.contextmanager
+def profile(run_id, log_file=None, total_phase='total'):
+    # the phases marked anywhere below belong to this run
+    run = Profile(run_id, log_file)
+    _active.append(run)
+    try:
+        # the whole run, not a parent of the phases
+        with run._measure(total_phase):
+            yield run
+    finally:
+        _active.remove(run)
+
+def phase(name):
+    # a phase of the innermost open profile, nothing if there is none
+    if not _active:
+        return contextlib.nullcontext()
+    return _active[-1].phase(name)
+
+def profiled(name):
+    # decorator: every call of the function is a phase
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with phase(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def load(log_file):
+    with open(log_file, 'r') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def summary(records):
+    # per phase: calls, wall and cpu seconds in total, largest peak RSS and growth
+    phases = collections.OrderedDict()
+    for record in records:
+        row = phases.setdefault(record['phase'], {
+            'calls': 0, 'wall': 0.0, 'cpu': 0.0, 'peak_rss_mb': 0.0, 'peak_growth_mb': 0.0})
+        row['calls'] += 1
+        row['wall'] += record['wall']
+        row['cpu'] += record['cpu']
+        row['peak_rss_mb'] = max(row['peak_rss_mb'], record['peak_rss_mb'])
+        row['peak_growth_mb'] = max(row['peak_growth_mb'], record['peak_growth_mb'])
+    return phases
+
+def print_summary(records):
+    phases = summary(records)
+    print('phase\tcalls\twall s\tmean s\tcpu s\tpeak RSS MB\tgrowth MB')
+    # in the order the phases first ended, the total after its run
+    for name, row in phases.items():
+        print('%s\t%d\t%.3f\t%.3f\t%.3f\t%.1f\t%.1f' %(
+            name, row['calls'], row['wall'], row['wall'] / row['calls'], row['cpu'],
+            row['peak_rss_mb'], row['peak_growth_mb']))
@@ -0,0 +1,210 @@
+"""Race several formulations / parameter sets on one instance.
+
+Every member of a portfolio solves the instance in a process of its own:
+
+    members = [
+        member('jsp_2', jsp_2_run, {}, True),
+        member('jsp_2 lp', jsp_2_run, {'params': {'linearization_level': 2}}, True),
+        member('ban no-op', jsp_ban_noop_run, {}, False),
+    ]
+    best, reports = race(members, file_name, budget=60)
+
+The members share the best objective found so far (a shared double). A
+CP-SAT member stops on its own once its best bound cannot beat it any
+more; a member with exact=True (a formulation of the same problem, not a
+restriction of it such as ban no-op) that proves optimality, or whose bound
+reaches the shared objective, ends the race and the others are cancelled.
+Cancelled members stop their search and still report their incumbent;
+members still running after the budget plus a grace period are
+terminated. race() returns the best report and all of them, one per
+member:
+
+    report(name, objective, optimal, reason, wall_time, result)
+
+All members minimize the same objective: the JSP_MAKESPAN, JSP_TARDINESS
+and TSP portfolios below keep makespan, tardiness and tour length apart.
+"""
+import os
+import sys
+import time
+import queue
+import collections
+import multiprocessing
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(ROOT, 'JSP'))
+sys.path.append(os.path.join(ROOT, 'JSP', 'demo'))
+sys.path.append(os.path.join(ROOT, 'TSP'))
+import stop_policy
+
+CANCELLED = 'cancelled'
+DOMINATED = 'dominated'
+# run(instance, time_limit, stop, stats, **kwargs) -> result
+member = collections.namedtuple('member', 'name run kwargs exact')
+report = collections.namedtuple('report', 'name objective optimal reason wall_time result')
+
+
+class SharedIncumbent(stop_policy.StopPolicy):
+    """Stop policy of a member: publish solutions, stop when dominated or cancelled."""
+
+    def __init__(self, best, cancel, **rules):
+        stop_policy.StopPolicy.__init__(self, **rules)
+        self.shared_best = best
+        self.cancel = cancel
+
+    def on_solution_callback(self):
+        stop_policy.StopPolicy.on_solution_callback(self)
+        objective = self.ObjectiveValue()
+        with self.shared_best.get_lock():
+            if objective < self.shared_best.value:
+                self.shared_best.value = objective
+
+    def _uses_bound(self):
+        return True
+
+    def _uses_watchdog(self):
+        return True
+
+    def _check(self):
+        if self.cancel.is_set():
+            self._stop(CANCELLED)
+            return True
+        # this member cannot improve the best solution of the portfolio
+        if self.best_bound is not None and self.best_bound >= self.shared_best.value - 1e-6:
+            self._stop(DOMINATED)
+            return True
+        return stop_policy.StopPolicy._check(self)
+
+
+def _publish(best, objective):
+    with best.get_lock():
+        if objective < best.value:
+            best.value = objective
+
+def _run_member(index, m, instance, time_limit, best, cancel, results):
+    tic = time.time()
+    stats = {}
+    policy = SharedIncumbent(best, cancel)
+    try:
+        result = m.run(instance, time_limit, policy, stats, **m.kwargs)
+    except Exception as e:
+        results.put((index, report(m.name, None, False, 'error %r' %(e), time.time() - tic, None)))
+        return
+    objective = stats.get('objective')
+    if objective is not None:
+        # members without a CP-SAT callback publish at the end
+        _publish(best, objective)
+    reason = stats.get('stop_reason', policy.reason)
+    results.put((index, report(m.name, objective, bool(stats.get('optimal')), reason,
+                               time.time() - tic, result)))
+
+def _proven_value(m, r, best):
+    # the objective an exact member proved optimal, None if it proved nothing
+    if not m.exact:
+        return None
+    if r.optimal:
+        return r.objective
+    if r.reason == DOMINATED:
+        # its bound reached the best objective of the portfolio
+        return best.value
+    return None
+
+def race(members, instance, budget, grace=2.0, log=print):
+    ctx = multiprocessing.get_context()
+    best = ctx.Value('d', float('inf'))
+    cancel = ctx.Event()
+    results = ctx.Queue()
+    processes = [ctx.Process(target=_run_member,
+                             args=(i, m, instance, budget, best, cancel, results), daemon=True)
+                 for i, m in enumerate(members)]
+    tic = time.time()
+    for process in processes:
+        process.start()
+
+    reports = [None] * len(members)
+    proven = None
+    deadline = tic + budget + grace
+    while any(r is None for r in reports) and time.time() < deadline:
+        try:
+            i, r = results.get(timeout=0.1)
+        except queue.Empty:
+            continue
+        reports[i] = r
+        log('%s\t%s\t%r\t%s\t%.2f' %(r.name, r.objective, r.optimal, r.reason, time.time() - tic))
+        value = _proven_value(members[i], r, best)
+        if value is not None and proven is None:
+            proven = value
+            log('%s proved optimality, cancelling the others' %(r.name))
+            cancel.set()
+            deadline = min(deadline, time.time() + grace)
+    cancel.set()
+    for i, process in enumerate(processes):
+        if reports[i] is None:
+            process.terminate()
+            reports[i] = report(members[i].name, None, False, 'terminated',
+                                time.time() - tic, None)
+        process.join()
+
+    solved = [r for r in reports if r.objective is not None]
+    winner = min(solved, key=lambda r: (r.objective, not r.optimal)) if solved else None
+    # the proof of one member holds for the solution of another
+    if winner is not None and proven is not None and winner.objective <= proven + 1e-6:
+        winner = winner._replace(optimal=True)
+    return winner, reports
+
+
+### members
+
+def jsp_2_run(file_name, time_limit, stop, stats, **kwargs):
+    import jsp_2
+    return jsp_2.solve(file_name, time_limit=time_limit, stop=stop, stats=stats, **kwargs)
+
+def jsp_ban_noop_run(file_name, time_limit, stop, stats, **kwargs):
+    import jsp_ban_noop
+    return jsp_ban_noop.solve(file_name, time_limit=time_limit, stop=stop, stats=stats, **kwargs)
+
+def tardiness_run(instance, time_limit, stop, stats, **kwargs):
+    # instance: (file_name, due dates)
+    import minimize_tardiness
+    file_name, jobs_due = instance
+    return minimize_tardiness.solve(file_name, jobs_due, time_limit=time_limit, stop=stop,
+                                    stats=stats, **kwargs)
+
+def tsp_cp_run(tsp_path, time_limit, stop, stats, **kwargs):
+    import tsp_cp
+    return tsp_cp.solve(tsp_path, time_limit=time_limit, stop=stop, stats=stats, **kwargs)
+
+def tsp_routing_run(tsp_path, time_limit, stop, stats, **kwargs):
+    # the routing library has no CP-SAT callback, it is cut off by the budget
+    import example_1
+    from loader import Loader
+    return example_1.solve(Loader(tsp_path).get_weight_matrix(), time_limit, stats)
+
+JSP_MAKESPAN = [
+    member('jsp_2', jsp_2_run, {'num_workers': 1, 'hint_rule': 'MWKR'}, True),
+    member('jsp_2 lp', jsp_2_run, {'num_workers': 1, 'params': {'linearization_level': 2}}, True),
+    member('jsp_2 loose', jsp_2_run, {'num_workers': 1, 'tighten': False, 'seed': 1}, True),
+    # no machine idles between its jobs: a restriction, its optimum proves nothing
+    member('ban no-op', jsp_ban_noop_run, {'num_workers': 1}, False),
+]
+JSP_TARDINESS = [
+    member('tardiness EDD', tardiness_run, {'hint_rule': 'EDD', 'params': {'num_workers': 1}}, True),
+    member('tardiness', tardiness_run, {'params': {'num_workers': 1, 'random_seed': 1}}, True),
+    member('tardiness loose', tardiness_run,
+           {'hint_rule': 'EDD', 'tighten': False, 'params': {'num_workers': 1, 'random_seed': 2}}, True),
+]
+TSP = [
+    member('tsp_cp', tsp_cp_run, {'num_thread': 1}, True),
+    member('tsp_cp sparse', tsp_cp_run, {'num_thread': 1, 'num_neighbors': 10}, False),
+    member('routing', tsp_routing_run, {}, False),
+]
+
+
+if __name__ == '__main__':
+    file_name = os.path.join(ROOT, 'JSP', 'instances', 'la21')
+    budget = 60
+    best, reports = race(JSP_MAKESPAN, file_name, budget)
+    print('best: %s %s optimal %r' %(best.name, best.objective, best.optimal))
+
+    ### tour length
+    # best, reports = race(TSP, os.path.join(ROOT, 'TSP', 'ALL_tsp', 'berlin52.tsp'), budget)
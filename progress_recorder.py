@@ -0,0 +1,129 @@
+"""Solution-progress recording for CP-SAT runs.
+
+ProgressRecorder is a CpSolverSolutionCallback that appends one CSV row per
+improving solution:
+
+    run_id, solution, wall_time, objective, best_bound, conflicts, branches
+
+A solution is improving if its objective is strictly closer to the best
+bound than the last recorded one, which holds for minimization and
+maximization alike. A satisfaction model (objective and bound 0) thus gets
+one row; improving_only=False records every solution, e.g. the ones
+enumerated with enumerate_all_solutions. record(callback) reads the solution
+from another live callback, that is how a StopPolicy passes solutions on
+(stop_policy.solve(solver, model, policy, recorder)); subclasses that print
+solutions override record() rather than on_solution_callback().
+
+Rows of many runs (different instances, seeds, parameters) can share one
+file. load_runs() reads it back as NumPy arrays per run, anytime_curve()
+turns the runs into incumbent-over-time curves and suggest_time_limit()
+picks the time after which the runs hardly improve any more.
+"""
+import os
+import csv
+import time
+import numpy as np
+from ortools.sat.python import cp_model
+
+FIELDS = ('run_id', 'solution', 'wall_time', 'objective', 'best_bound',
+          'conflicts', 'branches')
+
+def new_run_id(name=''):
+    return '%s%s%d-%d' %(name, '-' if name else '', int(time.time() * 1000), os.getpid())
+
+
+class ProgressRecorder(cp_model.CpSolverSolutionCallback):
+    """Append (wall time, objective, best bound, conflicts, branches) rows."""
+
+    def __init__(self, progress_file=None, run_id=None, improving_only=True):
+        cp_model.CpSolverSolutionCallback.__init__(self)
+        self.progress_file = progress_file
+        self.run_id = run_id if run_id is not None else new_run_id()
+        self.improving_only = improving_only
+        self.__row_count = 0
+        self.__last_objective = None
+        self.__file = None
+        self.__writer = None
+        if progress_file is not None:
+            is_new = not os.path.exists(progress_file) or os.path.getsize(progress_file) == 0
+            # line buffered, each row reaches the file even if the run is killed
+            self.__file = open(progress_file, 'a', newline='', buffering=1)
+            self.__writer = csv.writer(self.__file)
+            if is_new:
+                self.__writer.writerow(FIELDS)
+
+    def on_solution_callback(self):
+        self.record(self)
+
+    def record(self, callback):
+        # callback: the solution callback of the running solve, self or a StopPolicy
+        objective = callback.ObjectiveValue()
+        bound = callback.BestObjectiveBound()
+        if self.improving_only and self.__last_objective is not None and \
+                abs(objective - bound) >= abs(self.__last_objective - bound):
+            return
+        self.__last_objective = objective
+        if self.__writer is not None:
+            self.__writer.writerow((
+                self.run_id, self.__row_count, '%.6f' % callback.WallTime(),
+                objective, bound, callback.NumConflicts(), callback.NumBranches()))
+        self.__row_count += 1
+
+    def close(self):
+        if self.__file is not None:
+            self.__file.close()
+            self.__file = None
+            self.__writer = None
+
+
+def load_runs(progress_file, run_ids=None):
+    # {run_id: {field: np.array}}, rows in the order they were written
+    rows = {}
+    with open(progress_file, newline='') as f:
+        for row in csv.DictReader(f):
+            if row['run_id'] == 'run_id':
+                continue
+            if run_ids is not None and row['run_id'] not in run_ids:
+                continue
+            rows.setdefault(row['run_id'], []).append(row)
+    runs = {}
+    for run_id, run_rows in rows.items():
+        runs[run_id] = {
+            field: np.array([float(row[field]) for row in run_rows])
+            for field in FIELDS[1:]
+        }
+    return runs
+
+def anytime_curve(runs, times, minimize=True):
+    # incumbent objective of every run at every time, nan before its first
+    # solution; rows are runs (sorted by run_id), columns are times
+    times = np.asarray(times, dtype=np.float64)
+    run_ids = sorted(runs)
+    curves = np.full((len(run_ids), len(times)), np.nan)
+    for i, run_id in enumerate(run_ids):
+        run = runs[run_id]
+        order = np.argsort(run['wall_time'], kind='stable')
+        wall_time = run['wall_time'][order]
+        objective = run['objective'][order]
+        best = np.minimum.accumulate(objective) if minimize else np.maximum.accumulate(objective)
+        index = np.searchsorted(wall_time, times, side='right') - 1
+        found = index >= 0
+        curves[i, found] = best[index[found]]
+    return run_ids, curves
+
+def relative_gaps(runs, times, minimize=True):
+    # gap of each incumbent to the best objective the same run reached,
+    # 1.0 before the first solution
+    run_ids, curves = anytime_curve(runs, times, minimize)
+    final = curves[:, -1:] if len(times) else curves
+    gaps = np.abs(curves - final) / np.maximum(np.abs(final), 1e-9)
+    return run_ids, np.where(np.isnan(gaps), 1.0, gaps)
+
+def suggest_time_limit(runs, tolerance=0.01, quantile=0.9, minimize=True, num_points=200):
+    # smallest time at which `quantile` of the runs are within `tolerance`
+    # of the objective they end with
+    max_time = max(run['wall_time'].max() for run in runs.values())
+    times = np.linspace(0.0, max_time, num_points)
+    _, gaps = relative_gaps(runs, times, minimize)
+    good = np.mean(gaps <= tolerance, axis=0) >= quantile
+    return float(times[np.argmax(good)]) if good.any() else float(max_time)
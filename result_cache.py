@@ -0,0 +1,184 @@
+"""On-disk memo of solve results.
+
+A batch that is run again solves the same instances with the same settings
+again. Each result (objective, optimality and the solution the caller
+needs to rebuild its schedule or tour, as JSON) is stored under a key made
+of the instance hash, the model variant, the solver parameters, the time
+limit and the seed:
+
+    cache = result_cache.ResultCache('result_cache', max_bytes=1 << 28)
+    instance = cache.instance_hash(file_name)
+    entry = cache.get(instance, 'jsp_2', params, time_limit, seed)
+    if entry is None:
+        warm = cache.warm_start(instance, 'jsp_2', time_limit)
+        ...
+        cache.put(instance, 'jsp_2', params, time_limit, seed, objective, optimal, solution)
+
+get() prefers an optimal result of the same instance and variant, found
+with any settings, to the entry of the exact settings: nothing can beat it. warm_start() returns the
+best result of the instance and variant found with a shorter time limit,
+to hint the longer solve. Entries are files <group>_<key>.json, the group
+being the hash of (instance, variant); hits touch them and after every put
+the least recently used entries are removed until the directory holds at
+most max_bytes. invalidate() drops the entries of an instance / variant,
+e.g. after the formulation changed.
+"""
+import os
+import json
+import time
+import hashlib
+import numpy as np
+
+import model_cache
+
+def _hash(value):
+    return hashlib.sha1(json.dumps(value, sort_keys=True).encode()).hexdigest()
+
+def array_hash(*arrays):
+    # instances generated in memory (random coordinates, matrices)
+    sha1 = hashlib.sha1()
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        sha1.update(str((array.dtype.str, array.shape)).encode())
+        sha1.update(array.tobytes())
+    return sha1.hexdigest()
+
+def group_key(instance, variant):
+    return _hash([instance, variant])
+
+def result_key(instance, variant, params, time_limit, seed=None):
+    return _hash([instance, variant, params or {}, time_limit, seed])
+
+
+class ResultCache(object):
+    def __init__(self, cache_dir, max_bytes=1 << 28):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+    def instance_hash(self, file_name):
+        # the content of the instance file, not its path
+        return model_cache.instance_hash(file_name)
+
+    def array_hash(self, *arrays):
+        return array_hash(*arrays)
+
+    def _path(self, group, key):
+        return os.path.join(self.cache_dir, '%s_%s.json' %(group, key))
+
+    def _load(self, path):
+        try:
+            with open(path, 'r') as f:
+                entry = json.load(f)
+        except (IOError, OSError, ValueError):
+            # removed meanwhile or a broken file
+            return None
+        now = time.time()
+        os.utime(path, (now, now))
+        return entry
+
+    def _group(self, group):
+        prefix = group + '_'
+        return [os.path.join(self.cache_dir, fn) for fn in sorted(os.listdir(self.cache_dir))
+                if fn.startswith(prefix) and fn.endswith('.json')]
+
+    def get(self, instance, variant, params, time_limit, seed=None):
+        # the stored entry dict, or None if the solve has to run
+        group = group_key(instance, variant)
+        # a proven optimum first, the same settings may have stopped short of it
+        entry = None
+        for path in self._group(group):
+            candidate = self._load(path)
+            if candidate is not None and candidate['optimal']:
+                entry = candidate
+                break
+        if entry is None:
+            path = self._path(group, result_key(instance, variant, params, time_limit, seed))
+            entry = self._load(path) if os.path.exists(path) else None
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def warm_start(self, instance, variant, time_limit):
+        # best entry found with a shorter time limit, None if there is none
+        best = None
+        for path in self._group(group_key(instance, variant)):
+            entry = self._load(path)
+            if entry is None or entry['time_limit'] >= time_limit:
+                continue
+            if best is None or entry['objective'] < best['objective']:
+                best = entry
+        return best
+
+    def put(self, instance, variant, params, time_limit, seed, objective, optimal, solution):
+        # solution: anything JSON can hold, in the layout of the caller
+        entry = {
+            'instance': instance,
+            'variant': variant,
+            'params': params or {},
+            'time_limit': time_limit,
+            'seed': seed,
+            'objective': objective,
+            'optimal': bool(optimal),
+            'solution': solution,
+            'created': time.time(),
+        }
+        path = self._path(group_key(instance, variant),
+                          result_key(instance, variant, params, time_limit, seed))
+        with open(path + '.tmp', 'w') as f:
+            json.dump(entry, f)
+        os.replace(path + '.tmp', path)
+        self.evict(keep=path)
+        return entry
+
+    def entries(self):
+        # (last use, bytes, path), least recently used first
+        entries = []
+        for fn in os.listdir(self.cache_dir):
+            if not fn.endswith('.json'):
+                continue
+            path = os.path.join(self.cache_dir, fn)
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return sorted(entries)
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self, keep=None):
+        # keep: the entry just written, never evicted even if over the limit
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            os.remove(path)
+            total -= size
+
+    def invalidate(self, instance=None, variant=None):
+        # entries of the instance and / or variant, all of them if both are None
+        if instance is not None and variant is not None:
+            paths = self._group(group_key(instance, variant))
+        else:
+            paths = []
+            for _, _, path in self.entries():
+                with open(path, 'r') as f:
+                    entry = json.load(f)
+                if instance is not None and entry['instance'] != instance:
+                    continue
+                if variant is not None and entry['variant'] != variant:
+                    continue
+                paths.append(path)
+        for path in paths:
+            os.remove(path)
+        return len(paths)
+
+    def clear(self):
+        return self.invalidate()
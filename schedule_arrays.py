@@ -0,0 +1,132 @@
+"""Schedules as NumPy arrays instead of lists of op_info dicts.
+
+A Schedule keeps one array per field (job, op, machine, start, duration,
+finish) with the operations sorted by machine and then by start time, so
+that the operations of a machine are a contiguous slice; the operations of
+a job are reached through a precomputed permutation. to_op_infos() and
+save_json() give the op_info dicts the solvers used to return and the
+loggers / plotters read.
+"""
+import json
+import numpy as np
+
+FIELDS = ('job', 'op', 'machine', 'start', 'duration', 'finish')
+
+# op_info key of every field
+OP_INFO_KEYS = {
+    'job':      'job_id',
+    'op':       'op_id',
+    'machine':  'machine_id',
+    'start':    'start_time',
+    'duration': 'process_time',
+    'finish':   'finish_time',
+}
+
+def _ptr(sorted_keys, num_keys):
+    # offsets of each key in a sorted key array, CSR style
+    return np.searchsorted(sorted_keys, np.arange(num_keys + 1), side='left')
+
+
+class Schedule(object):
+    def __init__(self, job, op, machine, start, duration, finish=None):
+        job = np.asarray(job, dtype=np.int64)
+        op = np.asarray(op, dtype=np.int64)
+        machine = np.asarray(machine, dtype=np.int64)
+        start = np.asarray(start)
+        duration = np.asarray(duration)
+        if finish is None:
+            finish = start + duration
+        finish = np.asarray(finish)
+
+        order = np.lexsort((op, job, start, machine))
+        self.job = job[order]
+        self.op = op[order]
+        self.machine = machine[order]
+        self.start = start[order]
+        self.duration = duration[order]
+        self.finish = finish[order]
+
+        num_machines = int(self.machine.max()) + 1 if len(order) else 0
+        num_jobs = int(self.job.max()) + 1 if len(order) else 0
+        self._machine_ptr = _ptr(self.machine, num_machines)
+        self._job_order = np.lexsort((self.op, self.job))
+        self._job_ptr = _ptr(self.job[self._job_order], num_jobs)
+
+    @classmethod
+    def from_op_infos(cls, op_infos):
+        op_infos = [op_info for op_info in op_infos if op_info.get('job_type') != 'NOOP']
+        return cls(*[[op_info[OP_INFO_KEYS[field]] for op_info in op_infos]
+                     for field in FIELDS])
+
+    @classmethod
+    def from_json(cls, json_in_file):
+        with open(json_in_file, 'r') as f:
+            return cls.from_op_infos(json.load(f))
+
+    def __len__(self):
+        return len(self.job)
+
+    @property
+    def num_machines(self):
+        return len(self._machine_ptr) - 1
+
+    @property
+    def num_jobs(self):
+        return len(self._job_ptr) - 1
+
+    @property
+    def makespan(self):
+        return self.finish.max() if len(self) else 0
+
+    def machine_rows(self, machine_id):
+        # slice of the operations on machine_id, in start order
+        if machine_id >= self.num_machines:
+            return slice(0, 0)
+        return slice(self._machine_ptr[machine_id], self._machine_ptr[machine_id + 1])
+
+    def job_rows(self, job_id):
+        # row indices of the operations of job_id, in op order
+        if job_id >= self.num_jobs:
+            return self._job_order[:0]
+        return self._job_order[self._job_ptr[job_id]:self._job_ptr[job_id + 1]]
+
+    def on_machine(self, machine_id):
+        rows = self.machine_rows(machine_id)
+        return {field: getattr(self, field)[rows] for field in FIELDS}
+
+    def of_job(self, job_id):
+        rows = self.job_rows(job_id)
+        return {field: getattr(self, field)[rows] for field in FIELDS}
+
+    def idle_windows(self, machine_id):
+        # [start, end) gaps between consecutive operations on machine_id
+        rows = self.machine_rows(machine_id)
+        starts, finishes = self.start[rows], self.finish[rows]
+        busy_until = np.maximum.accumulate(finishes[:-1]) if len(finishes) > 1 else finishes[:0]
+        gaps = starts[1:] > busy_until
+        return np.stack([busy_until[gaps], starts[1:][gaps]], axis=1)
+
+    def to_dataframe(self):
+        # the columns share memory with the arrays
+        import pandas as pd
+        return pd.DataFrame({field: getattr(self, field) for field in FIELDS}, copy=False)
+
+    def to_op_infos(self):
+        columns = [getattr(self, field).tolist() for field in FIELDS]
+        return [
+            {
+                'Order':        None,
+                'job_id':       job,
+                'op_id':        op,
+                'machine_id':   machine,
+                'start_time':   start,
+                'process_time': duration,
+                'finish_time':  finish,
+                'job_type':     None,
+            }
+            for job, op, machine, start, duration, finish in zip(*columns)
+        ]
+
+    def save_json(self, json_out_file):
+        with open(json_out_file, 'w') as f:
+            json.dump(self.to_op_infos(), f, indent=4)
@@ -0,0 +1,198 @@
+"""Early termination of long CP-SAT runs.
+
+A StopPolicy is the solution callback of a solve and stops the search
+(StopSearch) as soon as one of its rules holds:
+
+- relative_gap: |objective - best bound| / max(1, |objective|) at most this,
+  checked at every solution and every bound improvement
+- stall_time: no better solution for that many seconds since the last one
+  (counted from the first solution, the time limit covers the rest)
+- target: a solution at least as good as this objective
+
+After the solve, reason says why it ended: one of the rules (GAP, STALL,
+TARGET) or the solver status (OPTIMAL, INFEASIBLE, or LIMIT for the time
+limit and other limits):
+
+    policy = stop_policy.StopPolicy(relative_gap=0.01, stall_time=60)
+    status = stop_policy.solve(solver, model, policy)
+    print(policy.reason)
+
+The wall time and objective of every improving solution are kept as well,
+since a policy takes the only callback slot of the solve. Anything else that
+wants to see the solutions is passed on as on_solution, a function called
+with the policy (the live solution callback: Value(), ObjectiveValue(),
+WallTime() ...) at every solution. ProgressRecorder and benchmark's
+SolutionTrace have such a record(callback) method, and solve() takes them
+as callback next to a policy:
+
+    recorder = progress_recorder.ProgressRecorder('progress.csv')
+    status = stop_policy.solve(solver, model, policy, recorder)
+"""
+import time
+import threading
+from ortools.sat.python import cp_model
+
+GAP = 'gap'
+STALL = 'stall'
+TARGET = 'target'
+OPTIMAL = 'optimal'
+INFEASIBLE = 'infeasible'
+LIMIT = 'limit'
+
+# how often the stall watchdog looks at the clock, in seconds
+POLL_INTERVAL = 0.1
+
+
+def _maximize(model):
+    # Maximize() is stored as a minimization with a negative scaling factor;
+    # reading a missing objective field would add an empty one to the proto
+    proto = model.Proto()
+    if hasattr(proto, 'has_objective'):
+        has_objective = proto.has_objective()
+        has_floating_point_objective = proto.has_floating_point_objective()
+    else:
+        # CpModelProto as a Python protobuf message
+        has_objective = proto.HasField('objective')
+        has_floating_point_objective = proto.HasField('floating_point_objective')
+    if has_objective:
+        return proto.objective.scaling_factor < 0
+    if has_floating_point_objective:
+        return proto.floating_point_objective.maximize
+    return False
+
+
+class StopPolicy(cp_model.CpSolverSolutionCallback):
+    """Stop on relative gap, stall or target objective and record why."""
+
+    def __init__(self, relative_gap=None, stall_time=None, target=None, on_solution=None):
+        cp_model.CpSolverSolutionCallback.__init__(self)
+        self.relative_gap = relative_gap
+        self.stall_time = stall_time
+        self.target = target
+        self.on_solution = on_solution
+        self._reset()
+
+    def _reset(self):
+        self.reason = None
+        self.wall_times = []
+        self.objectives = []
+        self.best_bound = None
+        self.__solver = None
+        self.__maximize = False
+        self.__last_improvement = None
+        self.__lock = threading.Lock()
+
+    def _better(self, a, b):
+        return a > b if self.__maximize else a < b
+
+    def _gap(self, objective, bound):
+        return abs(objective - bound) / max(1.0, abs(objective))
+
+    def _stop(self, reason):
+        # the first rule that fires is the reason
+        with self.__lock:
+            if self.reason is None:
+                self.reason = reason
+        self.__solver.StopSearch()
+
+    def on_solution_callback(self):
+        if self.on_solution is not None:
+            self.on_solution(self)
+        objective = self.ObjectiveValue()
+        if self.objectives and not self._better(objective, self.objectives[-1]):
+            return
+        self.wall_times.append(self.WallTime())
+        self.objectives.append(objective)
+        self.__last_improvement = time.time()
+        if self.target is not None and not self._better(self.target, objective):
+            self._stop(TARGET)
+        elif self.relative_gap is not None and \
+                self._gap(objective, self.BestObjectiveBound()) <= self.relative_gap:
+            self._stop(GAP)
+
+    def _on_bound(self, bound):
+        self.best_bound = bound
+        if self.relative_gap is not None and self.objectives and \
+                self._gap(self.objectives[-1], bound) <= self.relative_gap:
+            self._stop(GAP)
+
+    # subclasses with rules of their own extend these three
+    def _uses_bound(self):
+        return self.relative_gap is not None
+
+    def _uses_watchdog(self):
+        return self.stall_time is not None
+
+    def _check(self):
+        # called by the watchdog every POLL_INTERVAL, True once stopped
+        last = self.__last_improvement
+        if self.stall_time is not None and last is not None and \
+                time.time() - last >= self.stall_time:
+            self._stop(STALL)
+            return True
+        return False
+
+    def _watch(self, done):
+        while not done.wait(POLL_INTERVAL):
+            if self._check():
+                return
+
+    def solve(self, solver, model):
+        self._reset()
+        self.__solver = solver
+        self.__maximize = _maximize(model)
+        previous_bound_callback = solver.best_bound_callback
+        if self._uses_bound():
+            solver.best_bound_callback = self._on_bound
+        done = threading.Event()
+        watchdog = None
+        if self._uses_watchdog():
+            watchdog = threading.Thread(target=self._watch, args=(done,), daemon=True)
+            watchdog.start()
+        try:
+            status = solver.Solve(model, self)
+        finally:
+            done.set()
+            if watchdog is not None:
+                watchdog.join()
+            solver.best_bound_callback = previous_bound_callback
+        if status == cp_model.OPTIMAL:
+            self.reason = OPTIMAL
+        elif status == cp_model.INFEASIBLE:
+            self.reason = INFEASIBLE
+        elif self.reason is None:
+            self.reason = LIMIT
+        return status
+
+
+def on_solution(callback):
+    # the hook a policy passes solutions to: callback.record (ProgressRecorder,
+    # SolutionTrace) or a function of the live solution callback
+    hook = getattr(callback, 'record', callback)
+    if isinstance(hook, cp_model.CpSolverSolutionCallback) or not callable(hook):
+        raise ValueError('a callback next to a stop policy needs a record(callback) method')
+    return hook
+
+def solve(solver, model, policy=None, callback=None):
+    # solver.Solve(model, callback), under the policy if there is one; the
+    # policy is then the solution callback and passes solutions on to callback
+    if policy is None:
+        return solver.Solve(model, callback)
+    if callback is None:
+        return policy.solve(solver, model)
+    previous = policy.on_solution
+    policy.on_solution = on_solution(callback)
+    try:
+        return policy.solve(solver, model)
+    finally:
+        policy.on_solution = previous
+
+def reason(policy, status):
+    # stop reason of a solve with or without policy
+    if policy is not None:
+        return policy.reason
+    if status == cp_model.OPTIMAL:
+        return OPTIMAL
+    if status == cp_model.INFEASIBLE:
+        return INFEASIBLE
+    return LIMIT
@@ -0,0 +1,88 @@
+"""Operation time windows for the scheduling models.
+
+The models used to give every start and end variable the domain
+[0, horizon], with horizon the sum of all (longest) durations. Here the
+windows are narrowed before the model is built:
+
+- head of an operation: shortest work of the operations before it in its job
+- tail of an operation: shortest work of the operations after it
+- lower bound: longest job, most loaded machine, total work / machines
+- upper bound: best makespan of the dispatching rules (dispatch_hint)
+
+An operation then starts in [head, upper_bound - tail - duration]. With a
+makespan objective an optimal schedule stays inside the windows, as its
+makespan is at most the upper bound. For other regular objectives
+(tardiness) pass upper_bound=horizon: some optimal schedule is semi-active
+and ends by then.
+
+Jobs are in the alternatives format of dispatch_hint; the arrays are
+(num_jobs, max_ops) with zeros after the last operation of a job.
+"""
+import collections
+import numpy as np
+
+import dispatch_hint
+
+time_windows = collections.namedtuple(
+    'time_windows', 'earliest_start latest_finish min_durations lower_bound upper_bound '
+                    'horizon schedule')
+
+def compute(jobs, upper_bound=None, rules=('SPT', 'MWKR')):
+    num_jobs = len(jobs)
+    max_ops = max(len(job) for job in jobs)
+    min_durations = np.zeros((num_jobs, max_ops), dtype=np.int64)
+    max_durations = np.zeros((num_jobs, max_ops), dtype=np.int64)
+    single_machine = np.full((num_jobs, max_ops), -1, dtype=np.int64)
+    for job_id, job in enumerate(jobs):
+        for op_id, op in enumerate(job):
+            min_durations[job_id, op_id] = min(duration for duration, _ in op)
+            max_durations[job_id, op_id] = max(duration for duration, _ in op)
+            if len(op) == 1:
+                single_machine[job_id, op_id] = op[0][1]
+    horizon = int(max_durations.sum())
+
+    work = np.cumsum(min_durations, axis=1)
+    heads = work - min_durations
+    tails = work[:, -1:] - work
+
+    num_machines = 1 + max(machine for job in jobs for op in job for _, machine in op)
+    fixed = single_machine >= 0
+    loads = np.bincount(single_machine[fixed], weights=min_durations[fixed], minlength=num_machines)
+    lower_bound = int(max(work[:, -1].max(), loads.max(),
+                          np.ceil(min_durations.sum() / num_machines)))
+
+    schedule = None
+    if upper_bound is None:
+        for rule in rules:
+            candidate = dispatch_hint.dispatch(jobs, rule)
+            if schedule is None or candidate.makespan < schedule.makespan:
+                schedule = candidate
+        upper_bound = schedule.makespan
+    upper_bound = int(upper_bound)
+    return time_windows(heads, upper_bound - tails, min_durations, min(lower_bound, upper_bound),
+                        upper_bound, horizon, schedule)
+
+def start_domain(windows, job_id, op_id):
+    return (int(windows.earliest_start[job_id, op_id]),
+            int(windows.latest_finish[job_id, op_id] - windows.min_durations[job_id, op_id]))
+
+def end_domain(windows, job_id, op_id):
+    return (int(windows.earliest_start[job_id, op_id] + windows.min_durations[job_id, op_id]),
+            int(windows.latest_finish[job_id, op_id]))
+
+def domain_shrink(windows, jobs):
+    # share of the [0, horizon] start values that are cut off
+    old = new = 0
+    for job_id, job in enumerate(jobs):
+        for op_id in range(len(job)):
+            low, high = start_domain(windows, job_id, op_id)
+            old += windows.horizon + 1
+            new += high - low + 1
+    return 1.0 - new / old
+
+def fit_hint(windows, schedule):
+    # a hint ending after the upper bound lies outside the windows, the
+    # dispatching schedule of the bound is hinted instead
+    if windows is None or windows.schedule is None or schedule.makespan <= windows.upper_bound:
+        return schedule
+    return windows.schedule